@@ -0,0 +1,290 @@
+"""
+Several Lovable accounts, scheduled least-loaded with per-account caps.
+
+When MCP_AUTH_STATE_DIR is set, every ``*.json`` storage state in it is one
+account with its own AuthStateStore (watched and hot-swapped like the single
+MCP_AUTH_STATE_PATH). Each run is assigned the usable account with the fewest
+runs in flight, and waits when every account is at its concurrency cap. An
+account whose session expired is skipped; one that keeps failing (or reports
+AUTH_EXPIRED) is quarantined for a while so runs go to the healthy accounts.
+With a shared job backend the caps hold across the gateway processes on the
+host: a run also needs an account lease from the backend, which the other
+processes' runs count against. With
+worker processes the gateway picks the account and the worker runs as the one
+named in the run's config, so caps and quarantine are kept in one place.
+"""
+
+import asyncio
+import glob
+import os
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+import structlog
+
+from src.auth_state import AuthStateStore
+from src.errors import AuthExpired, ErrorCode
+from src.job_queue import JobBackend, claim_lease_sec, default_node_id, get_job_backend
+from src.run_config import RunConfig
+from src.settings import get_settings
+
+logger = structlog.get_logger(__name__)
+
+# Failures that say something about the account (rate limits, blocked builds);
+# UI changes, timeouts and configuration errors hit every account alike.
+ACCOUNT_FAILURE_CODES = frozenset({ErrorCode.NETWORK_ERROR.value, ErrorCode.UNKNOWN_ERROR.value})
+
+# Other nodes release leases without notifying this one, so waiters poll the backend.
+LEASE_POLL_SEC = 1.0
+
+
+@dataclass
+class Account:
+    """One Lovable account and its scheduling state."""
+
+    name: str
+    store: AuthStateStore
+    max_concurrency: int = 1
+    in_flight: int = 0
+    runs: int = 0
+    failures: int = 0
+    consecutive_failures: int = 0
+    quarantined_until: float = 0.0
+    last_error_code: Optional[str] = None
+
+    def quarantined(self, now: float) -> bool:
+        return now < self.quarantined_until
+
+    def expired(self) -> bool:
+        return self.store.preflight_enabled and self.store.status() == "expired"
+
+    def stats(self, now: float) -> dict[str, Any]:
+        return {
+            "status": self.store.status(),
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "runs": self.runs,
+            "failures": self.failures,
+            "quarantined_for_sec": round(max(0.0, self.quarantined_until - now), 1),
+            "last_error_code": self.last_error_code,
+        }
+
+
+class AccountPool:
+    """Assigns runs to accounts and quarantines failing ones."""
+
+    def __init__(
+        self,
+        accounts: list[Account],
+        quarantine_after: int = 3,
+        quarantine_sec: float = 300.0,
+        leases: Optional[JobBackend] = None,
+        node_id: str = "",
+        lease_sec: float = 3600.0,
+    ) -> None:
+        if not accounts:
+            raise ValueError("AccountPool needs at least one account")
+        self.accounts = accounts
+        self.quarantine_after = quarantine_after
+        self.quarantine_sec = quarantine_sec
+        self.leases = leases
+        self.node_id = node_id
+        self.lease_sec = lease_sec
+        self._changed = asyncio.Condition()
+        self._quarantines = 0
+
+    def get(self, name: str) -> Optional[Account]:
+        """The account called name, or None."""
+        return next((a for a in self.accounts if a.name == name), None)
+
+    def _candidates(self, now: float) -> list[Account]:
+        """Usable accounts with a free local slot, least loaded first."""
+        candidates = [
+            a
+            for a in self.accounts
+            if a.in_flight < a.max_concurrency and not a.quarantined(now) and not a.expired()
+        ]
+        # Least loaded relative to its cap; ties go to the account used least overall.
+        return sorted(candidates, key=lambda a: (a.in_flight / a.max_concurrency, a.runs))
+
+    async def _take(self, now: float) -> tuple[Optional[Account], Optional[str]]:
+        """The first candidate that also gets a fleet lease (when shared), and the lease id."""
+        for account in self._candidates(now):
+            if self.leases is None:
+                return account, None
+            lease_id = await self.leases.call(
+                self.leases.acquire_account,
+                self.node_id,
+                account.name,
+                account.max_concurrency,
+                self.lease_sec,
+            )
+            if lease_id is not None:
+                return account, lease_id
+        return None, None
+
+    def _next_wakeup(self, now: float) -> Optional[float]:
+        """Seconds until the next quarantine ends, None when nothing is quarantined."""
+        ends = [a.quarantined_until - now for a in self.accounts if a.quarantined(now)]
+        return max(0.0, min(ends)) if ends else None
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[Account]:
+        """
+        Hold a slot on the least-loaded account for one run.
+
+        Raises AuthExpired when every account's session has expired, since
+        waiting would not help.
+        """
+        async with self._changed:
+            while True:
+                now = time.time()
+                account, lease_id = await self._take(now)
+                if account is not None:
+                    break
+                if all(a.expired() for a in self.accounts):
+                    raise AuthExpired("Every Lovable account's session has expired")
+                timeout = self._next_wakeup(now)
+                if self.leases is not None:
+                    timeout = min(timeout or LEASE_POLL_SEC, LEASE_POLL_SEC)
+                # asyncio.timeout rather than wait_for, which can swallow a cancellation
+                # that lands as the timeout fires and leave the caller waiting forever.
+                try:
+                    async with asyncio.timeout(timeout):
+                        await self._changed.wait()
+                except TimeoutError:
+                    pass
+            account.in_flight += 1
+        try:
+            yield account
+        finally:
+            if lease_id is not None and self.leases is not None:
+                try:
+                    await self.leases.call(self.leases.release_account, lease_id)
+                except Exception as e:
+                    # The lease expires on its own.
+                    logger.warning("Failed to release account lease", error=str(e))
+            async with self._changed:
+                account.in_flight -= 1
+                self._changed.notify_all()
+
+    async def run_as_account(
+        self,
+        config: RunConfig,
+        run: Callable[[RunConfig, Account], Awaitable[dict[str, Any]]],
+    ) -> dict[str, Any]:
+        """
+        Call run with config switched to the least-loaded account, and record the outcome.
+
+        The result's debug names the account. Raises AuthExpired like acquire().
+        """
+        async with self.acquire() as account:
+            logger.info("Using Lovable account", account=account.name, in_flight=account.in_flight)
+            result = await run(config.for_account(account.name, account.store.get()), account)
+            self.record(
+                account, None if result.get("ok") else result.get("error_code", "UNKNOWN_ERROR")
+            )
+        return {**result, "debug": {**result.get("debug", {}), "account": account.name}}
+
+    def record(self, account: Account, error_code: Optional[str]) -> None:
+        """Record a run's outcome (None for success), quarantining the account if needed."""
+        account.runs += 1
+        if error_code is None:
+            account.consecutive_failures = 0
+            return
+        if error_code != ErrorCode.AUTH_EXPIRED.value and error_code not in ACCOUNT_FAILURE_CODES:
+            return
+        account.failures += 1
+        account.consecutive_failures += 1
+        account.last_error_code = error_code
+        if (
+            error_code == ErrorCode.AUTH_EXPIRED.value
+            or account.consecutive_failures >= self.quarantine_after
+        ):
+            self._quarantine(account, error_code)
+
+    def _quarantine(self, account: Account, error_code: str) -> None:
+        account.quarantined_until = time.time() + self.quarantine_sec
+        account.consecutive_failures = 0
+        self._quarantines += 1
+        logger.warning(
+            "Lovable account quarantined",
+            account=account.name,
+            error_code=error_code,
+            quarantine_sec=self.quarantine_sec,
+        )
+
+    def preflight(self) -> Optional[str]:
+        """Why runs must be rejected (no account has a live session), or None."""
+        if any(not a.expired() for a in self.accounts):
+            return None
+        return "Every Lovable account's session has expired; refresh the auth states"
+
+    def stats(self) -> dict[str, Any]:
+        now = time.time()
+        return {
+            "accounts": {a.name: a.stats(now) for a in self.accounts},
+            "capacity": sum(a.max_concurrency for a in self.accounts),
+            "quarantines": self._quarantines,
+        }
+
+    async def start(self) -> None:
+        for account in self.accounts:
+            await account.store.start()
+
+    async def stop(self) -> None:
+        for account in self.accounts:
+            await account.store.stop()
+
+
+_account_pool: Optional[AccountPool] = None
+
+
+def get_account_pool() -> Optional[AccountPool]:
+    """Return the gateway's account pool, or None in single-account mode."""
+    return _account_pool
+
+
+def set_account_pool(pool: Optional[AccountPool]) -> None:
+    global _account_pool
+    _account_pool = pool
+
+
+def create_account_pool() -> Optional[AccountPool]:
+    """
+    Build the pool from MCP_AUTH_STATE_DIR (one ``*.json`` per account).
+
+    Returns None when the directory isn't set or holds no storage states, so
+    the gateway keeps using MCP_AUTH_STATE_PATH.
+    """
+    settings = get_settings()
+    directory = settings.auth_state_dir
+    if not directory:
+        return None
+    paths = sorted(glob.glob(os.path.join(os.path.abspath(directory), "*.json")))
+    if not paths:
+        logger.warning("MCP_AUTH_STATE_DIR has no storage states", path=directory)
+        return None
+    accounts = [
+        Account(
+            name=os.path.splitext(os.path.basename(path))[0],
+            store=AuthStateStore(
+                path,
+                skew_sec=settings.auth_expiry_skew_sec,
+                interval_sec=settings.auth_recheck_sec,
+                preflight_enabled=settings.auth_preflight,
+            ),
+            max_concurrency=settings.account_max_concurrency,
+        )
+        for path in paths
+    ]
+    return AccountPool(
+        accounts,
+        quarantine_after=settings.account_quarantine_after,
+        quarantine_sec=settings.account_quarantine_sec,
+        leases=get_job_backend(),
+        node_id=default_node_id(settings),
+        lease_sec=claim_lease_sec(settings),
+    )
@@ -0,0 +1,149 @@
+"""
+Dedicated, bounded thread pool for the blocking parts of agent runs.
+
+The runner is async end to end, but a run still does some blocking work:
+writing the agent history, loading, compiling and saving macros, deleting
+pooled browser profiles. That work runs here instead of on the event loop or
+the loop's shared default executor, so a burst of runs can neither stall
+request handling nor starve other ``run_in_executor`` users. The pool is sized
+to MCP_AGENT_CONCURRENCY unless MCP_AGENT_EXECUTOR_WORKERS is set, and its
+threads and queue are reported on /health and /metrics.
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
+
+import structlog
+
+from src.metrics import executor_queue_wait_seconds
+from src.settings import Settings, get_settings
+
+logger = structlog.get_logger(__name__)
+
+T = TypeVar("T")
+
+THREAD_NAME_PREFIX = "agent-worker"
+
+
+class AgentExecutor:
+    """A named ThreadPoolExecutor with queue and occupancy accounting."""
+
+    def __init__(self, max_workers: int) -> None:
+        self.max_workers = max(1, max_workers)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix=THREAD_NAME_PREFIX
+        )
+        # Updated from worker threads, so guarded rather than relying on the event loop.
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+        self._completed = 0
+        self._failed = 0
+
+    async def run(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Run fn(*args, **kwargs) on a worker thread and await its result."""
+        submitted = time.monotonic()
+        started: list[float] = []
+
+        def call() -> T:
+            started.append(time.monotonic())
+            with self._lock:
+                self._queued -= 1
+                self._active += 1
+            try:
+                return fn(*args, **kwargs)
+            except BaseException:
+                with self._lock:
+                    self._failed += 1
+                raise
+            finally:
+                with self._lock:
+                    self._active -= 1
+                    self._completed += 1
+
+        def dropped(future: "Future[T]") -> None:
+            # Cancelled before a worker picked it up (caller cancelled or shutdown).
+            if future.cancelled():
+                with self._lock:
+                    self._queued -= 1
+
+        with self._lock:
+            self._queued += 1
+        try:
+            future = self._executor.submit(call)
+        except RuntimeError:
+            with self._lock:
+                self._queued -= 1
+            raise
+        future.add_done_callback(dropped)
+        try:
+            return await asyncio.wrap_future(future)
+        finally:
+            if started:
+                executor_queue_wait_seconds.observe(started[0] - submitted)
+
+    def resize(self, max_workers: int) -> None:
+        """Swap in a pool of a new size; work already submitted finishes on the old one."""
+        max_workers = max(1, max_workers)
+        if max_workers == self.max_workers:
+            return
+        old, previous = self._executor, self.max_workers
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix=THREAD_NAME_PREFIX
+        )
+        self.max_workers = max_workers
+        old.shutdown(wait=False)
+        logger.info("Agent executor resized", workers=max_workers, previous=previous)
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop accepting work, drop queued work and (by default) wait for running work."""
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "active": self._active,
+                "idle": self.max_workers - min(self._active, self.max_workers),
+                "queued": self._queued,
+                "completed": self._completed,
+                "failed": self._failed,
+            }
+
+
+_agent_executor: Optional[AgentExecutor] = None
+
+
+def get_agent_executor() -> Optional[AgentExecutor]:
+    """Return the gateway's agent executor, or None outside the gateway."""
+    return _agent_executor
+
+
+def set_agent_executor(executor: Optional[AgentExecutor]) -> None:
+    global _agent_executor
+    _agent_executor = executor
+
+
+def executor_workers(settings: Settings) -> int:
+    """Worker threads for a settings snapshot (MCP_AGENT_CONCURRENCY unless overridden)."""
+    return settings.agent_executor_workers or settings.agent_concurrency
+
+
+def create_agent_executor(settings: Optional[Settings] = None) -> AgentExecutor:
+    """Build the executor from a settings snapshot (the current one by default)."""
+    return AgentExecutor(executor_workers(settings or get_settings()))
+
+
+async def run_blocking(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    Run blocking agent work on the agent executor.
+
+    Without one (CLI and scripts, which run a single task) fn is called inline.
+    """
+    executor = get_agent_executor()
+    if executor is None:
+        return fn(*args, **kwargs)
+    return await executor.run(fn, *args, **kwargs)
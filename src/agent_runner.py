@@ -1,19 +1,80 @@
 """
 Saik0s delegation layer for browser automation.
 
-This module directly calls the mcp_server_browser_use.run_agents.run_browser_agent function
-to execute browser automation tasks. All environment variables are read from the process environment.
+This module assembles the Saik0s (browser-use) agent the same way
+mcp_server_browser_use.run_agents.run_org_agent does, but with per-run browser objects and a
+step callback, so concurrent runs don't share the Saik0s module globals and progress can be
+streamed while the agent works. Settings come from the run's RunConfig (resolved from the
+settings snapshot), never from os.environ.
+
+The agent coroutine is awaited natively on the caller's event loop (uvicorn's in production),
+so it can share loop-bound resources such as the warm browser pool. The synchronous entry points
+are thin wrappers kept for scripts and backwards compatibility.
+
+Recognized "create/update project X with prompt Y" tasks are first tried on the deterministic
+lovable_adapter flows, then on a compiled macro of an earlier successful run with the same task
+template; the LLM agent only runs when neither applies or a replayed step fails to validate.
 """
 
 import asyncio
 import os
+import tempfile
 import time
-from typing import Any
+import uuid
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator
 
 import structlog
-from dotenv import load_dotenv
 from pydantic import BaseModel
-from tenacity import RetryError, Retrying, stop_after_attempt, wait_fixed
+from tenacity import AsyncRetrying, RetryCallState, RetryError, stop_after_attempt
+
+from src.accounts import get_account_pool
+from src.agent_executor import run_blocking
+from src.auth_state import AuthStateStore, local_storage_script
+from src.browser_pool import PooledBrowser, get_browser_pool
+from src.errors import (
+    AgentError,
+    AgentTimeout,
+    AuthExpired,
+    ConfigError,
+    ErrorCode,
+    classify_error,
+    error_code_of,
+    retry_budget,
+    retry_policy,
+)
+from src.events import emit_run_event
+from src.lovable_adapter.actions import build_lovable_controller, step_report
+from src.lovable_adapter.preview import (
+    RunPreview,
+    current_run_preview,
+    install_preview_capture,
+)
+from src.lovable_adapter.router import (
+    RESTARTABLE_STAGES,
+    FlowFailed,
+    FlowRequest,
+    failed_stage,
+    parse_flow_request,
+    resume_task,
+    run_project_flow,
+)
+from src.lovable_adapter.selectors import DASHBOARD_URL
+from src.lovable_adapter.settle import settle_max_ms, wait_for_page_settled
+from src.macros import MacroStep, MacroStepFailed, get_macro_store, replay_macro
+from src.metrics import (
+    agent_retries_denied_total,
+    agent_retries_total,
+    agent_steps,
+    attempt_duration_seconds,
+    macro_replays_total,
+)
+from src.request_blocking import (
+    NetworkSavings,
+    current_network_savings,
+    install_request_blocking,
+)
+from src.run_config import RunConfig
 
 logger = structlog.get_logger(__name__)
 
@@ -25,169 +86,315 @@ class RunBrowserAgentInput(BaseModel):
     context: dict[str, Any] | None = None
 
 
-def _get_agent_config() -> dict[str, Any]:
-    """Get agent configuration from environment."""
-    return {
-        "timeout_sec": int(os.getenv("MCP_AGENT_TIMEOUT_SEC", "600")),
-        "retry_max": int(os.getenv("MCP_AGENT_RETRY_MAX", "2")),
-    }
+def _make_step_callback(steps: list[dict[str, Any]], attempt: int) -> Any:
+    """Build a browser-use step callback that records and publishes each step."""
+    last_url: dict[str, str | None] = {"url": None}
+
+    async def on_step(state: Any, model_output: Any, n_steps: int) -> None:
+        step: dict[str, Any] = {
+            "step": n_steps - 1,
+            "attempt": attempt,
+            "url": getattr(state, "url", None),
+            "title": getattr(state, "title", None),
+            "next_goal": getattr(getattr(model_output, "current_state", None), "next_goal", None),
+            "actions": [
+                action.model_dump(exclude_unset=True)
+                for action in getattr(model_output, "action", None) or []
+            ],
+        }
+        steps.append(step)
+        emit_run_event("step", step)
+        if step["url"] and step["url"] != last_url["url"]:
+            last_url["url"] = step["url"]
+            emit_run_event("url", {"url": step["url"], "step": step["step"]})
 
+    return on_step
 
-def _run_saik0s_cli(task: str) -> str:
-    """Run browser agent using the mcp_server_browser_use Python API directly."""
 
-    start_time = time.time()
-    config = _get_agent_config()
-    timeout = int(os.getenv("MCP_AGENT_TIMEOUT_SEC", "600"))
-    retry_max = max(1, config["retry_max"])
+def _settled_context_class(base: Any) -> Any:
+    """
+    Subclass browser-use's BrowserContext to settle pages on DOM quiescence.
 
-    # Load environment variables from .env file if it exists
-    # In production, environment variables are set via Fly.io secrets
-    load_dotenv(dotenv_path='.env', override=False)
+    browser-use waits a fixed minimum plus network idle (which Lovable's
+    websocket never reaches) before reading each step's state; this waits only
+    until the page stops changing.
+    """
 
-    # Validate and set environment variables
-    openrouter_key = os.getenv('MCP_LLM_OPENROUTER_API_KEY', '')
-    auth_path = os.getenv('MCP_AUTH_STATE_PATH', './auth.json')
+    class SettledBrowserContext(base):  # type: ignore[misc, valid-type]
+        async def _wait_for_page_and_frames_load(self, timeout_overwrite: Any = None) -> None:
+            try:
+                page = await self.get_current_page()
+                await wait_for_page_settled(page, timeout_ms=settle_max_ms())
+                await self._check_and_handle_navigation(page)
+            except Exception as e:
+                logger.debug("Page settle failed, using default wait", error=str(e))
+                await super()._wait_for_page_and_frames_load(timeout_overwrite)
+
+    return SettledBrowserContext
+
+
+async def _run_org_agent(
+    task: str,
+    *,
+    cdp_url: str | None,
+    on_step: Any,
+    llm_provider: str,
+    llm_model_name: str,
+    llm_num_ctx: int,
+    llm_temperature: float,
+    llm_base_url: str,
+    llm_api_key: str,
+    headless: bool,
+    window_w: int,
+    window_h: int,
+    history_path: str,
+    trace_dir: str,
+    lovable_actions: bool = True,
+    storage_state: dict[str, Any] | None = None,
+) -> str:
+    """
+    Run one browser-use agent with browser objects owned by this run.
 
-    # Convert relative path to absolute path for production compatibility
-    auth_path = os.path.abspath(auth_path)
-    auth_exists = os.path.exists(auth_path)
+    Mirrors Saik0s's run_org_agent. When cdp_url points at a pooled browser, its
+    context is left open and only the CDP connection is dropped on exit. With
+    lovable_actions, the adapter flows are offered to the agent as custom actions.
+    """
+    from browser_use.agent.service import Agent  # type: ignore[import-not-found]
+    from browser_use.browser.browser import Browser, BrowserConfig  # type: ignore[import-not-found]
+    from browser_use.browser.context import (  # type: ignore[import-not-found]
+        BrowserContext,
+        BrowserContextConfig,
+        BrowserContextWindowSize,
+    )
+    from mcp_server_browser_use.utils import utils  # type: ignore[import-not-found]
+
+    llm = utils.get_llm_model(
+        provider=llm_provider,
+        model_name=llm_model_name,
+        num_ctx=llm_num_ctx,
+        temperature=llm_temperature,
+        base_url=llm_base_url,
+        api_key=llm_api_key,
+    )
+    browser = Browser(
+        config=BrowserConfig(
+            headless=headless,
+            cdp_url=cdp_url,
+            disable_security=False,
+            extra_chromium_args=[f"--window-size={window_w},{window_h}"],
+        )
+    )
+    browser_context = _settled_context_class(BrowserContext)(
+        browser=browser,
+        config=BrowserContextConfig(
+            trace_path=trace_dir,
+            no_viewport=False,
+            browser_window_size=BrowserContextWindowSize(width=window_w, height=window_h),
+            _force_keep_context_alive=cdp_url is not None,
+        ),
+    )
+    if cdp_url is None:
+        # Pooled contexts carry their own blocker and capture; only a context launched here
+        # needs them.
+        try:
+            session = await browser_context.get_session()
+            await install_request_blocking(session.context)
+            install_preview_capture(session.context)
+            if storage_state is not None:
+                # The run's parsed copy; the file isn't read again per run.
+                await session.context.add_cookies(storage_state["cookies"])
+                await session.context.add_init_script(
+                    local_storage_script(storage_state["origins"])
+                )
+        except Exception as e:
+            logger.warning("Failed to install request hooks", error=str(e))
+    extra_agent_args: dict[str, Any] = {}
+    if lovable_actions:
+        extra_agent_args["controller"] = build_lovable_controller()
+    try:
+        agent = Agent(
+            task=task,
+            llm=llm,
+            use_vision=True,
+            browser=browser,
+            browser_context=browser_context,
+            max_actions_per_step=10,
+            tool_calling_method='auto',
+            max_input_tokens=8000,
+            register_new_step_callback=on_step,
+            **extra_agent_args,
+        )
+        history = await agent.run(max_steps=100)
+        await run_blocking(agent.save_history, history_path)
+
+        final_result = history.final_result() or ""
+        if not final_result:
+            errors = [error for error in history.errors() if error]
+            if errors:
+                raise RuntimeError(errors[-1])
+        return final_result
+    finally:
+        await browser_context.close()
+        await browser.close()
+
+
+def _failed_attempt_error(retry_state: RetryCallState) -> AgentError | None:
+    outcome = retry_state.outcome
+    if outcome is None or not outcome.failed:
+        return None
+    error = outcome.exception()
+    # Cancellation and other BaseExceptions are never retried.
+    return classify_error(error) if isinstance(error, Exception) else None
+
+
+def _make_retry_predicate(retry_max: int) -> Any:
+    """Retry only codes whose policy allows it, within retry_max and the global budget."""
+
+    async def should_retry(retry_state: RetryCallState) -> bool:
+        error = _failed_attempt_error(retry_state)
+        if error is None or retry_state.attempt_number >= retry_max:
+            return False
+        if not retry_policy(error.code).retryable:
+            agent_retries_denied_total.inc(error_code=error.code.value, reason="policy")
+            logger.info("Not retrying agent error", error_code=error.code.value)
+            return False
+        if not await retry_budget.spend():
+            agent_retries_denied_total.inc(error_code=error.code.value, reason="budget")
+            logger.warning("Retry budget exhausted", error_code=error.code.value)
+            return False
+        return True
+
+    return should_retry
+
+
+def _retry_wait(retry_state: RetryCallState) -> float:
+    error = _failed_attempt_error(retry_state)
+    if error is None:
+        return 0.0
+    return retry_policy(error.code).delay(retry_state.attempt_number)
+
+
+async def _run_saik0s(
+    task: str,
+    cdp_url: str | None = None,
+    steps: list[dict[str, Any]] | None = None,
+    history_path: str | None = None,
+    config: RunConfig | None = None,
+) -> str:
+    """
+    Run browser agent using the mcp_server_browser_use Python API directly.
+
+    When cdp_url is given the agent attaches to that (pooled) Chromium instead
+    of launching its own. Each agent step is appended to steps (when given) and
+    published as a run event. The agent history is saved to history_path (a
+    fresh file under the temp dir by default). Cancelling the awaiting task
+    cancels the agent run. Everything else comes from config (resolved from
+    the settings snapshot when not given); nothing is written to os.environ.
+    """
 
-    # Set critical environment variables
-    os.environ['OPENAI_API_KEY'] = openrouter_key
-    os.environ['PATIENT'] = 'true'
-    os.environ['BROWSER_USE_STORAGE_STATE'] = auth_path
+    start_time = time.time()
+    if config is None:
+        config = RunConfig.from_settings()
+    timeout = config.timeout_sec
+    retry_max = max(1, config.retry_max)
 
     # COMPREHENSIVE DIAGNOSTICS: Environment validation
     logger.info("=== BROWSER AGENT EXECUTION START ===")
     logger.info("Task execution started", task=task, timestamp=time.time())
 
-    # Environment validation - check for required variables
     logger.info("ENVIRONMENT VALIDATION:")
-    env_after_load = os.getenv('MCP_LLM_OPENROUTER_API_KEY', '')
-    has_api_key = bool(env_after_load and len(env_after_load) > 10)
-
+    has_api_key = config.has_api_key
     if not has_api_key:
         logger.error("CRITICAL: MCP_LLM_OPENROUTER_API_KEY not set or too short",
-                    api_key_length=len(env_after_load) if env_after_load else 0)
-
-    logger.info("Environment after .env load",
-               api_key_length_after_load=len(env_after_load) if env_after_load else 0,
-               has_key_after_load=has_api_key)
+                    api_key_length=len(config.llm_api_key))
 
     # Browser initialization checks
     logger.info("BROWSER INITIALIZATION DIAGNOSTICS:")
-    browser_headless = os.getenv('MCP_BROWSER_HEADLESS', 'true')
-    browser_width = os.getenv('MCP_BROWSER_WINDOW_WIDTH', '1440')
-    browser_height = os.getenv('MCP_BROWSER_WINDOW_HEIGHT', '1080')
-    logger.info("Browser config", headless=browser_headless, width=browser_width, height=browser_height)
+    logger.info("Browser config", headless=config.headless, width=config.window_w, height=config.window_h)
 
     # Auth state validation
     logger.info("AUTHENTICATION DIAGNOSTICS:")
-    auth_file_exists = os.path.exists(auth_path)
-    auth_file_size = os.path.getsize(auth_path) if auth_file_exists else 0
     logger.info("Auth state validation",
-               auth_file_path=auth_path,
-               auth_file_exists=auth_file_exists,
-               auth_file_size_bytes=auth_file_size,
-               auth_exists_flag=auth_exists)
+               auth_file_path=config.auth_path,
+               account=config.account,
+               storage_state_loaded=config.storage_state is not None,
+               cookies=len(config.storage_state["cookies"]) if config.storage_state else 0)
 
     # LLM API validation
     logger.info("LLM API DIAGNOSTICS:")
-    llm_provider = os.getenv('MCP_LLM_PROVIDER', 'openrouter')
-    llm_model = os.getenv('MCP_LLM_MODEL_NAME', 'openai/gpt-5-mini')
-    llm_temp = os.getenv('MCP_LLM_TEMPERATURE', '0.2')
-    has_api_key = bool(openrouter_key and len(openrouter_key) > 10)
     logger.info("LLM config validation",
-               provider=llm_provider,
-               model=llm_model,
-               temperature=llm_temp,
+               provider=config.llm_provider,
+               model=config.llm_model_name,
+               temperature=config.llm_temperature,
                has_api_key=has_api_key,
-               api_key_length=len(openrouter_key) if openrouter_key else 0)
+               api_key_length=len(config.llm_api_key))
 
     # Direct Python API execution
     logger.info("DIRECT PYTHON API EXECUTION:")
-    logger.info("Using mcp_server_browser_use.run_agents.run_browser_agent")
+    logger.info("Using browser-use Agent assembled from Saik0s components")
+    if steps is None:
+        steps = []
+
+    if config.llm_provider == 'openrouter' and not has_api_key:
+        raise ConfigError("MCP_LLM_OPENROUTER_API_KEY is not set")
 
-    retryer = Retrying(
+    retryer = AsyncRetrying(
         stop=stop_after_attempt(retry_max),
-        wait=wait_fixed(2),
+        retry=_make_retry_predicate(retry_max),
+        wait=_retry_wait,
         reraise=True,
     )
 
-    for attempt in retryer:
+    async for attempt in retryer:
         with attempt:
             attempt_start = time.time()
+            if attempt.retry_state.attempt_number > 1:
+                agent_retries_total.inc()
+            else:
+                retry_budget.record_attempt()
             logger.info(f"Attempt {attempt.retry_state.attempt_number} started",
                        attempt_time=attempt_start - start_time)
 
             try:
-                # Import and call the run_browser_agent function directly
-                from mcp_server_browser_use.run_agents import run_browser_agent  # type: ignore[import-not-found]
-
-                logger.info("Calling run_browser_agent directly",
+                logger.info("Calling browser agent directly",
                            timeout=timeout,
-                           task=task)
-
-                # Get configuration from environment
-                llm_provider = os.getenv('MCP_LLM_PROVIDER', 'openrouter')
-                llm_model_name = os.getenv('MCP_LLM_MODEL_NAME', 'openai/gpt-5-mini')
-                llm_num_ctx = int(os.getenv('MCP_LLM_NUM_CTX', '8000'))
-                llm_temperature = float(os.getenv('MCP_LLM_TEMPERATURE', '0.2'))
-                llm_base_url = os.getenv('MCP_LLM_BASE_URL', 'https://openrouter.ai/api/v1')
-                llm_api_key = os.getenv('MCP_LLM_OPENROUTER_API_KEY', '')
-
-                browser_headless = os.getenv('MCP_BROWSER_HEADLESS', 'true').lower() == 'true'
-                browser_width = int(os.getenv('MCP_BROWSER_WINDOW_WIDTH', '1440'))
-                browser_height = int(os.getenv('MCP_BROWSER_WINDOW_HEIGHT', '1080'))
+                           task=task,
+                           cdp_url=cdp_url)
 
                 # Create temporary directories for agent history and traces
-                import tempfile as tmp
-                temp_dir = tmp.gettempdir()
+                temp_dir = tempfile.gettempdir()
                 agent_history_dir = os.path.join(temp_dir, 'browser_agent_history')
                 trace_dir = os.path.join(temp_dir, 'browser_agent_traces')
                 os.makedirs(agent_history_dir, exist_ok=True)
                 os.makedirs(trace_dir, exist_ok=True)
-
-                # Log auth state before execution
-                logger.info("AUTHENTICATION STATE BEFORE EXECUTION:",
-                           auth_path=auth_path,
-                           auth_exists=auth_exists,
-                           env_storage_state=os.environ.get('BROWSER_USE_STORAGE_STATE', 'NOT SET'))
-
-                # Call the function directly with all required parameters
-                result: Any = asyncio.run(asyncio.wait_for(  # type: ignore[arg-type]
-                    run_browser_agent(  # type: ignore[call-arg]
-                        agent_type='org',
-                        llm_provider=llm_provider,
-                        llm_model_name=llm_model_name,
-                        llm_num_ctx=llm_num_ctx,
-                        llm_temperature=llm_temperature,
-                        llm_base_url=llm_base_url,
-                        llm_api_key=llm_api_key,
-                        use_own_browser=False,
-                        keep_browser_open=False,
-                        headless=browser_headless,
-                        disable_security=False,
-                        window_w=browser_width,
-                        window_h=browser_height,
-                        save_recording_path=None,
-                        save_agent_history_path=agent_history_dir,
-                        save_trace_path=trace_dir,
-                        enable_recording=False,
-                        task=task,
-                        add_infos='',
-                        max_steps=100,
-                        use_vision=True,
-                        max_actions_per_step=10,
-                        tool_calling_method='auto',
-                        chrome_cdp=None,
-                        max_input_tokens=8000
+                if history_path is None:
+                    history_path = os.path.join(agent_history_dir, f"{uuid.uuid4()}.json")
+
+                # Call the agent directly with all required parameters
+                result: Any = await asyncio.wait_for(
+                    _run_org_agent(
+                        task,
+                        cdp_url=cdp_url,
+                        on_step=_make_step_callback(steps, attempt.retry_state.attempt_number),
+                        llm_provider=config.llm_provider,
+                        llm_model_name=config.llm_model_name,
+                        llm_num_ctx=config.llm_num_ctx,
+                        llm_temperature=config.llm_temperature,
+                        llm_base_url=config.llm_base_url,
+                        llm_api_key=config.llm_api_key,
+                        headless=config.headless,
+                        window_w=config.window_w,
+                        window_h=config.window_h,
+                        history_path=history_path,
+                        trace_dir=trace_dir,
+                        lovable_actions=config.lovable_actions,
+                        storage_state=config.storage_state,
                     ),
                     timeout=timeout
-                ))
+                )
 
                 elapsed = time.time() - attempt_start
+                attempt_duration_seconds.observe(elapsed, outcome="success")
 
                 logger.info("=== EXECUTION COMPLETE ===")
                 logger.info("Browser agent execution succeeded",
@@ -205,20 +412,26 @@ def _run_saik0s_cli(task: str) -> str:
 
             except asyncio.TimeoutError as e:
                 elapsed = time.time() - attempt_start
+                attempt_duration_seconds.observe(elapsed, outcome="timeout")
                 logger.error("=== EXECUTION TIMEOUT ===")
                 logger.error("Browser agent timeout",
                             timeout=timeout,
                             elapsed=elapsed)
-                raise TimeoutError(f"Browser agent timed out after {timeout}s") from e
+                raise AgentTimeout(f"Browser agent timed out after {timeout}s") from e
 
             except Exception as e:
                 elapsed = time.time() - attempt_start
+                attempt_duration_seconds.observe(elapsed, outcome="error")
                 logger.error("=== EXECUTION ERROR ===")
+                error = classify_error(e)
                 logger.error("Browser agent execution error",
                            error_type=type(e).__name__,
+                           error_code=error.code.value,
                            error_message=str(e),
                            elapsed=elapsed)
-                raise
+                if error is e:
+                    raise
+                raise error from e
 
     logger.error("=== RETRY EXHAUSTION ===")
     logger.error("All retry attempts failed",
@@ -226,13 +439,51 @@ def _run_saik0s_cli(task: str) -> str:
                 max_retries=retry_max)
     raise RuntimeError("Unexpected: Saik0s CLI retry loop completed without return or raise.")
 
-def run_browser_agent(task: str, context: dict[str, Any] | None = None) -> dict[str, Any]:  # pylint: disable=unused-argument
+
+def _run_saik0s_cli(task: str, cdp_url: str | None = None) -> str:
+    """Blocking wrapper around _run_saik0s for callers without an event loop."""
+    return asyncio.run(_run_saik0s(task, cdp_url=cdp_url))
+
+
+def _empty_output_result(result_text: str, config: RunConfig) -> dict[str, Any]:
+    logger.error("Saik0s CLI returned empty output - check the LLM key and auth state",
+                api_key_set=config.has_api_key,
+                auth_path=config.auth_path)
+    return {
+        "ok": False,
+        "result_text": result_text,
+        "error": "Browser agent returned no output - check MCP_LLM_OPENROUTER_API_KEY and MCP_AUTH_STATE_PATH",
+    }
+
+
+def _error_result(e: Exception) -> dict[str, Any]:
+    if isinstance(e, (TimeoutError, RetryError)):
+        logger.error("Browser agent execution failed", error=str(e))
+    else:
+        logger.error("Browser agent execution failed with unexpected error", error=str(e), error_type=type(e).__name__)
+    result = {
+        "ok": False,
+        "result_text": "",
+        "error": str(e),
+    }
+    error_code = error_code_of(e)
+    if error_code is not None:
+        result["error_code"] = error_code
+    return result
+
+
+def run_browser_agent(
+    task: str,
+    context: dict[str, Any] | None = None,  # pylint: disable=unused-argument
+    cdp_url: str | None = None,
+) -> dict[str, Any]:
     """
     Run a browser automation task via Saik0s.
 
     Args:
         task: The task description.
         context: Optional context dictionary (not used in CLI mode).
+        cdp_url: Optional CDP endpoint of a pooled browser to attach to.
 
     Returns:
         Dictionary with keys:
@@ -246,43 +497,399 @@ def run_browser_agent(task: str, context: dict[str, Any] | None = None) -> dict[
     """
     try:
         logger.info("run_browser_agent called", task=task)
-        result_text = _run_saik0s_cli(task)
+        result_text = _run_saik0s_cli(task, cdp_url=cdp_url)
         if not result_text.strip():
-            logger.error("Saik0s CLI returned empty output - check environment variables",
-                        api_key_set=bool(os.getenv('MCP_LLM_OPENROUTER_API_KEY')),
-                        auth_path=os.getenv('MCP_AUTH_STATE_PATH'))
-            return {
-                "ok": False,
-                "result_text": result_text,
-                "error": "Browser agent returned no output - check MCP_LLM_OPENROUTER_API_KEY and MCP_AUTH_STATE_PATH",
-            }
+            return _empty_output_result(result_text, RunConfig.from_settings())
         return {
             "ok": True,
             "result_text": result_text,
         }
-    except (TimeoutError, RetryError) as e:
-        logger.error("Browser agent execution failed", error=str(e))
+    except Exception as e:
+        return _error_result(e)
+
+
+def _report_steps(steps: list[dict[str, Any]]) -> dict[str, Any]:
+    report = step_report(steps)
+    agent_steps.observe(
+        report["agent_steps"], lovable_actions="used" if report["lovable_actions"] else "unused"
+    )
+    logger.info("Agent step report", **report)
+    return report
+
+
+async def _run_browser_agent_native(
+    task: str,
+    config: RunConfig,
+    cdp_url: str | None = None,
+    history_path: str | None = None,
+) -> dict[str, Any]:
+    steps: list[dict[str, Any]] = []
+    try:
+        logger.info("run_browser_agent_async called", task=task)
+        result_text = await _run_saik0s(
+            task, cdp_url=cdp_url, steps=steps, history_path=history_path, config=config
+        )
+        if not result_text.strip():
+            return {
+                **_empty_output_result(result_text, config),
+                "steps": steps,
+                "debug": _report_steps(steps),
+            }
         return {
-            "ok": False,
-            "result_text": "",
-            "error": str(e),
+            "ok": True,
+            "result_text": result_text,
+            "steps": steps,
+            "debug": _report_steps(steps),
         }
     except Exception as e:
-        logger.error("Browser agent execution failed with unexpected error", error=str(e), error_type=type(e).__name__)
+        return {**_error_result(e), "steps": steps, "debug": _report_steps(steps)}
+
+
+@asynccontextmanager
+async def _standalone_page(config: RunConfig) -> AsyncIterator[Any]:
+    """Launch a one-off authenticated Chromium page when no pool is configured."""
+    from playwright.async_api import async_playwright
+
+    async with async_playwright() as playwright:
+        browser = await playwright.chromium.launch(headless=config.headless)
+        try:
+            context = await browser.new_context(
+                storage_state=config.storage_state,
+                viewport={"width": config.window_w, "height": config.window_h},
+            )
+            await install_request_blocking(context)
+            install_preview_capture(context)
+            page = await context.new_page()
+            await page.goto(DASHBOARD_URL, wait_until="domcontentloaded")
+            yield page
+        finally:
+            await browser.close()
+
+
+@asynccontextmanager
+async def _page_for(browser: PooledBrowser | None, config: RunConfig) -> AsyncIterator[Any]:
+    """The pooled browser's page, or a one-off page when there is no pool."""
+    if browser is None:
+        async with _standalone_page(config) as page:
+            yield page
+        return
+    pages = browser.context.pages
+    yield pages[0] if pages else await browser.context.new_page()
+
+
+def _record_step(steps: list[dict[str, Any]], url: str, **fields: Any) -> None:
+    step = {"step": len(steps) + 1, "attempt": 0, "url": url, **fields}
+    steps.append(step)
+    emit_run_event("step", step)
+    emit_run_event("url", {"url": url, "step": step["step"]})
+
+
+async def _run_flow_on(
+    request: FlowRequest,
+    browser: PooledBrowser | None,
+    steps: list[dict[str, Any]],
+    config: RunConfig,
+) -> dict[str, Any]:
+    def on_stage(stage: str, url: str) -> None:
+        _record_step(steps, url, flow=stage)
+
+    async with _page_for(browser, config) as page:
+        return await run_project_flow(page, request, on_stage)
+
+
+async def _run_fast_path(
+    request: FlowRequest, config: RunConfig, browser: PooledBrowser | None = None
+) -> tuple[dict[str, Any] | None, list[dict[str, Any]], str | None]:
+    """
+    Try the deterministic flow for a recognized task.
+
+    Returns (result, steps, error); result is None when the agent should take
+    over the original task, which is only the case when the flow stopped before
+    entering the prompt. Later failures are finished by _resume_flow instead.
+    """
+    steps: list[dict[str, Any]] = []
+    logger.info(
+        "Trying deterministic flow",
+        action=request.action,
+        project=request.project_name,
+        pooled=browser is not None,
+    )
+    try:
+        flow = await asyncio.wait_for(
+            _run_flow_on(request, browser, steps, config), timeout=config.timeout_sec
+        )
+    except Exception as e:
+        error = str(e) or type(e).__name__
+        stage = e.stage if isinstance(e, FlowFailed) else failed_stage([s["flow"] for s in steps])
+        if stage in RESTARTABLE_STAGES:
+            logger.warning("Deterministic flow failed, falling back to agent", error=error)
+            emit_run_event("fallback", {"reason": error})
+            return None, steps, error
+        code = ErrorCode.UI_CHANGED if isinstance(e, FlowFailed) else classify_error(e).code
+        result = await _resume_flow(request, stage, steps, error, code, config, browser)
+        return result, steps, error
+    return {
+        "ok": True,
+        "result_text": flow["result_text"],
+        "project_url": flow["project_url"],
+        "steps": steps,
+        "debug": {"path": "flow"},
+    }, steps, None
+
+
+async def _resume_flow(
+    request: FlowRequest,
+    stage: str,
+    steps: list[dict[str, Any]],
+    error: str,
+    code: ErrorCode,
+    config: RunConfig,
+    browser: PooledBrowser | None,
+) -> dict[str, Any]:
+    """Finish a flow that failed after entering the prompt, without creating or submitting twice."""
+    debug = {"flow_error": error, "flow_stage": stage}
+    project_url = steps[-1]["url"] if steps else ""
+    task = resume_task(request, stage, project_url) if project_url else None
+    if task is None:
+        logger.warning("Deterministic flow failed after the prompt was entered", stage=stage)
         return {
             "ok": False,
             "result_text": "",
-            "error": str(e),
+            "error": (
+                f"Deterministic flow failed at {stage} ({error}); not handed to the agent "
+                "because the prompt may already have been submitted"
+            ),
+            "error_code": code.value,
+            "steps": steps,
+            "debug": {"path": "flow", **debug},
         }
+    logger.warning("Deterministic flow failed, agent finishing the run", stage=stage, error=error)
+    emit_run_event("fallback", {"reason": error, "resume_stage": stage})
+    cdp_url = browser.cdp_url if browser is not None else None
+    result = await _run_browser_agent_native(task, config, cdp_url=cdp_url)
+    return {
+        **result,
+        "steps": steps + result.get("steps", []),
+        "debug": {**result.get("debug", {}), "path": "agent", **debug},
+    }
+
+
+async def _run_macro(
+    task: str,
+    context: dict[str, Any] | None,
+    config: RunConfig,
+    browser: PooledBrowser | None = None,
+) -> tuple[dict[str, Any] | None, list[dict[str, Any]], str | None]:
+    """
+    Replay the compiled macro for the task's template and context, if there is one.
+
+    Returns (result, steps, error); result is None when the agent should take
+    over, which is only the case while no replayed step can have changed the
+    project. A later failure is returned as the run's error so the agent doesn't
+    submit the prompt a second time.
+    """
+    steps: list[dict[str, Any]] = []
+    store = get_macro_store()
+    if store is None:
+        return None, steps, None
+    macro, values = await run_blocking(store.find, task, context)
+    if macro is None:
+        return None, steps, None
+
+    def on_step(index: int, step: MacroStep, url: str) -> None:
+        _record_step(steps, url, macro=step.action)
+
+    logger.info("Replaying compiled macro", template=macro.template, steps=len(macro.steps))
+    try:
+        async with _page_for(browser, config) as page:
+            replay = await asyncio.wait_for(
+                replay_macro(page, macro, values, on_step), timeout=config.timeout_sec
+            )
+    except Exception as e:
+        await run_blocking(store.record_failure, macro)
+        macro_replays_total.inc(outcome="failed")
+        error = str(e) or type(e).__name__
+        # A timeout can land in the middle of the step after the last one reported.
+        steps_run = e.steps_run if isinstance(e, MacroStepFailed) else len(steps) + 1
+        if macro.side_effect_in(steps_run):
+            logger.warning("Macro replay failed after changing the project", error=error)
+            if isinstance(e, MacroStepFailed):
+                code = ErrorCode.UI_CHANGED
+            else:
+                code = classify_error(e).code
+            return {
+                "ok": False,
+                "result_text": "",
+                "error": (
+                    f"Macro replay failed ({error}) after a step that may have changed the "
+                    "project; not handed to the agent to avoid repeating it"
+                ),
+                "error_code": code.value,
+                "steps": steps,
+                "debug": {"path": "macro", "macro_error": error},
+            }, steps, error
+        logger.warning("Macro replay failed, falling back to agent", error=error)
+        emit_run_event("fallback", {"reason": error})
+        return None, steps, error
+    await run_blocking(store.record_success, macro)
+    macro_replays_total.inc(outcome="ok")
+    return {
+        "ok": True,
+        "result_text": replay["result_text"],
+        "project_url": replay["project_url"],
+        "steps": steps,
+        "debug": {"path": "macro", "macro_steps": len(macro.steps)},
+    }, steps, None
+
+
+async def _run_agent_and_compile(
+    task: str, context: dict[str, Any] | None, config: RunConfig, cdp_url: str | None
+) -> dict[str, Any]:
+    """Run the LLM agent; compile its history into a macro when it succeeds."""
+    store = get_macro_store()
+    if store is None:
+        return await _run_browser_agent_native(task, config, cdp_url=cdp_url)
+
+    history_dir = os.path.join(tempfile.gettempdir(), "browser_agent_history")
+    history_path = os.path.join(history_dir, f"{uuid.uuid4()}.json")
+    result = await _run_browser_agent_native(
+        task, config, cdp_url=cdp_url, history_path=history_path
+    )
+    if result.get("ok"):
+        try:
+            await run_blocking(store.compile_from_file, task, history_path, context)
+        except Exception as e:
+            logger.warning("Failed to compile macro", error=str(e))
+    return result
+
+
+async def _run_routed(
+    task: str,
+    context: dict[str, Any] | None,
+    config: RunConfig,
+    browser: PooledBrowser | None = None,
+) -> dict[str, Any]:
+    """Route tasks through the flow, then a compiled macro, then the agent."""
+    cdp_url = browser.cdp_url if browser is not None else None
+    prior_steps: list[dict[str, Any]] = []
+    fallback: dict[str, Any] = {}
+
+    request = parse_flow_request(task, context) if config.fast_path_enabled else None
+    if request is not None:
+        result, flow_steps, flow_error = await _run_fast_path(request, config, browser)
+        if result is not None:
+            return result
+        prior_steps += flow_steps
+        fallback["flow_error"] = flow_error
+
+    result, macro_steps, macro_error = await _run_macro(task, context, config, browser)
+    if result is not None:
+        return {**result, "steps": prior_steps + result["steps"]}
+    prior_steps += macro_steps
+    if macro_error is not None:
+        fallback["macro_error"] = macro_error
+
+    result = await _run_agent_and_compile(task, context, config, cdp_url)
+    if not fallback:
+        return result
+    return {
+        **result,
+        "steps": prior_steps + result.get("steps", []),
+        "debug": {**result.get("debug", {}), "path": "agent", **fallback},
+    }
 
 
 async def run_browser_agent_async(
-    task: str, context: dict[str, Any] | None = None
+    task: str, context: dict[str, Any] | None = None, config: RunConfig | None = None
 ) -> dict[str, Any]:
     """
-    Async wrapper for run_browser_agent.
-
-    Runs the blocking CLI call in a thread pool.
+    Run a browser automation task on the current event loop.
+
+    Returns the same dictionary shape as run_browser_agent. When the gateway
+    owns a warm browser pool, a pooled Chromium is checked out for the run and
+    its CDP endpoint is handed to the agent. Cancellation propagates into the
+    agent and the pooled browser is returned to the pool. Tasks the
+    lovable_adapter router recognizes run on the deterministic flows first.
+    Requests the network blocking profile saved are reported in debug.network,
+    and preview URLs seen during the run are cached for extract_preview_url.
+    config (resolved from the environment when not given) is the run's only
+    source of settings.
     """
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, run_browser_agent, task, context)
+    if config is None:
+        config = RunConfig.from_settings()
+    savings = NetworkSavings()
+    preview = RunPreview()
+    token = current_network_savings.set(savings)
+    preview_token = current_run_preview.set(preview)
+    try:
+        result = await _run_on_account(task, context, config, savings, preview)
+    finally:
+        current_run_preview.reset(preview_token)
+        current_network_savings.reset(token)
+    return {**result, "debug": {**result.get("debug", {}), "network": savings.to_dict()}}
+
+
+async def _run_on_account(
+    task: str,
+    context: dict[str, Any] | None,
+    config: RunConfig,
+    savings: NetworkSavings,
+    preview: RunPreview,
+) -> dict[str, Any]:
+    """Run as the least-loaded Lovable account when several are configured."""
+    accounts = get_account_pool()
+    if accounts is None:
+        return await _run_on_browser(task, context, config, savings, preview)
+
+    if config.account is not None:
+        # A worker process: the gateway already picked the account and holds its slot.
+        account = accounts.get(config.account)
+        if account is None:
+            return _error_result(ValueError(f"Unknown Lovable account: {config.account}"))
+        account_config = config.for_account(account.name, account.store.get())
+        result = await _run_on_browser(
+            task, context, account_config, savings, preview, account.store
+        )
+        return {**result, "debug": {**result.get("debug", {}), "account": account.name}}
+
+    try:
+        return await accounts.run_as_account(
+            config,
+            lambda account_config, account: _run_on_browser(
+                task, context, account_config, savings, preview, account.store
+            ),
+        )
+    except AuthExpired as e:
+        return _error_result(e)
+
+
+async def _run_on_browser(
+    task: str,
+    context: dict[str, Any] | None,
+    config: RunConfig,
+    savings: NetworkSavings,
+    preview: RunPreview,
+    auth: AuthStateStore | None = None,
+) -> dict[str, Any]:
+    pool = get_browser_pool()
+    if pool is None:
+        return await _run_routed(task, context, config)
+
+    async with pool.acquire(auth) as browser:
+        logger.info(
+            "Using pooled browser",
+            browser_id=browser.browser_id,
+            uses=browser.uses,
+            authenticated=pool.storage_state is not None,
+        )
+        if browser.blocker is not None:
+            browser.blocker.savings = savings
+        if browser.preview is not None:
+            browser.preview.target = preview
+        try:
+            return await _run_routed(task, context, config, browser)
+        finally:
+            if browser.blocker is not None:
+                browser.blocker.savings = None
+            if browser.preview is not None:
+                browser.preview.target = None
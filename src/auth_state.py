@@ -0,0 +1,341 @@
+"""
+Lovable auth state: in-memory store, session expiry index and run preflight.
+
+AuthStateStore owns the parsed storage state for the whole gateway: browser
+contexts are handed the parsed object rather than re-reading the file, and a
+watcher swaps in new versions of the file without a restart. Each version is
+indexed for when the Lovable session ends (the earliest of the session
+cookies' ``expires`` and their JWT ``exp`` claims), so preflight() can reject a
+run with AUTH_EXPIRED before it is queued instead of after a browser run.
+"""
+
+import asyncio
+import base64
+import binascii
+import contextlib
+import json
+import os
+import tempfile
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+import structlog
+
+from src.settings import get_settings
+
+logger = structlog.get_logger(__name__)
+
+SESSION_COOKIE_PREFIX = "lovable-session-id"
+SESSION_COOKIE_DOMAIN = "lovable.dev"
+
+
+def load_storage_state(path: str) -> Optional[dict[str, Any]]:
+    """
+    Parse a Playwright storage state file.
+
+    Accepts both the full ``{"cookies": [...], "origins": [...]}`` shape and a
+    bare cookie list. Returns None when the file is missing or unreadable.
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning("Storage state not loaded", path=path, error=str(e))
+        return None
+    if isinstance(data, list):
+        return {"cookies": data, "origins": []}
+    return {"cookies": data.get("cookies", []), "origins": data.get("origins", [])}
+
+
+def jwt_expiry(token: str) -> Optional[float]:
+    """The ``exp`` claim of a JWT, or None when the value isn't a JWT with one."""
+    parts = token.split(".")
+    if len(parts) != 3:
+        return None
+    payload = parts[1] + "=" * (-len(parts[1]) % 4)
+    try:
+        claims = json.loads(base64.urlsafe_b64decode(payload))
+    except (binascii.Error, ValueError):
+        return None
+    exp = claims.get("exp") if isinstance(claims, dict) else None
+    return float(exp) if isinstance(exp, (int, float)) else None
+
+
+@dataclass(frozen=True)
+class SessionIndex:
+    """When the Lovable session in a storage state ends."""
+
+    cookie_names: tuple[str, ...] = ()
+    expires_at: Optional[float] = None  # None: no expiry known (or no session cookie)
+    source: Optional[str] = None  # "cookie" or "jwt", whichever ends first
+
+    @property
+    def has_session(self) -> bool:
+        return bool(self.cookie_names)
+
+
+def index_session(state: Optional[dict[str, Any]]) -> SessionIndex:
+    """Index the earliest expiry across the Lovable session cookies and their JWTs."""
+    if not state:
+        return SessionIndex()
+    names: list[str] = []
+    expiry: Optional[float] = None
+    source: Optional[str] = None
+    for cookie in state.get("cookies", []):
+        name = str(cookie.get("name", ""))
+        domain = str(cookie.get("domain", SESSION_COOKIE_DOMAIN))
+        if not name.startswith(SESSION_COOKIE_PREFIX) or SESSION_COOKIE_DOMAIN not in domain:
+            continue
+        names.append(name)
+        # Playwright uses -1 for session cookies, which don't expire on their own.
+        expires = cookie.get("expires")
+        candidates: list[tuple[str, float]] = []
+        if isinstance(expires, (int, float)) and expires > 0:
+            candidates.append(("cookie", float(expires)))
+        token_exp = jwt_expiry(str(cookie.get("value", "")))
+        if token_exp is not None:
+            candidates.append(("jwt", token_exp))
+        for kind, value in candidates:
+            if expiry is None or value < expiry:
+                expiry, source = value, kind
+    return SessionIndex(cookie_names=tuple(names), expires_at=expiry, source=source)
+
+
+def local_storage_script(origins: list[dict[str, Any]]) -> str:
+    """Init script that seeds localStorage for the origins in a storage state."""
+    items = {
+        o["origin"]: {i["name"]: i["value"] for i in o.get("localStorage", [])}
+        for o in origins
+        if o.get("origin")
+    }
+    return (
+        "(() => { const items = " + json.dumps(items) + "[location.origin];"
+        " if (!items) return;"
+        " for (const [k, v] of Object.entries(items)) {"
+        " if (localStorage.getItem(k) === null) localStorage.setItem(k, v); } })();"
+    )
+
+
+@dataclass(frozen=True)
+class AuthSnapshot:
+    """One parsed version of the storage state; replaced whole, never mutated."""
+
+    state: Optional[dict[str, Any]] = None
+    index: SessionIndex = SessionIndex()
+    mtime: Optional[float] = None
+    version: int = 0
+    loaded_at: Optional[float] = None
+
+
+StateListener = Callable[[Optional[dict[str, Any]]], None]
+
+
+class AuthStateStore:
+    """
+    The gateway's in-memory copy of the storage state.
+
+    The file is polled (mtime) every interval_sec; a changed file is parsed and
+    swapped in as a new snapshot, and listeners (the browser pool) are told.
+    Runs take the parsed state from get(), so they never read the file. A file
+    caught mid-write fails to parse and the previous snapshot stays in place
+    until the next poll.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        skew_sec: float = 60.0,
+        interval_sec: float = 5.0,
+        preflight_enabled: bool = True,
+    ) -> None:
+        self.path = path
+        self.skew_sec = skew_sec
+        self.interval_sec = interval_sec
+        self.preflight_enabled = preflight_enabled
+        self.snapshot = AuthSnapshot()
+        self._listeners: list[StateListener] = []
+        self._checked_at: Optional[float] = None
+        self._rejected = 0
+        self._task: Optional[asyncio.Task[None]] = None
+
+    @property
+    def index(self) -> SessionIndex:
+        return self.snapshot.index
+
+    @property
+    def loaded(self) -> bool:
+        return self.snapshot.state is not None
+
+    def get(self) -> Optional[dict[str, Any]]:
+        """The current parsed storage state (loaded on first use), or None."""
+        if self._checked_at is None:
+            self.reload()
+        return self.snapshot.state
+
+    def subscribe(self, listener: StateListener) -> None:
+        """Call listener with the new state whenever a new version is swapped in."""
+        self._listeners.append(listener)
+
+    def reload(self) -> bool:
+        """Swap in the file's contents if it changed; True when a new version was loaded."""
+        self._checked_at = time.time()
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            if self.snapshot.state is not None:
+                logger.warning("Auth state file disappeared; keeping loaded state", path=self.path)
+            return False
+        if mtime == self.snapshot.mtime:
+            return False
+        state = load_storage_state(self.path)
+        if state is None:
+            return False
+        self._swap(state, mtime)
+        return True
+
+    def save(self, state: dict[str, Any]) -> None:
+        """
+        Persist a new storage state and swap it in.
+
+        The file is replaced atomically (temp file + rename), so the watcher and
+        anything else reading it never see a partial write.
+        """
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".auth-", suffix=".json", dir=directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(state, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.unlink(tmp_path)
+            raise
+        self._swap(
+            {"cookies": state.get("cookies", []), "origins": state.get("origins", [])},
+            os.stat(self.path).st_mtime,
+        )
+
+    def _swap(self, state: dict[str, Any], mtime: Optional[float]) -> None:
+        self.snapshot = AuthSnapshot(
+            state=state,
+            index=index_session(state),
+            mtime=mtime,
+            version=self.snapshot.version + 1,
+            loaded_at=time.time(),
+        )
+        logger.info(
+            "Auth state loaded",
+            path=self.path,
+            version=self.snapshot.version,
+            session_cookies=list(self.index.cookie_names),
+            expires_at=self.index.expires_at,
+            source=self.index.source,
+        )
+        for listener in self._listeners:
+            try:
+                listener(state)
+            except Exception as e:
+                logger.warning("Auth state listener failed", error=str(e))
+
+    def seconds_left(self, now: Optional[float] = None) -> Optional[float]:
+        if self.index.expires_at is None:
+            return None
+        return self.index.expires_at - (time.time() if now is None else now)
+
+    def preflight(self) -> Optional[str]:
+        """Return why runs must be rejected (the session is dead), or None to let them run."""
+        if not self.preflight_enabled:
+            return None
+        left = self.seconds_left()
+        if left is None or left > self.skew_sec:
+            return None
+        self._rejected += 1
+        return (
+            f"Lovable session expired ({self.index.source} expiry "
+            f"{time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(self.index.expires_at))}); "
+            "refresh the auth state"
+        )
+
+    def status(self) -> str:
+        if not self.loaded:
+            return "missing"
+        if not self.index.has_session or self.index.expires_at is None:
+            return "unknown"
+        left = self.seconds_left()
+        return "valid" if left is not None and left > self.skew_sec else "expired"
+
+    def stats(self) -> dict[str, Any]:
+        left = self.seconds_left()
+        return {
+            "status": self.status(),
+            "path": self.path,
+            "version": self.snapshot.version,
+            "loaded_at": self.snapshot.loaded_at,
+            "expires_at": self.index.expires_at,
+            "expiry_source": self.index.source,
+            "seconds_left": round(left, 1) if left is not None else None,
+            "checked_at": self._checked_at,
+            "preflight": self.preflight_enabled,
+            "rejected": self._rejected,
+        }
+
+    async def start(self) -> None:
+        self.reload()
+        if self._task is None:
+            self._task = asyncio.create_task(self._watch_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _watch_loop(self) -> None:
+        """Poll the file for new versions and re-validate the session expiry."""
+        while True:
+            await asyncio.sleep(self.interval_sec)
+            previous = self.status()
+            try:
+                self.reload()
+            except Exception as e:
+                logger.warning("Auth state re-validation failed", error=str(e))
+                continue
+            current = self.status()
+            if current != previous:
+                log = logger.warning if current == "expired" else logger.info
+                log("Auth state status changed", previous=previous, status=current)
+
+
+_auth_store: Optional[AuthStateStore] = None
+
+
+def get_auth_store() -> Optional[AuthStateStore]:
+    """Return the gateway's auth state store, or None outside the gateway."""
+    return _auth_store
+
+
+def set_auth_store(store: Optional[AuthStateStore]) -> None:
+    global _auth_store
+    _auth_store = store
+
+
+def current_storage_state() -> Optional[dict[str, Any]]:
+    """The storage state for a new browser context: from the store, else read from disk."""
+    store = get_auth_store()
+    if store is not None:
+        return store.get()
+    path = os.path.abspath(get_settings().auth_state_path)
+    return load_storage_state(path) if os.path.exists(path) else None
+
+
+def create_auth_store() -> AuthStateStore:
+    """Build the store from the settings (MCP_AUTH_STATE_PATH, MCP_AUTH_* settings)."""
+    settings = get_settings()
+    return AuthStateStore(
+        path=os.path.abspath(settings.auth_state_path),
+        skew_sec=settings.auth_expiry_skew_sec,
+        interval_sec=settings.auth_recheck_sec,
+        preflight_enabled=settings.auth_preflight,
+    )
@@ -0,0 +1,438 @@
+"""
+Warm Chromium pool shared across browser agent runs.
+
+The gateway pre-launches a fixed number of Chromium instances, each exposing a
+CDP endpoint on localhost. Agent runs check an instance out, attach to it via
+``chrome_cdp`` and hand it back, so no run pays for a cold browser launch.
+Instances are health-checked on checkout and in the background, and recycled
+after ``max_uses`` runs to bound memory growth.
+
+When a Lovable storage state is available it is parsed once and applied to
+each instance's default context (the one browser-use attaches to over CDP),
+and the dashboard is preloaded. After every run the context is reset back to
+that authenticated dashboard page before it is handed out again.
+
+With several Lovable accounts, acquire() takes the run's account store:
+instances stay bound to the account they were launched for, checkout prefers
+an idle instance of the same account, and an instance of another account is
+relaunched rather than re-cookied so no localStorage crosses accounts. The
+same goes for a rotated storage state: instances launched with the old one
+are relaunched on checkout or release.
+"""
+
+import asyncio
+import os
+import shutil
+import socket
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Optional
+
+import httpx
+import structlog
+
+from src.agent_executor import run_blocking
+from src.auth_state import (  # load_storage_state is re-exported for existing callers
+    AuthStateStore,
+    current_storage_state,
+    load_storage_state,
+    local_storage_script,
+)
+from src.lovable_adapter.preview import install_preview_capture
+from src.lovable_adapter.selectors import DASHBOARD_URL, DEFAULT_TIMEOUT
+from src.request_blocking import install_request_blocking
+from src.settings import get_settings
+
+logger = structlog.get_logger(__name__)
+
+
+def _free_port() -> int:
+    """Ask the OS for a free localhost TCP port."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return int(sock.getsockname()[1])
+
+
+@dataclass
+class PooledBrowser:
+    """A pre-launched Chromium instance reachable over CDP."""
+
+    browser_id: int
+    port: int
+    user_data_dir: str
+    context: Any = None
+    blocker: Any = None
+    preview: Any = None
+    uses: int = 0
+    auth_key: Optional[str] = None  # path of the account's auth state; None: the pool's own
+    state_generation: int = 0
+    created_at: float = field(default_factory=time.time)
+
+    @property
+    def cdp_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+
+class BrowserPool:
+    """Fixed-size pool of warm Chromium instances."""
+
+    def __init__(
+        self,
+        size: int,
+        max_uses: int = 20,
+        headless: bool = True,
+        window_w: int = 1440,
+        window_h: int = 1080,
+        health_interval_sec: float = 30.0,
+        health_timeout_sec: float = 2.0,
+        storage_state: Optional[dict[str, Any]] = None,
+        warm_url: str = DASHBOARD_URL,
+    ) -> None:
+        self.size = size
+        self.max_uses = max(1, max_uses)
+        self.headless = headless
+        self.window_w = window_w
+        self.window_h = window_h
+        self.health_interval_sec = health_interval_sec
+        self.health_timeout_sec = health_timeout_sec
+        self.storage_state = storage_state
+        self.warm_url = warm_url
+
+        self._idle: asyncio.Queue[PooledBrowser] = asyncio.Queue()
+        self._in_use: set[int] = set()
+        self._next_id = 0
+        self._playwright: Any = None
+        self._health_task: Optional[asyncio.Task[None]] = None
+        self._background: set[asyncio.Task[None]] = set()
+        self._closed = False
+        self._launches = 0
+        self._recycles = 0
+        self._health_failures = 0
+        self._resets = 0
+        self._state_generation = 0
+        self._reset_failures = 0
+        self._auth_stores: dict[str, AuthStateStore] = {}
+        self._rebinds = 0
+
+    async def start(self) -> None:
+        """Start Playwright and launch the initial instances."""
+        from playwright.async_api import async_playwright
+
+        self._playwright = await async_playwright().start()
+        browsers = await asyncio.gather(*(self._launch() for _ in range(self.size)))
+        for browser in browsers:
+            self._idle.put_nowait(browser)
+        self._health_task = asyncio.create_task(self._health_loop())
+        logger.info(
+            "Browser pool started",
+            size=self.size,
+            max_uses=self.max_uses,
+            authenticated=self.storage_state is not None,
+        )
+
+    async def stop(self) -> None:
+        """Close every instance and stop Playwright."""
+        self._closed = True
+        if self._health_task is not None:
+            self._health_task.cancel()
+            await asyncio.gather(self._health_task, return_exceptions=True)
+        await asyncio.gather(*self._background, return_exceptions=True)
+        while not self._idle.empty():
+            await self._close(self._idle.get_nowait())
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+        logger.info("Browser pool stopped", launches=self._launches, recycles=self._recycles)
+
+    @asynccontextmanager
+    async def acquire(self, auth: Optional[AuthStateStore] = None) -> AsyncIterator[PooledBrowser]:
+        """Check out a healthy instance for one run, authenticated as auth's account if given."""
+        auth_key = None
+        if auth is not None:
+            auth_key = auth.path
+            self._auth_stores[auth_key] = auth
+        browser = await self._checkout(auth_key)
+        browser.uses += 1
+        self._in_use.add(browser.browser_id)
+        try:
+            yield browser
+        finally:
+            self._in_use.discard(browser.browser_id)
+            self._release(browser)
+
+    async def _checkout(self, auth_key: Optional[str] = None) -> PooledBrowser:
+        """Take the next idle instance, replacing any that fail the health check."""
+        while True:
+            browser = self._take_idle(auth_key) or await self._idle.get()
+            try:
+                healthy = await self.is_healthy(browser)
+            except BaseException:
+                self._idle.put_nowait(browser)
+                raise
+            if healthy and browser.auth_key != auth_key:
+                rebound = await self._rebind(browser, auth_key)
+                if rebound is None:
+                    continue
+                return rebound
+            if healthy and browser.state_generation != self._auth_for(browser.auth_key)[0]:
+                # Rotated credentials: the context's init script still seeds the old
+                # localStorage, so relaunch it rather than swapping cookies in place.
+                self._recycles += 1
+                logger.info(
+                    "Relaunching pooled browser for new auth state", browser_id=browser.browser_id
+                )
+                relaunched = await self._replace(browser, browser.auth_key)
+                if relaunched is None:
+                    continue
+                return relaunched
+            if healthy:
+                return browser
+            self._health_failures += 1
+            logger.warning("Replacing unhealthy pooled browser", browser_id=browser.browser_id)
+            self._spawn(self._recycle(browser))
+
+    def _take_idle(self, auth_key: Optional[str]) -> Optional[PooledBrowser]:
+        """Take an idle instance already bound to auth_key, keeping the others in order."""
+        held: list[PooledBrowser] = []
+        match = None
+        while not self._idle.empty():
+            browser = self._idle.get_nowait()
+            if match is None and browser.auth_key == auth_key:
+                match = browser
+            else:
+                held.append(browser)
+        for browser in held:
+            self._idle.put_nowait(browser)
+        return match
+
+    async def _rebind(
+        self, browser: PooledBrowser, auth_key: Optional[str]
+    ) -> Optional[PooledBrowser]:
+        """Relaunch an instance for another account; None when the launch failed."""
+        self._rebinds += 1
+        logger.info("Rebinding pooled browser to another account", browser_id=browser.browser_id)
+        return await self._replace(browser, auth_key)
+
+    async def _replace(
+        self, browser: PooledBrowser, auth_key: Optional[str]
+    ) -> Optional[PooledBrowser]:
+        """Close an instance and launch a fresh one for auth_key; None when the launch failed."""
+        await self._close(browser)
+        try:
+            return await self._launch(auth_key)
+        except Exception as e:
+            logger.warning("Failed to launch pooled browser for account", error=str(e))
+            self._spawn(self._relaunch(auth_key))
+            return None
+        except BaseException:
+            self._spawn(self._relaunch(auth_key))
+            raise
+
+    def _auth_for(self, auth_key: Optional[str]) -> tuple[int, Optional[dict[str, Any]]]:
+        """The current (generation, storage state) for instances bound to auth_key."""
+        store = self._auth_stores.get(auth_key) if auth_key is not None else None
+        if store is None:
+            return self._state_generation, self.storage_state
+        storage_state = store.get()  # loads the store on first use, bumping its version
+        return store.snapshot.version, storage_state
+
+    @property
+    def state_generation(self) -> int:
+        """Bumped on every set_storage_state; browsers launched earlier are stale."""
+        return self._state_generation
+
+    def set_storage_state(self, storage_state: Optional[dict[str, Any]]) -> None:
+        """
+        Switch to a new storage state without restarting the pool.
+
+        Idle contexts launched with the old state are relaunched when next
+        checked out, busy ones when released, so none keeps the old localStorage.
+        """
+        self.storage_state = storage_state
+        self._state_generation += 1
+        logger.info("Browser pool auth state updated", generation=self._state_generation)
+
+    def _release(self, browser: PooledBrowser) -> None:
+        """Return an instance to the pool, recycling it once it is worn out."""
+        if self._closed:
+            self._spawn(self._close(browser))
+        elif (
+            browser.uses >= self.max_uses
+            or browser.state_generation != self._auth_for(browser.auth_key)[0]
+        ):
+            # A context launched before an auth state swap still seeds the old localStorage.
+            self._spawn(self._recycle(browser))
+        else:
+            self._spawn(self._reset(browser))
+
+    async def _reset(self, browser: PooledBrowser) -> None:
+        """Bring a used context back to the authenticated dashboard, or recycle it."""
+        try:
+            await self._prepare_context(browser)
+            self._resets += 1
+            self._idle.put_nowait(browser)
+        except Exception as e:
+            self._reset_failures += 1
+            logger.warning("Pooled context reset failed", browser_id=browser.browser_id, error=str(e))
+            await self._recycle(browser)
+
+    async def _prepare_context(self, browser: PooledBrowser) -> None:
+        """
+        Leave a single tab on the warm URL with the storage state applied.
+
+        Cookies are re-applied on every reset so a run that logged out or
+        cleared cookies can't leak into the next one.
+        """
+        context = browser.context
+        if context is None:
+            return
+        storage_state = self._auth_for(browser.auth_key)[1]
+        if storage_state is not None:
+            await context.clear_cookies()
+            await context.add_cookies(storage_state["cookies"])
+        pages = list(context.pages)
+        page = pages[0] if pages else await context.new_page()
+        for extra in pages[1:]:
+            await extra.close()
+        if storage_state is not None:
+            await page.goto(self.warm_url, wait_until="domcontentloaded", timeout=DEFAULT_TIMEOUT)
+
+    async def _recycle(self, browser: PooledBrowser) -> None:
+        self._recycles += 1
+        logger.info("Recycling pooled browser", browser_id=browser.browser_id, uses=browser.uses)
+        await self._close(browser)
+        await self._relaunch(browser.auth_key)
+
+    async def _relaunch(self, auth_key: Optional[str]) -> None:
+        # Keep retrying so a transient launch failure doesn't shrink the pool for good.
+        while not self._closed:
+            try:
+                self._idle.put_nowait(await self._launch(auth_key))
+                return
+            except Exception as e:
+                logger.error("Failed to relaunch pooled browser", error=str(e))
+                await asyncio.sleep(self.health_interval_sec)
+
+    def _spawn(self, coro: Any) -> None:
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def is_healthy(self, browser: PooledBrowser) -> bool:
+        """Check that the instance still answers on its CDP endpoint."""
+        try:
+            async with httpx.AsyncClient(timeout=self.health_timeout_sec) as client:
+                response = await client.get(f"{browser.cdp_url}/json/version")
+            return response.status_code == 200
+        except Exception:
+            return False
+
+    async def _health_loop(self) -> None:
+        """Periodically probe idle instances and replace dead ones."""
+        while True:
+            await asyncio.sleep(self.health_interval_sec)
+            for _ in range(self._idle.qsize()):
+                try:
+                    browser = self._idle.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                if await self.is_healthy(browser):
+                    self._idle.put_nowait(browser)
+                    continue
+                self._health_failures += 1
+                logger.warning("Pooled browser failed health check", browser_id=browser.browser_id)
+                self._spawn(self._recycle(browser))
+
+    async def _launch(self, auth_key: Optional[str] = None) -> PooledBrowser:
+        """Launch one Chromium instance with a CDP endpoint."""
+        self._next_id += 1
+        port = _free_port()
+        user_data_dir = tempfile.mkdtemp(prefix="mcp-browser-")
+        generation, storage_state = self._auth_for(auth_key)
+        browser = PooledBrowser(
+            browser_id=self._next_id,
+            port=port,
+            user_data_dir=user_data_dir,
+            auth_key=auth_key,
+            state_generation=generation,
+        )
+        browser.context = await self._playwright.chromium.launch_persistent_context(
+            user_data_dir,
+            headless=self.headless,
+            viewport={"width": self.window_w, "height": self.window_h},
+            args=[
+                f"--remote-debugging-port={port}",
+                f"--window-size={self.window_w},{self.window_h}",
+            ],
+        )
+        self._launches += 1
+        try:
+            browser.blocker = await install_request_blocking(browser.context)
+            browser.preview = install_preview_capture(browser.context)
+            if storage_state is not None:
+                await browser.context.add_init_script(
+                    local_storage_script(storage_state["origins"])
+                )
+            await self._prepare_context(browser)
+        except Exception:
+            await self._close(browser)
+            raise
+        logger.info("Launched pooled browser", browser_id=browser.browser_id, cdp_url=browser.cdp_url)
+        return browser
+
+    async def _close(self, browser: PooledBrowser) -> None:
+        try:
+            if browser.context is not None:
+                await browser.context.close()
+        except Exception as e:
+            logger.debug("Failed to close pooled browser", browser_id=browser.browser_id, error=str(e))
+        finally:
+            await run_blocking(shutil.rmtree, browser.user_data_dir, ignore_errors=True)
+
+    def stats(self) -> dict[str, Any]:
+        """Pool occupancy for /health."""
+        return {
+            "size": self.size,
+            "idle": self._idle.qsize(),
+            "in_use": len(self._in_use),
+            "max_uses": self.max_uses,
+            "launches": self._launches,
+            "recycles": self._recycles,
+            "health_failures": self._health_failures,
+            "authenticated": self.storage_state is not None,
+            "resets": self._resets,
+            "auth_state_generation": self._state_generation,
+            "account_rebinds": self._rebinds,
+            "reset_failures": self._reset_failures,
+        }
+
+
+_browser_pool: Optional[BrowserPool] = None
+
+
+def get_browser_pool() -> Optional[BrowserPool]:
+    """Return the gateway's browser pool, or None when pooling is disabled."""
+    return _browser_pool
+
+
+def set_browser_pool(pool: Optional[BrowserPool]) -> None:
+    global _browser_pool
+    _browser_pool = pool
+
+
+def create_browser_pool() -> Optional[BrowserPool]:
+    """Build a pool from the settings, or None when MCP_BROWSER_POOL_SIZE is 0."""
+    settings = get_settings()
+    if settings.browser_pool_size <= 0:
+        return None
+    return BrowserPool(
+        size=settings.browser_pool_size,
+        max_uses=settings.browser_pool_max_uses,
+        headless=settings.browser_headless,
+        window_w=settings.browser_window_width,
+        window_h=settings.browser_window_height,
+        health_interval_sec=settings.browser_pool_health_interval_sec,
+        storage_state=current_storage_state(),
+    )
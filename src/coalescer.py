@@ -0,0 +1,141 @@
+"""
+Single-flight coalescing of identical browser agent runs.
+
+Retries and double-submits routinely send the same task while the first run
+is still going. Runs are keyed by the caller plus either an explicit
+Idempotency-Key or a hash of the normalized task and context; a duplicate
+attaches to the in-flight run's future instead of starting another browser
+session. Successful outputs are then kept in a small TTL/LRU cache so late
+duplicates get the same result too. Failures are shared with callers already
+waiting but never cached, so a genuine retry runs again.
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Optional
+
+import structlog
+
+from src.settings import Settings, get_settings
+
+logger = structlog.get_logger(__name__)
+
+
+@dataclass
+class Flight:
+    """One logical run that identical requests share."""
+
+    run_id: str
+    future: "asyncio.Future[Any]"
+    finished_at: Optional[float] = None
+
+    @property
+    def done(self) -> bool:
+        return self.future.done()
+
+    async def result(self) -> Any:
+        """Wait for the shared output without letting one waiter cancel it for all."""
+        return await asyncio.shield(self.future)
+
+    @property
+    def abandoned(self) -> bool:
+        """The leading run ended without output, e.g. its request went away."""
+        return self.future.cancelled()
+
+
+def _normalize_task(task: str) -> str:
+    return " ".join(task.split())
+
+
+class RunCoalescer:
+    """In-flight dedup plus a TTL/LRU cache of successful outputs."""
+
+    def __init__(self, ttl_sec: float = 300.0, max_entries: int = 1000) -> None:
+        self.ttl_sec = ttl_sec
+        self.max_entries = max(1, max_entries)
+        self._in_flight: dict[str, Flight] = {}
+        self._cache: OrderedDict[str, Flight] = OrderedDict()
+        self._coalesced = 0
+        self._cache_hits = 0
+
+    @staticmethod
+    def key_for(
+        client_key: str,
+        task: str,
+        context: Optional[dict[str, Any]] = None,
+        idempotency_key: Optional[str] = None,
+        config: Optional[dict[str, Any]] = None,
+    ) -> str:
+        """Dedup key scoped to the caller, so results are never shared across clients."""
+        if idempotency_key:
+            return f"{client_key}:idem:{idempotency_key[:256]}"
+        fields: dict[str, Any] = {"task": _normalize_task(task), "context": context or {}}
+        if config:
+            # Runs with different settings are different runs.
+            fields["config"] = config
+        body = json.dumps(fields, sort_keys=True, default=str)
+        return f"{client_key}:task:{hashlib.sha256(body.encode()).hexdigest()}"
+
+    def get(self, key: str) -> Optional[Flight]:
+        """Return the in-flight or cached run for key, if any."""
+        flight = self._in_flight.get(key)
+        if flight is not None:
+            self._coalesced += 1
+            return flight
+        flight = self._cache.get(key)
+        if flight is None:
+            return None
+        if flight.finished_at is None or time.time() - flight.finished_at > self.ttl_sec:
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        self._cache_hits += 1
+        return flight
+
+    def begin(self, key: str, run_id: str) -> Flight:
+        flight = Flight(run_id=run_id, future=asyncio.get_running_loop().create_future())
+        self._in_flight[key] = flight
+        return flight
+
+    def complete(self, key: str, flight: Flight, output: Any) -> None:
+        """Hand the output to every waiter and cache it if it succeeded."""
+        if self._in_flight.get(key) is flight:
+            del self._in_flight[key]
+        if flight.future.done():
+            return
+        flight.future.set_result(output)
+        flight.finished_at = time.time()
+        if self.ttl_sec > 0 and getattr(output, "ok", False):
+            self._cache[key] = flight
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def abandon(self, key: str, flight: Flight) -> None:
+        """Drop a run that ended without output (e.g. cancelled); waiters are cancelled too."""
+        if self._in_flight.get(key) is flight:
+            del self._in_flight[key]
+        if not flight.future.done():
+            flight.future.cancel()
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "in_flight": len(self._in_flight),
+            "cached": len(self._cache),
+            "coalesced": self._coalesced,
+            "cache_hits": self._cache_hits,
+            "ttl_sec": self.ttl_sec,
+        }
+
+
+def create_coalescer(settings: Optional[Settings] = None) -> RunCoalescer:
+    """Build the coalescer from a settings snapshot (the current one by default)."""
+    settings = settings or get_settings()
+    return RunCoalescer(ttl_sec=settings.coalesce_ttl_sec, max_entries=settings.coalesce_cache_max)
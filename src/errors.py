@@ -0,0 +1,250 @@
+"""
+Typed agent errors and the retry policy they drive.
+
+The runner turns every failure into an AgentError carrying an ErrorCode, so
+the retry loop and the API response agree on what went wrong. Exception types
+are classified first; messages only when the failure arrives as text (the
+agent's history errors). Playwright's own timeouts (an element or navigation
+that didn't arrive in time) stay retryable; only the run's time budget running
+out is TIMEOUT_BUILD. AUTH_EXPIRED needs a real session signal (a redirect to
+the login page, an HTTP 401/403), since it quarantines the account. Each code
+has a RetryPolicy: expired sessions and configuration errors are never
+retried, network errors back off exponentially with jitter. A process-wide
+RetryBudget caps retries to a fraction of recent attempts so that, during an
+outage, retries can't multiply the load.
+"""
+
+import asyncio
+import random
+import re
+import time
+from collections import deque
+from dataclasses import dataclass
+from enum import Enum
+from typing import Awaitable, Callable, Optional
+
+import httpx
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+from src.settings import Settings, get_settings
+
+
+class ErrorCode(str, Enum):
+    """Error codes reported in RunOutput.error_code."""
+
+    TIMEOUT_BUILD = "TIMEOUT_BUILD"
+    AUTH_EXPIRED = "AUTH_EXPIRED"
+    CONFIG_ERROR = "CONFIG_ERROR"
+    UI_CHANGED = "UI_CHANGED"
+    NETWORK_ERROR = "NETWORK_ERROR"
+    UNKNOWN_ERROR = "UNKNOWN_ERROR"
+
+
+class AgentError(Exception):
+    """A classified agent failure."""
+
+    code = ErrorCode.UNKNOWN_ERROR
+
+
+class AgentTimeout(AgentError, TimeoutError):
+    code = ErrorCode.TIMEOUT_BUILD
+
+
+class AuthExpired(AgentError):
+    code = ErrorCode.AUTH_EXPIRED
+
+
+class ConfigError(AgentError):
+    code = ErrorCode.CONFIG_ERROR
+
+
+class UiChanged(AgentError):
+    code = ErrorCode.UI_CHANGED
+
+
+class NetworkError(AgentError):
+    code = ErrorCode.NETWORK_ERROR
+
+
+_BY_CODE: dict[ErrorCode, type[AgentError]] = {
+    cls.code: cls for cls in (AgentTimeout, AuthExpired, ConfigError, UiChanged, NetworkError)
+}
+
+# Message patterns, checked in order, for failures that only arrive as text.
+_MESSAGE_PATTERNS: list[tuple[ErrorCode, "re.Pattern[str]"]] = [
+    # Playwright's "Timeout 30000ms exceeded": a wait on the page, not the run's budget.
+    (ErrorCode.UI_CHANGED, re.compile(r"timeout \d+ ?ms exceeded")),
+    (
+        ErrorCode.CONFIG_ERROR,
+        re.compile(r"api[ _-]?key|no module named|not installed|unknown (llm )?provider"),
+    ),
+    (
+        ErrorCode.NETWORK_ERROR,
+        re.compile(
+            r"network|connection|net::err_|econn|name resolution|rate limit|\b429\b|\b50[234]\b"
+        ),
+    ),
+    (ErrorCode.TIMEOUT_BUILD, re.compile(r"timed out|did not complete within")),
+    (
+        ErrorCode.AUTH_EXPIRED,
+        re.compile(
+            r"redirected to (the )?(log ?in|sign ?in)|/(log ?in|sign ?in|auth)\b|log ?in failed"
+            r"|not logged in|session (has )?expired|unauthori[sz]ed"
+            # 401/403 only as an HTTP status: "Element with index 401" is a stale index.
+            r"|\b(http|status( code)?|error code)[ :=]*40[13]\b"
+            r"|\b40[13] (unauthori[sz]ed|forbidden)"
+        ),
+    ),
+    (ErrorCode.UI_CHANGED, re.compile(r"selector|element|\bui\b|not found on this page")),
+]
+
+
+def classify_message(message: str) -> ErrorCode:
+    """Error code for a failure known only by its message."""
+    text = message.lower()
+    for code, pattern in _MESSAGE_PATTERNS:
+        if pattern.search(text):
+            return code
+    return ErrorCode.UNKNOWN_ERROR
+
+
+def classify_error(error: BaseException) -> AgentError:
+    """Return error itself when already classified, else an AgentError wrapping it."""
+    if isinstance(error, AgentError):
+        return error
+    if isinstance(error, PlaywrightTimeoutError):
+        code = ErrorCode.UI_CHANGED
+    elif isinstance(error, (asyncio.TimeoutError, TimeoutError)):
+        code = ErrorCode.TIMEOUT_BUILD
+    elif isinstance(error, (ConnectionError, httpx.TransportError)):
+        code = ErrorCode.NETWORK_ERROR
+    elif isinstance(error, ImportError):
+        code = ErrorCode.CONFIG_ERROR
+    else:
+        code = classify_message(str(error))
+    classified = _BY_CODE.get(code, AgentError)(str(error) or type(error).__name__)
+    classified.__cause__ = error
+    return classified
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """Whether a code is retried and how long to wait before retry number n (1-based)."""
+
+    retryable: bool
+    base_delay_sec: float = 2.0
+    max_delay_sec: float = 30.0
+    exponential: bool = False
+    jitter: bool = False
+
+    def delay(self, retry_number: int) -> float:
+        delay = self.base_delay_sec
+        if self.exponential:
+            delay = min(self.max_delay_sec, self.base_delay_sec * 2 ** (retry_number - 1))
+        if self.jitter:
+            # Full jitter: spread simultaneous retries over the whole window.
+            delay = random.uniform(0, delay)
+        return delay
+
+
+RETRY_POLICIES: dict[ErrorCode, RetryPolicy] = {
+    ErrorCode.AUTH_EXPIRED: RetryPolicy(retryable=False),
+    ErrorCode.CONFIG_ERROR: RetryPolicy(retryable=False),
+    # A run that hit the agent timeout has already spent its time budget.
+    ErrorCode.TIMEOUT_BUILD: RetryPolicy(retryable=False),
+    ErrorCode.NETWORK_ERROR: RetryPolicy(
+        retryable=True, base_delay_sec=1.0, exponential=True, jitter=True
+    ),
+    ErrorCode.UI_CHANGED: RetryPolicy(retryable=True, base_delay_sec=2.0),
+    ErrorCode.UNKNOWN_ERROR: RetryPolicy(
+        retryable=True, base_delay_sec=2.0, exponential=True, jitter=True
+    ),
+}
+
+
+def retry_policy(code: ErrorCode) -> RetryPolicy:
+    return RETRY_POLICIES.get(code, RETRY_POLICIES[ErrorCode.UNKNOWN_ERROR])
+
+
+class RetryBudget:
+    """
+    Allow retries up to ratio x first attempts in a sliding window.
+
+    min_retries are always allowed per window so a quiet server can still
+    retry the occasional failure. In a worker process the budget forwards to
+    the gateway's, so the ratio holds across all workers.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_retries: int = 3, window_sec: float = 60.0) -> None:
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window_sec = window_sec
+        self._attempts: deque[float] = deque()
+        self._retries: deque[float] = deque()
+        self._denied = 0
+        self._forward: Optional[tuple[Callable[[], None], Callable[[], Awaitable[bool]]]] = None
+
+    def forward_to(
+        self, record_attempt: Callable[[], None], spend: Callable[[], Awaitable[bool]]
+    ) -> None:
+        """Let another process's budget count attempts and decide retries."""
+        self._forward = (record_attempt, spend)
+
+    def _prune(self, now: float) -> None:
+        cutoff = now - self.window_sec
+        for events in (self._attempts, self._retries):
+            while events and events[0] < cutoff:
+                events.popleft()
+
+    def record_attempt(self) -> None:
+        """Count a run's first attempt."""
+        if self._forward is not None:
+            self._forward[0]()
+            return
+        now = time.monotonic()
+        self._prune(now)
+        self._attempts.append(now)
+
+    def try_spend(self) -> bool:
+        """Take one retry from the budget; False when it is exhausted."""
+        now = time.monotonic()
+        self._prune(now)
+        allowed = max(self.min_retries, int(self.ratio * len(self._attempts)))
+        if len(self._retries) >= allowed:
+            self._denied += 1
+            return False
+        self._retries.append(now)
+        return True
+
+    async def spend(self) -> bool:
+        """try_spend, answered by the forwarded-to budget when there is one."""
+        if self._forward is not None:
+            return await self._forward[1]()
+        return self.try_spend()
+
+    def stats(self) -> dict[str, float]:
+        self._prune(time.monotonic())
+        return {
+            "attempts_in_window": len(self._attempts),
+            "retries_in_window": len(self._retries),
+            "denied_total": self._denied,
+            "ratio": self.ratio,
+        }
+
+
+def create_retry_budget(settings: Optional[Settings] = None) -> RetryBudget:
+    """Build the budget from MCP_RETRY_BUDGET_RATIO, _MIN and _WINDOW_SEC."""
+    settings = settings or get_settings()
+    return RetryBudget(
+        ratio=settings.retry_budget_ratio,
+        min_retries=settings.retry_budget_min,
+        window_sec=settings.retry_budget_window_sec,
+    )
+
+
+retry_budget = create_retry_budget()
+
+
+def error_code_of(error: Optional[BaseException]) -> Optional[str]:
+    """The code of a classified error, for result dictionaries."""
+    return error.code.value if isinstance(error, AgentError) else None
@@ -0,0 +1,168 @@
+"""
+Live progress events for browser agent runs.
+
+Each run gets a RunChannel that fans events (agent steps, URL changes, the
+preview URL, the final output) out to any number of subscribers. Every
+subscriber has its own bounded buffer: when a slow consumer falls behind, its
+oldest undelivered events are dropped rather than letting memory grow. A short
+replay history lets clients that connect after submission catch up.
+
+The runner publishes through ``emit_run_event``, which forwards to the sink
+bound to the current task via a context variable, so agent code needs no
+reference to the channel.
+"""
+
+import asyncio
+import itertools
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Optional
+
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+EventSink = Callable[[str, dict[str, Any]], None]
+
+run_event_sink: ContextVar[Optional[EventSink]] = ContextVar("run_event_sink", default=None)
+
+
+def emit_run_event(event: str, data: dict[str, Any]) -> None:
+    """Publish an event for the run executing in the current context, if any."""
+    sink = run_event_sink.get()
+    if sink is None:
+        return
+    try:
+        sink(event, data)
+    except Exception as e:
+        logger.debug("Failed to emit run event", run_event=event, error=str(e))
+
+
+@dataclass(frozen=True)
+class RunEvent:
+    """A single progress event."""
+
+    id: int
+    event: str
+    data: dict[str, Any]
+
+
+class Subscription:
+    """One consumer's bounded view of a channel."""
+
+    def __init__(self, channel: "RunChannel", buffer_size: int) -> None:
+        self._channel = channel
+        self._buffer: deque[RunEvent] = deque(maxlen=buffer_size)
+        self._wakeup = asyncio.Event()
+        self._closed = False
+        self.dropped = 0
+
+    def _push(self, event: RunEvent) -> None:
+        if len(self._buffer) == self._buffer.maxlen:
+            self.dropped += 1
+        self._buffer.append(event)
+        self._wakeup.set()
+
+    def _close(self) -> None:
+        self._closed = True
+        self._wakeup.set()
+
+    async def events(
+        self, heartbeat_sec: Optional[float] = None
+    ) -> AsyncIterator[Optional[RunEvent]]:
+        """
+        Yield buffered events until the channel closes.
+
+        With heartbeat_sec, yields None whenever no event arrived for that long,
+        so transports can send keep-alives.
+        """
+        try:
+            while True:
+                while self._buffer:
+                    yield self._buffer.popleft()
+                if self._closed:
+                    return
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), heartbeat_sec)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            self._channel._unsubscribe(self)
+
+    def __aiter__(self) -> AsyncIterator[Optional[RunEvent]]:
+        return self.events()
+
+
+class RunChannel:
+    """Fan-out of one run's events to its subscribers."""
+
+    def __init__(self, run_id: str, history_size: int = 50, buffer_size: int = 100) -> None:
+        self.run_id = run_id
+        self.buffer_size = buffer_size
+        self._history: deque[RunEvent] = deque(maxlen=history_size)
+        self._subscribers: set[Subscription] = set()
+        self._ids = itertools.count(1)
+        self.closed = False
+
+    def publish(self, event: str, data: dict[str, Any]) -> None:
+        if self.closed:
+            return
+        item = RunEvent(id=next(self._ids), event=event, data=data)
+        self._history.append(item)
+        for subscriber in self._subscribers:
+            subscriber._push(item)
+
+    def subscribe(self) -> Subscription:
+        """Attach a consumer; it first receives the replay history."""
+        subscription = Subscription(self, self.buffer_size)
+        for item in self._history:
+            subscription._push(item)
+        if self.closed:
+            subscription._close()
+        else:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription: Subscription) -> None:
+        self._subscribers.discard(subscription)
+
+    def close(self) -> None:
+        """End the stream for every subscriber."""
+        self.closed = True
+        for subscriber in self._subscribers:
+            subscriber._close()
+        self._subscribers.clear()
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+
+class RunEventBus:
+    """Registry of open run channels."""
+
+    def __init__(self, history_size: int = 50, buffer_size: int = 100) -> None:
+        self.history_size = history_size
+        self.buffer_size = buffer_size
+        self._channels: dict[str, RunChannel] = {}
+
+    def open(self, run_id: str) -> RunChannel:
+        channel = RunChannel(run_id, self.history_size, self.buffer_size)
+        self._channels[run_id] = channel
+        return channel
+
+    def get(self, run_id: str) -> Optional[RunChannel]:
+        return self._channels.get(run_id)
+
+    def close(self, run_id: str) -> None:
+        channel = self._channels.pop(run_id, None)
+        if channel is not None:
+            channel.close()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "open_channels": len(self._channels),
+            "subscribers": sum(c.subscriber_count for c in self._channels.values()),
+        }
@@ -0,0 +1,222 @@
+"""
+Runs spread over the gateway processes on one host through the shared job queue.
+
+With a shared MCP_JOB_BACKEND, the process (node) that accepts a run queues it
+(FleetDispatcher.run) and waits for its result, while every node's claim loop
+takes queued runs whenever it has free browser capacity (MCP_AGENT_CONCURRENCY
+per node) and the shared limit allows, executes them with its own settings
+plus the run's overrides, and stores the result. Step events reach the run's
+channel when the accepting node is the one executing the run.
+"""
+
+import asyncio
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Optional
+
+import structlog
+
+from src.errors import ErrorCode, classify_error
+from src.events import EventSink, run_event_sink
+from src.job_queue import Job, JobBackend, claim_lease_sec, default_node_id, get_job_backend
+from src.run_config import RunConfig
+from src.settings import Settings, get_settings
+
+logger = structlog.get_logger(__name__)
+
+Runner = Callable[[str, Optional[dict[str, Any]], RunConfig], Awaitable[dict[str, Any]]]
+
+
+class FleetDispatcher:
+    """Queues accepted runs and executes claimed ones on this node."""
+
+    def __init__(
+        self,
+        backend: JobBackend,
+        runner: Runner,
+        node_id: str,
+        capacity: int,
+        global_limit: int = 0,
+        poll_sec: float = 0.5,
+        lease_sec: float = 3600.0,
+    ) -> None:
+        self.backend = backend
+        self.runner = runner
+        self.node_id = node_id
+        self.capacity = max(1, capacity)
+        self.global_limit = global_limit
+        self.poll_sec = poll_sec
+        self.lease_sec = lease_sec
+        self._running: dict[str, asyncio.Task[None]] = {}
+        # Sinks of runs accepted here, so runs this node also executes stream their steps.
+        self._sinks: dict[str, Optional[EventSink]] = {}
+        self._wake = asyncio.Event()
+        self._finished = asyncio.Condition()
+        self._task: Optional[asyncio.Task[None]] = None
+        self._submitted = 0
+        self._executed = 0
+
+    async def run(
+        self,
+        task: str,
+        context: Optional[dict[str, Any]] = None,
+        overrides: Optional[dict[str, Any]] = None,
+        job_id: Optional[str] = None,
+    ) -> dict[str, Any]:
+        """Queue a run for any node and wait for its result."""
+        job = Job(
+            job_id=job_id or str(uuid.uuid4()),
+            task=task,
+            context=context,
+            overrides=overrides,
+            created_at=time.time(),
+        )
+        self._sinks[job.job_id] = run_event_sink.get()
+        try:
+            await self.backend.call(self.backend.submit, job)
+            self._submitted += 1
+            self._wake.set()
+            while True:
+                current = await self.backend.call(self.backend.get, job.job_id)
+                if current is None:
+                    raise RuntimeError(f"Job {job.job_id} disappeared from the queue")
+                if current.status == "done" and current.result is not None:
+                    return current.result
+                # Runs finished on this node wake their callers at once; remote ones are polled.
+                try:
+                    async with self._finished, asyncio.timeout(self.poll_sec):
+                        await self._finished.wait()
+                except TimeoutError:
+                    pass
+        except asyncio.CancelledError:
+            # Shielded so the cancellation is recorded even though the caller is gone.
+            await asyncio.shield(self.backend.call(self.backend.cancel, job.job_id))
+            raise
+        finally:
+            self._sinks.pop(job.job_id, None)
+
+    async def _execute(self, job: Job) -> None:
+        sink = self._sinks.get(job.job_id)
+        if sink is not None:
+            run_event_sink.set(sink)
+        try:
+            config = RunConfig.from_settings().with_overrides(job.overrides)
+            result = await self.runner(job.task, job.context, config)
+        except asyncio.CancelledError:
+            result = {
+                "ok": False,
+                "result_text": "",
+                "error": "Run cancelled",
+                "error_code": ErrorCode.UNKNOWN_ERROR.value,
+            }
+        except Exception as e:
+            error = classify_error(e)
+            result = {
+                "ok": False,
+                "result_text": "",
+                "error": str(error),
+                "error_code": error.code.value,
+            }
+        try:
+            await self.backend.call(self.backend.finish, job.job_id, result)
+        except Exception as e:
+            logger.warning("Failed to store job result", job_id=job.job_id, error=str(e))
+        finally:
+            self._running.pop(job.job_id, None)
+            self._executed += 1
+            self._wake.set()
+        async with self._finished:
+            self._finished.notify_all()
+
+    async def _claim_ready(self) -> None:
+        """Claim queued runs while this node has capacity."""
+        while len(self._running) < self.capacity:
+            job = await self.backend.call(
+                self.backend.claim, self.node_id, self.global_limit, self.lease_sec
+            )
+            if job is None:
+                return
+            logger.info("Claimed job", job_id=job.job_id, node=self.node_id)
+            self._running[job.job_id] = asyncio.create_task(self._execute(job))
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.backend.call(self.backend.expire)
+                await self._claim_ready()
+                for job_id in await self.backend.call(
+                    self.backend.cancel_requested, list(self._running)
+                ):
+                    task = self._running.get(job_id)
+                    if task is not None:
+                        task.cancel()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Job queue poll failed", node=self.node_id, error=str(e))
+            self._wake.clear()
+            try:
+                async with asyncio.timeout(self.poll_sec):
+                    await self._wake.wait()
+            except TimeoutError:
+                pass
+
+    def resize(self, capacity: int, global_limit: int) -> None:
+        self.capacity = max(1, capacity)
+        self.global_limit = global_limit
+        self._wake.set()
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        """Stop claiming and finish (as cancelled) the runs executing here."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        running = list(self._running.values())
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "node_id": self.node_id,
+            "capacity": self.capacity,
+            "global_limit": self.global_limit,
+            "running_here": len(self._running),
+            "submitted": self._submitted,
+            "executed": self._executed,
+        }
+
+
+_fleet: Optional[FleetDispatcher] = None
+
+
+def get_fleet() -> Optional[FleetDispatcher]:
+    """Return the node's dispatcher, or None when runs execute where they are accepted."""
+    return _fleet
+
+
+def set_fleet(fleet: Optional[FleetDispatcher]) -> None:
+    global _fleet
+    _fleet = fleet
+
+
+def create_fleet(runner: Runner, settings: Optional[Settings] = None) -> Optional[FleetDispatcher]:
+    """Build the dispatcher on the shared backend; None without one."""
+    backend = get_job_backend()
+    if backend is None:
+        return None
+    settings = settings or get_settings()
+    return FleetDispatcher(
+        backend,
+        runner,
+        node_id=default_node_id(settings),
+        capacity=settings.agent_concurrency,
+        global_limit=settings.fleet_max_concurrency,
+        poll_sec=settings.job_poll_sec,
+        lease_sec=claim_lease_sec(settings),
+    )
@@ -0,0 +1,463 @@
+"""
+Shared job queue for several gateway processes on one host.
+
+By default (MCP_JOB_BACKEND=memory) every gateway process (a "node" below) runs
+what it accepts, bounded by its own in-memory scheduler. With the SQLite
+backend, runs are written to a queue every process on the host can see: any
+process accepts a run, any process with free browser capacity claims and
+executes it (see src/fleet.py), and the shared limits live in the backend:
+
+- at most MCP_FLEET_MAX_CONCURRENCY runs execute across the processes at once;
+- each Lovable account runs at most MCP_ACCOUNT_MAX_CONCURRENCY runs in total,
+  through short account leases taken by the AccountPool.
+
+The only backend is SqliteJobBackend, on one SQLite file
+(``sqlite:///path/to/jobs.db``). SQLite's WAL mode needs shared memory between
+the processes using the file, so it refuses to open a file that a live gateway
+on another host is using; separate machines can't share runs. Claims and
+leases carry an expiry derived from the run timeout, so the work of a process
+that disappears is failed instead of being held forever.
+"""
+
+import abc
+import asyncio
+import contextlib
+import functools
+import json
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Iterator, Optional, TypeVar
+
+import structlog
+
+from src.errors import ErrorCode
+from src.settings import Settings, get_settings
+
+logger = structlog.get_logger(__name__)
+
+T = TypeVar("T")
+
+SQLITE_PREFIX = "sqlite:///"
+
+# A host that hasn't polled the SQLite queue for this long is taken to be gone.
+HOST_STALE_SEC = 60.0
+
+
+@dataclass
+class Job:
+    """One run in the shared queue."""
+
+    job_id: str
+    task: str
+    context: Optional[dict[str, Any]] = None
+    overrides: Optional[dict[str, Any]] = None
+    status: str = "queued"  # queued, running, done
+    node: Optional[str] = None
+    result: Optional[dict[str, Any]] = None
+    cancel_requested: bool = False
+    created_at: float = 0.0
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+
+class JobBackend(abc.ABC):
+    """
+    Where queued runs, their results and account leases are shared between nodes.
+
+    The methods block; code on the event loop goes through call(), which runs
+    them on the backend's own few threads, so queue polling and account leases
+    never wait behind agent work in the agent executor.
+    """
+
+    io_threads = 4
+    _executor: Optional[ThreadPoolExecutor] = None
+
+    async def call(self, method: Callable[..., T], *args: Any) -> T:
+        """Run a blocking backend method off the event loop."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.io_threads, thread_name_prefix="job-backend"
+            )
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(method, *args))
+
+    def close(self) -> None:
+        """Stop the call() threads."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    @abc.abstractmethod
+    def submit(self, job: Job) -> None:
+        """Queue a run."""
+
+    @abc.abstractmethod
+    def claim(self, node: str, limit: int, lease_sec: float) -> Optional[Job]:
+        """
+        Take the oldest queued run for node, or None.
+
+        Returns None while ``limit`` runs (0: no limit) are already running
+        fleet-wide. The claim expires after lease_sec unless finished.
+        """
+
+    @abc.abstractmethod
+    def finish(self, job_id: str, result: dict[str, Any]) -> None:
+        """Store a run's result; a no-op for runs already finished (e.g. expired)."""
+
+    @abc.abstractmethod
+    def get(self, job_id: str) -> Optional[Job]:
+        """A run by id, None once it has been dropped."""
+
+    @abc.abstractmethod
+    def cancel(self, job_id: str) -> None:
+        """Finish a queued run as cancelled, or ask the node running it to stop."""
+
+    @abc.abstractmethod
+    def cancel_requested(self, job_ids: list[str]) -> list[str]:
+        """The subset of job_ids whose callers have gone away."""
+
+    @abc.abstractmethod
+    def acquire_account(
+        self, node: str, account: str, max_concurrency: int, lease_sec: float
+    ) -> Optional[str]:
+        """A lease id when the account has fewer than max_concurrency live leases, else None."""
+
+    @abc.abstractmethod
+    def release_account(self, lease_id: str) -> None:
+        """Give an account lease back before it expires."""
+
+    @abc.abstractmethod
+    def expire(self) -> int:
+        """Fail runs whose claim expired and drop stale state; returns the runs failed."""
+
+    @abc.abstractmethod
+    def stats(self) -> dict[str, Any]:
+        """Queue depth and leases for /health."""
+
+
+def default_node_id(settings: Settings) -> str:
+    """This process's name in the queue: MCP_NODE_ID, else host and pid."""
+    return settings.node_id or f"{socket.gethostname()}-{os.getpid()}"
+
+
+def claim_lease_sec(settings: Settings) -> float:
+    """How long a claimed run (or account lease) may last before it is declared lost."""
+    return settings.agent_timeout_sec * (settings.agent_retry_max + 1) + 60.0
+
+
+def expired_result(node: Optional[str]) -> dict[str, Any]:
+    return {
+        "ok": False,
+        "result_text": "",
+        "error": f"Node {node} stopped responding while running the job",
+        "error_code": ErrorCode.UNKNOWN_ERROR.value,
+    }
+
+
+def cancelled_result() -> dict[str, Any]:
+    return {
+        "ok": False,
+        "result_text": "",
+        "error": "Run cancelled before it started",
+        "error_code": ErrorCode.UNKNOWN_ERROR.value,
+    }
+
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS jobs (
+        job_id TEXT PRIMARY KEY,
+        task TEXT NOT NULL,
+        context TEXT,
+        overrides TEXT,
+        status TEXT NOT NULL,
+        node TEXT,
+        result TEXT,
+        cancel_requested INTEGER NOT NULL DEFAULT 0,
+        created_at REAL NOT NULL,
+        started_at REAL,
+        finished_at REAL,
+        lease_until REAL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, created_at)",
+    """
+    CREATE TABLE IF NOT EXISTS account_leases (
+        lease_id TEXT PRIMARY KEY,
+        account TEXT NOT NULL,
+        node TEXT NOT NULL,
+        lease_until REAL NOT NULL
+    )
+    """,
+    "CREATE TABLE IF NOT EXISTS hosts (host TEXT PRIMARY KEY, seen_at REAL NOT NULL)",
+)
+
+
+class SqliteJobBackend(JobBackend):
+    """
+    JobBackend on a single SQLite file (WAL mode; one short connection per call).
+
+    Single host only. Every host that opens the file is recorded and
+    refreshed on each expire() poll; opening it while another host polled
+    within HOST_STALE_SEC raises ValueError rather than risking a corrupted
+    queue over a network filesystem.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        retention_sec: float = 3600.0,
+        busy_timeout_sec: float = 5.0,
+        host: Optional[str] = None,
+    ):
+        self.path = os.path.abspath(path)
+        self.retention_sec = retention_sec
+        self.busy_timeout_sec = busy_timeout_sec
+        self.host = host or socket.gethostname()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # WAL is persistent on the file and can't be switched inside a transaction.
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout_sec)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+        finally:
+            conn.close()
+        with self._transaction(immediate=True) as conn:
+            for statement in _SCHEMA:
+                conn.execute(statement)
+            other = conn.execute(
+                "SELECT host FROM hosts WHERE host != ? AND seen_at > ?",
+                (self.host, time.time() - HOST_STALE_SEC),
+            ).fetchone()
+            if other is not None:
+                raise ValueError(
+                    f"MCP_JOB_BACKEND {SQLITE_PREFIX}{self.path} is in use by host "
+                    f"{other['host']}; the SQLite backend serves one host only. If that "
+                    f"host has stopped, retry after {HOST_STALE_SEC:.0f}s"
+                )
+            self._seen(conn)
+
+    def _seen(self, conn: sqlite3.Connection) -> None:
+        conn.execute(
+            "INSERT OR REPLACE INTO hosts (host, seen_at) VALUES (?, ?)", (self.host, time.time())
+        )
+
+    def close(self) -> None:
+        """Stop the call() threads and let another host take the file over at once."""
+        super().close()
+        try:
+            with self._transaction() as conn:
+                conn.execute("DELETE FROM hosts WHERE host = ?", (self.host,))
+        except sqlite3.Error as e:
+            logger.warning("Failed to release the job queue file", error=str(e))
+
+    @contextlib.contextmanager
+    def _transaction(self, immediate: bool = False) -> Iterator[sqlite3.Connection]:
+        """A connection in one transaction; IMMEDIATE takes the write lock up front."""
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout_sec, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _job(row: sqlite3.Row) -> Job:
+        return Job(
+            job_id=row["job_id"],
+            task=row["task"],
+            context=json.loads(row["context"]) if row["context"] else None,
+            overrides=json.loads(row["overrides"]) if row["overrides"] else None,
+            status=row["status"],
+            node=row["node"],
+            result=json.loads(row["result"]) if row["result"] else None,
+            cancel_requested=bool(row["cancel_requested"]),
+            created_at=row["created_at"],
+            started_at=row["started_at"],
+            finished_at=row["finished_at"],
+        )
+
+    def submit(self, job: Job) -> None:
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO jobs (job_id, task, context, overrides, status, created_at)"
+                " VALUES (?, ?, ?, ?, 'queued', ?)",
+                (
+                    job.job_id,
+                    job.task,
+                    json.dumps(job.context) if job.context is not None else None,
+                    json.dumps(job.overrides) if job.overrides else None,
+                    job.created_at or time.time(),
+                ),
+            )
+
+    def claim(self, node: str, limit: int, lease_sec: float) -> Optional[Job]:
+        now = time.time()
+        with self._transaction(immediate=True) as conn:
+            if limit > 0:
+                (running,) = conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = 'running'"
+                ).fetchone()
+                if running >= limit:
+                    return None
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', node = ?, started_at = ?, lease_until = ?"
+                " WHERE job_id = ?",
+                (node, now, now + lease_sec, row["job_id"]),
+            )
+        job = self._job(row)
+        job.status, job.node, job.started_at = "running", node, now
+        return job
+
+    def finish(self, job_id: str, result: dict[str, Any]) -> None:
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'done', result = ?, finished_at = ?, lease_until = NULL"
+                " WHERE job_id = ? AND status != 'done'",
+                (json.dumps(result, default=str), time.time(), job_id),
+            )
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._transaction() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._job(row) if row is not None else None
+
+    def cancel(self, job_id: str) -> None:
+        with self._transaction(immediate=True) as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'done', result = ?, finished_at = ?"
+                " WHERE job_id = ? AND status = 'queued'",
+                (json.dumps(cancelled_result()), time.time(), job_id),
+            )
+            conn.execute(
+                "UPDATE jobs SET cancel_requested = 1 WHERE job_id = ? AND status = 'running'",
+                (job_id,),
+            )
+
+    def cancel_requested(self, job_ids: list[str]) -> list[str]:
+        if not job_ids:
+            return []
+        placeholders = ", ".join("?" for _ in job_ids)
+        with self._transaction() as conn:
+            rows = conn.execute(
+                f"SELECT job_id FROM jobs WHERE cancel_requested = 1"
+                f" AND job_id IN ({placeholders})",
+                job_ids,
+            ).fetchall()
+        return [row["job_id"] for row in rows]
+
+    def acquire_account(
+        self, node: str, account: str, max_concurrency: int, lease_sec: float
+    ) -> Optional[str]:
+        now = time.time()
+        with self._transaction(immediate=True) as conn:
+            (held,) = conn.execute(
+                "SELECT COUNT(*) FROM account_leases WHERE account = ? AND lease_until > ?",
+                (account, now),
+            ).fetchone()
+            if held >= max_concurrency:
+                return None
+            lease_id = str(uuid.uuid4())
+            conn.execute(
+                "INSERT INTO account_leases (lease_id, account, node, lease_until)"
+                " VALUES (?, ?, ?, ?)",
+                (lease_id, account, node, now + lease_sec),
+            )
+        return lease_id
+
+    def release_account(self, lease_id: str) -> None:
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM account_leases WHERE lease_id = ?", (lease_id,))
+
+    def expire(self) -> int:
+        now = time.time()
+        with self._transaction(immediate=True) as conn:
+            rows = conn.execute(
+                "SELECT job_id, node FROM jobs WHERE status = 'running' AND lease_until < ?",
+                (now,),
+            ).fetchall()
+            for row in rows:
+                conn.execute(
+                    "UPDATE jobs SET status = 'done', result = ?, finished_at = ?,"
+                    " lease_until = NULL WHERE job_id = ?",
+                    (json.dumps(expired_result(row["node"])), now, row["job_id"]),
+                )
+            conn.execute("DELETE FROM account_leases WHERE lease_until < ?", (now,))
+            self._seen(conn)
+            conn.execute(
+                "DELETE FROM jobs WHERE status = 'done' AND finished_at < ?",
+                (now - self.retention_sec,),
+            )
+        for row in rows:
+            logger.warning("Job claim expired", job_id=row["job_id"], node=row["node"])
+        return len(rows)
+
+    def stats(self) -> dict[str, Any]:
+        with self._transaction() as conn:
+            counts = dict(
+                conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+            )
+            running_by_node = dict(
+                conn.execute(
+                    "SELECT node, COUNT(*) FROM jobs WHERE status = 'running' GROUP BY node"
+                ).fetchall()
+            )
+            leases = dict(
+                conn.execute(
+                    "SELECT account, COUNT(*) FROM account_leases WHERE lease_until > ?"
+                    " GROUP BY account",
+                    (time.time(),),
+                ).fetchall()
+            )
+        return {
+            "backend": "sqlite",
+            "queued": counts.get("queued", 0),
+            "running": counts.get("running", 0),
+            "running_by_node": running_by_node,
+            "account_leases": leases,
+        }
+
+
+_job_backend: Optional[JobBackend] = None
+
+
+def get_job_backend() -> Optional[JobBackend]:
+    """Return the shared backend, or None when every node runs what it accepts."""
+    return _job_backend
+
+
+def set_job_backend(backend: Optional[JobBackend]) -> None:
+    global _job_backend
+    _job_backend = backend
+
+
+def create_job_backend(settings: Optional[Settings] = None) -> Optional[JobBackend]:
+    """
+    Build the backend named by MCP_JOB_BACKEND; None for ``memory``.
+
+    Raises ValueError when a SQLite file is already used by another host.
+    """
+    settings = settings or get_settings()
+    if settings.job_backend == "memory":
+        return None
+    if settings.job_backend.startswith(SQLITE_PREFIX):
+        return SqliteJobBackend(
+            settings.job_backend[len(SQLITE_PREFIX) :],
+            retention_sec=settings.job_retention_sec,
+        )
+    raise ValueError(f"Unknown MCP_JOB_BACKEND: {settings.job_backend}")
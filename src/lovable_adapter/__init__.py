@@ -14,6 +14,14 @@ from src.lovable_adapter.flows import (
     trigger_build,
     wait_for_build,
 )
+from src.lovable_adapter.router import (
+    FlowFailed,
+    FlowRequest,
+    failed_stage,
+    parse_flow_request,
+    resume_task,
+    run_project_flow,
+)
 from src.lovable_adapter.selectors import (
     BUILD_BUTTON_SELECTOR,
     LOGIN_EMAIL_SELECTOR,
@@ -22,6 +30,7 @@ from src.lovable_adapter.selectors import (
     PROJECT_NAME_INPUT_SELECTOR,
     PROMPT_INPUT_SELECTOR,
 )
+from src.lovable_adapter.settle import wait_for_page_settled
 
 __all__ = [
     # Selectors
@@ -38,4 +47,12 @@ __all__ = [
     "trigger_build",
     "wait_for_build",
     "extract_preview_url",
+    "wait_for_page_settled",
+    # Router
+    "FlowFailed",
+    "FlowRequest",
+    "failed_stage",
+    "parse_flow_request",
+    "resume_task",
+    "run_project_flow",
 ]
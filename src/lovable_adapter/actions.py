@@ -0,0 +1,117 @@
+"""
+Lovable-specific custom actions for the browser-use agent.
+
+Without these, the agent spends many steps finding the prompt box, clicking
+Build and polling for completion. Registering the adapter flows as high-level
+actions lets it do each of those in a single step. The page-level logic lives
+in plain coroutines so it can be tested without browser-use installed; the
+controller wiring imports browser-use lazily.
+"""
+
+from typing import Any, Optional
+
+from playwright.async_api import Page
+
+from src.lovable_adapter.flows import (
+    extract_preview_url,
+    paste_prompt,
+    trigger_build,
+    wait_for_build,
+)
+
+# Rough number of primitive agent steps (locate, type, click, poll...) each action replaces.
+ESTIMATED_STEPS_REPLACED = {
+    "lovable_submit_prompt": 3,
+    "lovable_wait_for_build": 5,
+    "lovable_get_preview_url": 2,
+}
+
+
+async def submit_prompt(page: Page, prompt: str) -> tuple[Optional[str], Optional[str]]:
+    """Paste the prompt and start the build; returns (content, error)."""
+    if not await paste_prompt(page, prompt):
+        return None, "Lovable prompt input not found on this page"
+    if not await trigger_build(page):
+        return None, "Lovable build button not found on this page"
+    return "Prompt submitted and build started", None
+
+
+async def await_build(page: Page, timeout_sec: int) -> tuple[Optional[str], Optional[str]]:
+    """Block until the build completes; returns (content, error)."""
+    if not await wait_for_build(page, timeout=timeout_sec * 1000):
+        return None, f"Lovable build did not complete within {timeout_sec}s"
+    return "Build complete", None
+
+
+async def read_preview_url(page: Page) -> tuple[Optional[str], Optional[str]]:
+    """Read the preview URL of the current project; returns (content, error)."""
+    preview_url = await extract_preview_url(page)
+    if not preview_url:
+        return None, "No Lovable preview URL found on this page"
+    return f"Preview URL: {preview_url}", None
+
+
+def count_lovable_actions(steps: list[dict[str, Any]]) -> dict[str, int]:
+    """Count custom-action calls in recorded agent steps."""
+    counts: dict[str, int] = {}
+    for step in steps:
+        for action in step.get("actions") or []:
+            for name in action:
+                if name in ESTIMATED_STEPS_REPLACED:
+                    counts[name] = counts.get(name, 0) + 1
+    return counts
+
+
+def step_report(steps: list[dict[str, Any]]) -> dict[str, Any]:
+    """Per-run step count with custom-action usage and the estimated steps they saved."""
+    counts = count_lovable_actions(steps)
+    return {
+        "agent_steps": len(steps),
+        "lovable_actions": counts,
+        "estimated_steps_saved": sum(
+            ESTIMATED_STEPS_REPLACED[name] * n for name, n in counts.items()
+        ),
+    }
+
+
+def build_lovable_controller() -> Any:
+    """Create a browser-use Controller with the Lovable actions registered."""
+    from browser_use.agent.views import ActionResult  # type: ignore[import-not-found]
+    from browser_use.controller.service import Controller  # type: ignore[import-not-found]
+    from pydantic import BaseModel, Field
+
+    class SubmitPromptParams(BaseModel):
+        prompt: str
+
+    class WaitForBuildParams(BaseModel):
+        timeout_sec: int = Field(default=300, ge=1, le=1800)
+
+    def _result(content: Optional[str], error: Optional[str]) -> Any:
+        if error:
+            return ActionResult(error=error)
+        return ActionResult(extracted_content=content, include_in_memory=True)
+
+    controller = Controller()
+
+    @controller.action(
+        "Lovable: type a prompt into the project's prompt box and start the build",
+        param_model=SubmitPromptParams,
+    )
+    async def lovable_submit_prompt(params: SubmitPromptParams, browser: Any) -> Any:
+        page = await browser.get_current_page()
+        return _result(*await submit_prompt(page, params.prompt))
+
+    @controller.action(
+        "Lovable: wait until the current build has finished",
+        param_model=WaitForBuildParams,
+    )
+    async def lovable_wait_for_build(params: WaitForBuildParams, browser: Any) -> Any:
+        page = await browser.get_current_page()
+        return _result(*await await_build(page, params.timeout_sec))
+
+    @controller.action("Lovable: read the preview URL of the current project")
+    async def lovable_get_preview_url(browser: Any) -> Any:
+        page = await browser.get_current_page()
+        return _result(*await read_preview_url(page))
+
+    return controller
@@ -0,0 +1,202 @@
+"""
+Event-driven build completion detection.
+
+Lovable reports build progress through its own API responses and websocket
+frames, so a BuildWatcher listens to those and resolves the moment one says
+the build finished (or failed) instead of re-scanning the whole document's
+text. A MutationObserver-driven check limited to the status regions
+(BUILD_STATUS_REGION_SELECTOR) covers builds that finish without a recognizable
+network signal. It only accepts a status that changed since the build was
+triggered (snapshot_build_status), so the previous build's "Ready" badge can't
+end the wait for the next one.
+"""
+
+import asyncio
+import re
+import weakref
+from typing import Any, Optional
+
+import structlog
+from playwright.async_api import Page
+
+from src.lovable_adapter.selectors import (
+    BUILD_COMPLETE_PAYLOAD_PATTERN,
+    BUILD_COMPLETE_TEXT_PATTERN,
+    BUILD_FAILED_PAYLOAD_PATTERN,
+    BUILD_STATUS_REGION_SELECTOR,
+    BUILD_STATUS_URL_PATTERN,
+)
+
+logger = structlog.get_logger(__name__)
+
+_STATUS_URL = re.compile(BUILD_STATUS_URL_PATTERN, re.IGNORECASE)
+_COMPLETE = re.compile(BUILD_COMPLETE_PAYLOAD_PATTERN, re.IGNORECASE)
+_FAILED = re.compile(BUILD_FAILED_PAYLOAD_PATTERN, re.IGNORECASE)
+# Only the head of a payload is inspected; status fields come first in practice.
+_MAX_PAYLOAD_CHARS = 65536
+
+_READ_STATUS_JS = """
+(selector) => Array.from(document.querySelectorAll(selector))
+  .map((el) => (el.textContent || "").trim())
+  .join("\\n")
+"""
+
+_STATUS_TEXT_JS = """
+([selector, pattern, baseline]) => {
+  const text = Array.from(document.querySelectorAll(selector))
+    .map((el) => (el.textContent || "").trim())
+    .join("\\n");
+  return text !== baseline && new RegExp(pattern, "i").test(text);
+}
+"""
+
+# Status text each page showed just before its last build was triggered.
+_baselines: "weakref.WeakKeyDictionary[Page, str]" = weakref.WeakKeyDictionary()
+
+
+def classify_build_payload(payload: Any) -> Optional[str]:
+    """Return "complete", "failed" or None for a response body or websocket frame."""
+    if isinstance(payload, (bytes, bytearray)):
+        payload = bytes(payload[:_MAX_PAYLOAD_CHARS]).decode("utf-8", errors="ignore")
+    if not isinstance(payload, str):
+        return None
+    head = payload[:_MAX_PAYLOAD_CHARS]
+    if _FAILED.search(head):
+        return "failed"
+    if _COMPLETE.search(head):
+        return "complete"
+    return None
+
+
+class BuildWatcher:
+    """Resolve on the first build status seen in a page's network traffic."""
+
+    def __init__(self, page: Page) -> None:
+        self.page = page
+        self.outcome: Optional[str] = None
+        self.source: Optional[str] = None
+        self._done = asyncio.Event()
+        self._tasks: set[asyncio.Future[Any]] = set()
+        self._sockets: list[Any] = []
+
+    def attach(self) -> None:
+        self.page.on("response", self._on_response)
+        self.page.on("websocket", self._on_websocket)
+
+    def detach(self) -> None:
+        for event, handler in (("response", self._on_response), ("websocket", self._on_websocket)):
+            self._remove(self.page, event, handler)
+        for socket in self._sockets:
+            self._remove(socket, "framereceived", self._on_frame)
+        for task in self._tasks:
+            task.cancel()
+
+    @staticmethod
+    def _remove(emitter: Any, event: str, handler: Any) -> None:
+        try:
+            emitter.remove_listener(event, handler)
+        except Exception:
+            pass
+
+    async def wait(self) -> str:
+        await self._done.wait()
+        return self.outcome or "complete"
+
+    def _resolve(self, outcome: str, source: str) -> None:
+        if self.outcome is None:
+            self.outcome = outcome
+            self.source = source
+            self._done.set()
+
+    def _inspect(self, payload: Any, source: str) -> None:
+        outcome = classify_build_payload(payload)
+        if outcome is not None:
+            self._resolve(outcome, source)
+
+    def _on_response(self, response: Any) -> None:
+        if self.outcome is not None or not _STATUS_URL.search(response.url):
+            return
+        task = asyncio.ensure_future(self._read_response(response))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _read_response(self, response: Any) -> None:
+        try:
+            body = await response.text()
+        except Exception:
+            # Redirects and evicted bodies have nothing to read.
+            return
+        self._inspect(body, "response")
+
+    def _on_websocket(self, socket: Any) -> None:
+        self._sockets.append(socket)
+        socket.on("framereceived", self._on_frame)
+
+    def _on_frame(self, payload: Any) -> None:
+        if self.outcome is None:
+            self._inspect(payload, "websocket")
+
+
+async def read_status_text(page: Page) -> str:
+    """The status regions' current text ("" when it can't be read)."""
+    try:
+        text = await page.evaluate(_READ_STATUS_JS, BUILD_STATUS_REGION_SELECTOR)
+    except Exception:
+        return ""
+    return text if isinstance(text, str) else ""
+
+
+async def snapshot_build_status(page: Page) -> None:
+    """Record the status text before a build is triggered; the wait requires it to change."""
+    _baselines[page] = await read_status_text(page)
+
+
+async def wait_for_status_text(page: Page, timeout: int, baseline: str = "") -> None:
+    """DOM fallback: wait until the status regions change to complete; raises on timeout."""
+    await page.wait_for_function(
+        _STATUS_TEXT_JS,
+        arg=[BUILD_STATUS_REGION_SELECTOR, BUILD_COMPLETE_TEXT_PATTERN, baseline],
+        polling="mutation",
+        timeout=timeout,
+    )
+
+
+async def wait_for_build_signal(page: Page, timeout: int) -> Optional[str]:
+    """
+    Wait for the build to finish, whichever signal arrives first.
+
+    The DOM fallback compares against the snapshot taken when the build was
+    triggered, or against the status at the start of the wait without one.
+    Returns "complete", "failed", or None when nothing arrived within timeout ms.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout / 1000
+    baseline = _baselines.pop(page, None)
+    if baseline is None:
+        baseline = await read_status_text(page)
+    watcher = BuildWatcher(page)
+    watcher.attach()
+    network = asyncio.ensure_future(watcher.wait())
+    dom = asyncio.ensure_future(wait_for_status_text(page, timeout, baseline))
+    pending: set[asyncio.Future[Any]] = {network, dom}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending,
+                timeout=max(0.0, deadline - loop.time()),
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if not done:
+                return None
+            if network in done:
+                logger.debug("Build signal", outcome=watcher.outcome, source=watcher.source)
+                return network.result()
+            if dom.exception() is None:
+                logger.debug("Build signal", outcome="complete", source="dom")
+                return "complete"
+            # The DOM wait failed (timeout or navigation); keep listening to the network.
+        return None
+    finally:
+        network.cancel()
+        dom.cancel()
+        watcher.detach()
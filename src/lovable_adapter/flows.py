@@ -5,20 +5,20 @@ These flows provide robust, retry-enabled interactions with Lovable UI.
 Use these as fallback or optimization when Saik0s CLI automation needs help.
 """
 
-import re
 from typing import Optional
 
 from playwright.async_api import Page
 from tenacity import retry, stop_after_attempt, wait_fixed
 
+from src.lovable_adapter.build_signals import snapshot_build_status, wait_for_build_signal
+from src.lovable_adapter.preview import find_preview_url
 from src.lovable_adapter.selectors import (
     BUILD_BUTTON_SELECTOR,
-    BUILD_COMPLETE_SELECTOR,
     BUILD_TIMEOUT,
     DEFAULT_TIMEOUT,
-    PREVIEW_URL_SELECTOR,
     PROMPT_INPUT_SELECTOR,
 )
+from src.lovable_adapter.settle import wait_for_page_settled
 
 
 @retry(stop=stop_after_attempt(3), wait=wait_fixed(2))
@@ -50,7 +50,7 @@ async def open_or_create_project(page: Page, project_name: str) -> bool:
         project_link = page.locator(f'text="{project_name}"')
         if await project_link.count() > 0:
             await project_link.first.click()
-            await page.wait_for_load_state("load", timeout=DEFAULT_TIMEOUT)
+            await wait_for_page_settled(page, timeout_ms=DEFAULT_TIMEOUT)
             return True
 
         # Create new project
@@ -59,7 +59,7 @@ async def open_or_create_project(page: Page, project_name: str) -> bool:
             await create_btn.click()
             await page.fill('input[placeholder*="name"]', project_name)
             await page.click('button:has-text("Create")')
-            await page.wait_for_load_state("load", timeout=DEFAULT_TIMEOUT)
+            await wait_for_page_settled(page, timeout_ms=DEFAULT_TIMEOUT)
             return True
 
         return False
@@ -92,6 +92,7 @@ async def trigger_build(page: Page) -> bool:
     try:
         build_btn = page.locator(BUILD_BUTTON_SELECTOR)
         if await build_btn.count() > 0:
+            await snapshot_build_status(page)
             await build_btn.click()
             return True
         return False
@@ -103,11 +104,12 @@ async def wait_for_build(page: Page, timeout: int = BUILD_TIMEOUT) -> bool:
     """
     Wait for build to complete.
 
-    Returns True if build completed, False on timeout.
+    Listens for Lovable's build status in network/websocket traffic, with a
+    targeted DOM check as fallback. Returns True if build completed, False if
+    it failed or timed out.
     """
     try:
-        await page.wait_for_selector(BUILD_COMPLETE_SELECTOR, timeout=timeout)
-        return True
+        return await wait_for_build_signal(page, timeout) == "complete"
     except Exception:
         return False
 
@@ -116,22 +118,11 @@ async def extract_preview_url(page: Page) -> Optional[str]:
     """
     Extract preview URL from Lovable build result.
 
-    Returns URL string or None if not found.
+    Served from the run's cache (filled from captured navigations) when
+    possible, otherwise from frame URLs and a targeted scan of the preview
+    element, iframes and anchors. Returns URL string or None if not found.
     """
     try:
-        # Try to find preview link
-        preview_link = page.locator(PREVIEW_URL_SELECTOR)
-        if await preview_link.count() > 0:
-            url = await preview_link.first.get_attribute("href")
-            if url and "lovable.dev" in url:
-                return url
-
-        # Try to extract from page text
-        content = await page.content()
-        match = re.search(r"https://[a-z0-9-]+\.lovable\.dev", content)
-        if match:
-            return match.group(0)
-
-        return None
+        return await find_preview_url(page)
     except Exception:
         return None
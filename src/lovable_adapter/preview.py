@@ -0,0 +1,113 @@
+"""
+Preview URL discovery without serializing the page.
+
+The preview URL is learned as a side effect of normal browsing: a
+PreviewCapture on the browser context records every document request (a
+navigation or an iframe load) to a preview host into the current run's
+RunPreview. Lookups read that cache first, then the page's frame URLs, then
+run one targeted evaluate over the preview element, iframes and anchors;
+whatever they find is cached on the run too, so repeated lookups are O(1).
+"""
+
+import re
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from playwright.async_api import Page
+
+from src.lovable_adapter.selectors import PREVIEW_URL_PATTERN, PREVIEW_URL_SELECTOR
+
+_PREVIEW = re.compile(PREVIEW_URL_PATTERN, re.IGNORECASE)
+
+# Candidates in priority order: the dedicated preview element, iframes, anchors.
+_FIND_PREVIEW_JS = """
+([pattern, previewSelector]) => {
+  const re = new RegExp(pattern, "i");
+  const groups = [
+    [previewSelector, (el) => [el.getAttribute("href"), el.getAttribute("value"), el.textContent]],
+    ["iframe[src]", (el) => [el.getAttribute("src")]],
+    ["a[href]", (el) => [el.getAttribute("href")]],
+  ];
+  for (const [selector, values] of groups) {
+    for (const el of document.querySelectorAll(selector)) {
+      for (const value of values(el)) {
+        const match = value && value.match(re);
+        if (match) return match[0];
+      }
+    }
+  }
+  return null;
+}
+"""
+
+
+@dataclass
+class RunPreview:
+    """The preview URL found during one run and where it came from."""
+
+    url: Optional[str] = None
+    source: Optional[str] = None
+
+    def record(self, url: str, source: str) -> None:
+        self.url = url
+        self.source = source
+
+
+# Preview cache of the run executing in the current task.
+current_run_preview: ContextVar[Optional[RunPreview]] = ContextVar(
+    "current_run_preview", default=None
+)
+
+
+def match_preview_url(text: str) -> Optional[str]:
+    """Return the preview origin a URL points at, if any."""
+    match = _PREVIEW.match(text)
+    return match.group(0) if match else None
+
+
+class PreviewCapture:
+    """Records preview-host document requests on one browser context into its target run."""
+
+    def __init__(self) -> None:
+        self.target: Optional[RunPreview] = None
+
+    def install(self, context: Any) -> None:
+        context.on("request", self._on_request)
+
+    def _on_request(self, request: Any) -> None:
+        if self.target is None or request.resource_type != "document":
+            return
+        url = match_preview_url(request.url)
+        if url:
+            self.target.record(url, "network")
+
+
+def install_preview_capture(context: Any) -> PreviewCapture:
+    """Install a capture on a context; it reports into the current run's preview cache."""
+    capture = PreviewCapture()
+    capture.target = current_run_preview.get()
+    capture.install(context)
+    return capture
+
+
+async def find_preview_url(page: Page) -> Optional[str]:
+    """
+    Return the run's preview URL, looking at the page only on a cache miss.
+
+    Raises whatever the page raises; extract_preview_url turns that into None.
+    """
+    run = current_run_preview.get()
+    if run is not None and run.url:
+        return run.url
+    url = None
+    for frame in page.frames:
+        url = match_preview_url(frame.url)
+        if url:
+            break
+    if url is None:
+        found = await page.evaluate(_FIND_PREVIEW_JS, [PREVIEW_URL_PATTERN, PREVIEW_URL_SELECTOR])
+        url = found if isinstance(found, str) else None
+    if url and run is not None:
+        run.record(url, "dom")
+    return url
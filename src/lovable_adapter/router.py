@@ -0,0 +1,187 @@
+"""
+Deterministic fast path for recognized Lovable tasks.
+
+Most jobs are "create (or update) project X with prompt Y". Those don't need
+an LLM deciding every click: the Playwright flows in this package can open the
+project, paste the prompt, build and read back the preview URL directly. The
+router recognizes such tasks, either from a structured context
+(``{"project": ..., "prompt": ...}``) or from the task text, and runs the flow;
+any stage that fails raises FlowFailed naming it. Only a failure before the
+prompt is entered can go to the agent as the original task: after that the
+project exists (and may be building), so resume_task gives the agent a task
+that finishes the job rather than repeating it.
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+from playwright.async_api import Page
+
+from src.lovable_adapter.flows import (
+    ensure_logged_in,
+    extract_preview_url,
+    open_or_create_project,
+    paste_prompt,
+    trigger_build,
+    wait_for_build,
+)
+from src.lovable_adapter.selectors import BUILD_TIMEOUT, DASHBOARD_URL, DEFAULT_TIMEOUT
+
+StageCallback = Callable[[str, str], None]
+
+# In order. Stages before paste_prompt leave nothing a fresh agent run would duplicate.
+FLOW_STAGES = (
+    "login",
+    "open_project",
+    "paste_prompt",
+    "trigger_build",
+    "wait_for_build",
+    "extract_preview_url",
+)
+RESTARTABLE_STAGES = frozenset(FLOW_STAGES[: FLOW_STAGES.index("paste_prompt")])
+
+_TASK_PATTERN = re.compile(
+    r"""
+    ^\s*(?P<action>create|update)\s+
+    (?:a\s+|the\s+)?(?:new\s+)?(?:lovable\s+)?project\s+
+    (?P<quote>["']?)(?P<name>[^"'\n]+?)(?P=quote)\s+
+    (?:with|using)\s+(?:the\s+)?prompt\s*[:\-]?\s*
+    (?P<prompt>.+?)\s*$
+    """,
+    re.IGNORECASE | re.DOTALL | re.VERBOSE,
+)
+
+
+class FlowFailed(Exception):
+    """A deterministic flow stage failed; see resume_task for what the agent may do next."""
+
+    def __init__(self, stage: str, message: str) -> None:
+        super().__init__(f"{stage}: {message}")
+        self.stage = stage
+
+
+@dataclass(frozen=True)
+class FlowRequest:
+    """A task the deterministic flow can run."""
+
+    action: str
+    project_name: str
+    prompt: str
+
+
+def _strip_quotes(text: str) -> str:
+    text = text.strip()
+    if len(text) >= 2 and text[0] == text[-1] and text[0] in "\"'":
+        return text[1:-1].strip()
+    return text
+
+
+def parse_flow_request(
+    task: str, context: Optional[dict[str, Any]] = None
+) -> Optional[FlowRequest]:
+    """Recognize a create/update-project task; None means it needs the agent."""
+    if context:
+        project_name = context.get("project") or context.get("project_name")
+        prompt = context.get("prompt")
+        if isinstance(project_name, str) and isinstance(prompt, str):
+            if project_name.strip() and prompt.strip():
+                action = str(context.get("action", "create")).lower()
+                return FlowRequest(
+                    action="update" if action == "update" else "create",
+                    project_name=project_name.strip(),
+                    prompt=prompt.strip(),
+                )
+
+    match = _TASK_PATTERN.match(task)
+    if match is None:
+        return None
+    prompt = _strip_quotes(match.group("prompt"))
+    if not prompt:
+        return None
+    return FlowRequest(
+        action=match.group("action").lower(),
+        project_name=match.group("name").strip(),
+        prompt=prompt,
+    )
+
+
+def failed_stage(completed: list[str]) -> str:
+    """The stage a flow was in when it stopped, given the stages it completed."""
+    for stage in FLOW_STAGES:
+        if stage not in completed:
+            return stage
+    return FLOW_STAGES[-1]
+
+
+def resume_task(request: FlowRequest, stage: str, project_url: str) -> Optional[str]:
+    """
+    An agent task that finishes a flow that failed at stage (after the project was opened).
+
+    None for trigger_build: the click may or may not have submitted the
+    prompt, and guessing either way risks a duplicate or a missing build.
+    """
+    if stage == "paste_prompt":
+        return (
+            f"The Lovable project {request.project_name!r} is already open at {project_url}. "
+            "Do not create another project. Submit this prompt there once, wait for the "
+            f"build to finish and report the preview URL. Prompt: {request.prompt}"
+        )
+    if stage in ("wait_for_build", "extract_preview_url"):
+        return (
+            f"The prompt was already submitted and the build was triggered on {project_url}. "
+            "Do not submit any prompt or create a project. Open that project, wait for the "
+            "build to finish and report the preview URL."
+        )
+    return None
+
+
+async def run_project_flow(
+    page: Page,
+    request: FlowRequest,
+    on_stage: Optional[StageCallback] = None,
+    build_timeout: int = BUILD_TIMEOUT,
+) -> dict[str, Any]:
+    """
+    Open (or create) the project, submit the prompt, build and read the preview URL.
+
+    Returns a dictionary with result_text, preview_url and project_url.
+    Raises FlowFailed naming the first stage that did not succeed.
+    """
+
+    def stage_done(stage: str) -> None:
+        if on_stage is not None:
+            on_stage(stage, page.url)
+
+    if not page.url.startswith(DASHBOARD_URL):
+        await page.goto(DASHBOARD_URL, wait_until="domcontentloaded", timeout=DEFAULT_TIMEOUT)
+    if not await ensure_logged_in(page):
+        raise FlowFailed("login", "not logged in to Lovable")
+    stage_done("login")
+
+    if not await open_or_create_project(page, request.project_name):
+        raise FlowFailed("open_project", f"could not open project {request.project_name!r}")
+    stage_done("open_project")
+
+    if not await paste_prompt(page, request.prompt):
+        raise FlowFailed("paste_prompt", "prompt input not found")
+    stage_done("paste_prompt")
+
+    if not await trigger_build(page):
+        raise FlowFailed("trigger_build", "build button not found")
+    stage_done("trigger_build")
+
+    if not await wait_for_build(page, timeout=build_timeout):
+        raise FlowFailed("wait_for_build", "build did not complete in time")
+    stage_done("wait_for_build")
+
+    preview_url = await extract_preview_url(page)
+    if not preview_url:
+        raise FlowFailed("extract_preview_url", "no preview URL after build")
+    stage_done("extract_preview_url")
+
+    return {
+        "result_text": f"Project {request.project_name!r} built. Preview URL: {preview_url}",
+        "preview_url": preview_url,
+        "project_url": page.url,
+    }
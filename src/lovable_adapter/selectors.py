@@ -22,9 +22,27 @@ BUILD_BUTTON_SELECTOR = 'button:has-text("Build"), button:has-text("Generate")'
 # Status/Result selectors
 BUILD_STATUS_SELECTOR = '[data-testid="build-status"], .build-status'
 PREVIEW_URL_SELECTOR = 'a[href*="lovable.dev"], [data-testid="preview-url"]'
+# Preview origins: https://<project>.lovable.dev (not the app's own hosts).
+PREVIEW_URL_PATTERN = r"https://(?!(?:www|api|docs)\.)[a-z0-9-]+\.lovable\.dev"
 BUILD_COMPLETE_SELECTOR = ':has-text("Build complete"), :has-text("Ready")'
 
+# Build completion signals. The status regions are the only elements the DOM
+# fallback watches (toasts and other live regions are deliberately excluded);
+# the patterns match Lovable's status API responses and websocket frames (JSON
+# bodies with a status/state field).
+BUILD_STATUS_REGION_SELECTOR = '[data-testid="build-status"], .build-status, [role="status"]'
+BUILD_COMPLETE_TEXT_PATTERN = r"build complete|\bready\b"
+BUILD_STATUS_URL_PATTERN = r"/(builds?|deployments?|generations?)(/|\?|$)|/status(\?|$)"
+BUILD_COMPLETE_PAYLOAD_PATTERN = (
+    r'"(status|state|build_?status|buildStatus)"\s*:\s*'
+    r'"(complete|completed|success|succeeded|ready|built|deployed)"'
+)
+BUILD_FAILED_PAYLOAD_PATTERN = (
+    r'"(status|state|build_?status|buildStatus)"\s*:\s*"(failed|failure|error|errored|cancell?ed)"'
+)
+
 # Navigation selectors
+DASHBOARD_URL = "https://lovable.dev/"
 WORKSPACE_SELECTOR = '[data-testid="workspace"], .workspace-menu'
 PROJECTS_LIST_SELECTOR = '[data-testid="projects-list"], .projects-grid'
 
@@ -0,0 +1,110 @@
+"""
+DOM-quiescence waiting: resolve as soon as a page stops changing.
+
+``wait_for_load_state("load")`` and fixed sleeps pay the worst case on every
+page, and Lovable's editor never reaches network idle because of its
+websocket. wait_for_page_settled instead injects a MutationObserver (plus a
+PerformanceObserver for completed resource loads) that timestamps the last DOM
+change, and tracks in-flight requests from Playwright's request events. The
+page counts as settled once neither has changed for ``quiet_ms``; the timeout
+is only an upper bound.
+"""
+
+import asyncio
+from typing import Any, Optional
+
+from playwright.async_api import Page
+
+from src.lovable_adapter.selectors import DEFAULT_TIMEOUT
+from src.settings import get_settings
+
+# Installs the observers once per document and returns ms since the last change.
+_QUIET_FOR_JS = """
+() => {
+  let state = window.__mcpSettle;
+  if (!state) {
+    state = window.__mcpSettle = { last: performance.now() };
+    const bump = () => { state.last = performance.now(); };
+    new MutationObserver(bump).observe(document, {
+      subtree: true, childList: true, attributes: true, characterData: true,
+    });
+    try { new PerformanceObserver(bump).observe({ type: "resource" }); } catch (e) {}
+  }
+  return performance.now() - state.last;
+}
+"""
+
+# Long-lived connections that never "finish" and must not hold the page unsettled.
+_LONG_LIVED_TYPES = frozenset({"websocket", "eventsource", "media"})
+# Requests pending longer than this are treated as long-polls and ignored.
+_STALE_REQUEST_SEC = 5.0
+_POLL_SEC = 0.05
+
+
+def settle_quiet_ms() -> int:
+    """Quiet window (MCP_PAGE_SETTLE_QUIET_MS, default 500) a page must hold to count as settled."""
+    return get_settings().page_settle_quiet_ms
+
+
+def settle_max_ms() -> int:
+    """Upper bound (MCP_PAGE_SETTLE_MAX_MS, default 5000) for the agent's per-step settle wait."""
+    return get_settings().page_settle_max_ms
+
+
+async def wait_for_page_settled(
+    page: Page,
+    quiet_ms: Optional[int] = None,
+    timeout_ms: int = DEFAULT_TIMEOUT,
+) -> bool:
+    """
+    Wait until the DOM and network have been quiet for quiet_ms.
+
+    Returns True once settled, False on timeout or when the page can't be
+    observed. Never raises, so callers can use it wherever they used to wait
+    for a load state.
+    """
+    quiet_sec = (settle_quiet_ms() if quiet_ms is None else quiet_ms) / 1000
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    deadline = start + timeout_ms / 1000
+    in_flight: dict[Any, float] = {}
+    network_quiet_since = start
+
+    def on_request(request: Any) -> None:
+        if request.resource_type not in _LONG_LIVED_TYPES:
+            in_flight[request] = loop.time()
+
+    def on_done(request: Any) -> None:
+        nonlocal network_quiet_since
+        if in_flight.pop(request, None) is not None:
+            network_quiet_since = loop.time()
+
+    listeners = (("request", on_request), ("requestfinished", on_done), ("requestfailed", on_done))
+    for event, handler in listeners:
+        page.on(event, handler)
+    try:
+        while True:
+            try:
+                dom_quiet_ms = await page.evaluate(_QUIET_FOR_JS)
+            except Exception:
+                # A navigation destroyed the execution context; observe the new document.
+                dom_quiet_ms = 0.0
+            if not isinstance(dom_quiet_ms, (int, float)):
+                return False
+            now = loop.time()
+            pending = any(now - started < _STALE_REQUEST_SEC for started in in_flight.values())
+            if (
+                dom_quiet_ms / 1000 >= quiet_sec
+                and not pending
+                and now - network_quiet_since >= quiet_sec
+            ):
+                return True
+            if now >= deadline:
+                return False
+            await asyncio.sleep(min(_POLL_SEC, deadline - now))
+    finally:
+        for event, handler in listeners:
+            try:
+                page.remove_listener(event, handler)
+            except Exception:
+                pass
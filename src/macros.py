@@ -0,0 +1,461 @@
+"""
+Compiled macros: deterministic replay of previously successful agent runs.
+
+After a successful agent run, its saved browser-use history is compiled into a
+parameterized action script: each step keeps the element selector the agent
+used and the value it typed. Quoted values in the task ("project \"Todo\" with
+prompt 'Build a todo app'") become slots, so the task text with those values
+removed is the macro's template. A later task with the same template replays
+the script directly with Playwright, substituting its own slot values. The
+run's context is part of the key, so a macro only replays for tasks with the
+same template and the same context, and only runs the agent itself marked
+done and successful are compiled.
+
+Recorded selectors are positional, so each element step also keeps an
+identifying attribute of the element (aria-label, title, placeholder, ...;
+browser-use histories record attributes, not text), parameterized like typed
+values. Replay looks the element up by that identity and checks it before
+acting, so a macro recorded for project "A" can't click A's card while
+replaying for "B". Navigation to a specific project URL is never compiled
+unless the project id is itself a slot.
+
+Every step is validated before it runs; the first one that fails raises
+MacroStepFailed. The caller falls back to the LLM agent only when nothing that
+changes Lovable state (a click, a key press, a submitted prompt) has run yet;
+a later failure is reported as the run's error instead of repeating the
+submission. Macros that keep failing are dropped, and the next successful
+agent run compiles a fresh one.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Optional
+
+import structlog
+from playwright.async_api import Page
+
+from src.lovable_adapter.actions import await_build, read_preview_url, submit_prompt
+from src.lovable_adapter.flows import extract_preview_url
+from src.settings import get_settings
+
+logger = structlog.get_logger(__name__)
+
+_QUOTED = re.compile(r'"([^"\n]+)"|\'([^\'\n]+)\'|“([^”\n]+)”')
+_PREVIEW = re.compile(r"https://[a-z0-9-]+\.lovable\.dev", re.IGNORECASE)
+_PROJECT_PATH = re.compile(r"/projects/([^/?#\s]+)", re.IGNORECASE)
+_UUID = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}", re.IGNORECASE)
+_SLOT = re.compile(r"\{slot\d+\}")
+_MIN_SLOT_LEN = 2
+MAX_WAIT_SEC = 30
+
+# browser-use actions a macro can replay; anything else makes a history uncompilable.
+_ELEMENT_ACTIONS = {"click_element", "input_text"}
+_PAGE_ACTIONS = {"go_to_url", "send_keys", "scroll_down", "scroll_up", "wait", "go_back", "done"}
+_LOVABLE_ACTIONS = {"lovable_submit_prompt", "lovable_wait_for_build", "lovable_get_preview_url"}
+# Steps that can change Lovable state (create a project, submit a form or a prompt).
+_SIDE_EFFECT_ACTIONS = {"click_element", "send_keys", "lovable_submit_prompt"}
+# Attributes that identify the element a step meant, in order of preference.
+_IDENTITY_ATTRIBUTES = ("aria-label", "title", "placeholder", "name", "alt", "href")
+
+StepCallback = Callable[[int, "MacroStep", str], None]
+
+
+class MacroStepFailed(Exception):
+    """A replayed step failed; started is False when it failed validation and never ran."""
+
+    def __init__(self, index: int, action: str, reason: str, started: bool = True) -> None:
+        super().__init__(f"step {index} ({action}): {reason}")
+        self.index = index
+        self.action = action
+        self.started = started
+
+    @property
+    def steps_run(self) -> int:
+        """How many steps may have acted on the page, counting a failed one that started."""
+        return self.index if self.started else self.index - 1
+
+
+class _StepInvalid(ValueError):
+    """A step's element is missing or isn't the one recorded; nothing was done."""
+
+
+@dataclass
+class MacroStep:
+    """One replayable action; text fields may contain {slotN} placeholders."""
+
+    action: str
+    selector: Optional[str] = None
+    xpath: Optional[str] = None
+    value: Optional[str] = None
+    identity_attr: Optional[str] = None
+    identity: Optional[str] = None
+
+
+@dataclass
+class Macro:
+    """A compiled, parameterized action script for one task template."""
+
+    template: str
+    slot_count: int
+    steps: list[MacroStep]
+    context_key: str = ""
+    expects_preview_url: bool = False
+    created_at: float = field(default_factory=time.time)
+    replays: int = 0
+    failures: int = 0
+
+    @property
+    def key(self) -> str:
+        return template_key(self.template, self.context_key)
+
+    @property
+    def verifiable(self) -> bool:
+        """Every element step can be checked; macros compiled before identities were not."""
+        return all(s.identity for s in self.steps if s.action in _ELEMENT_ACTIONS)
+
+    def side_effect_in(self, count: int) -> bool:
+        """Whether any of the first count steps can have changed Lovable state."""
+        return any(step.action in _SIDE_EFFECT_ACTIONS for step in self.steps[:count])
+
+    def to_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "Macro":
+        steps = [MacroStep(**step) for step in data.get("steps", [])]
+        return cls(**{**data, "steps": steps})
+
+
+def templatize(task: str) -> tuple[str, list[str]]:
+    """Split a task into its template (quoted values replaced by slots) and the values."""
+    values: list[str] = []
+
+    def slot(match: re.Match[str]) -> str:
+        values.append(next(group for group in match.groups() if group is not None))
+        return f"{{slot{len(values) - 1}}}"
+
+    template = _QUOTED.sub(slot, task)
+    return " ".join(template.lower().split()), values
+
+
+def context_key(context: Optional[dict[str, Any]]) -> str:
+    """A stable key for a run's context ("" when there is none)."""
+    if not context:
+        return ""
+    encoded = json.dumps(context, sort_keys=True, default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()[:16]
+
+
+def template_key(template: str, context: str = "") -> str:
+    return hashlib.sha256(f"{template}\0{context}".encode()).hexdigest()[:16]
+
+
+def _parameterize(text: str, values: list[str]) -> str:
+    # Longest values first, so a slot that contains another is replaced whole. Only whole
+    # words match, so a short value isn't substituted inside unrelated text.
+    for index, value in sorted(enumerate(values), key=lambda item: -len(item[1])):
+        if len(value) >= _MIN_SLOT_LEN:
+            pattern = rf"(?<!\w){re.escape(value)}(?!\w)"
+            text = re.sub(pattern, lambda _: f"{{slot{index}}}", text)
+    return text
+
+
+def _fill_slots(text: Optional[str], values: list[str]) -> Optional[str]:
+    if text is None:
+        return None
+    for index, value in enumerate(values):
+        text = text.replace(f"{{slot{index}}}", value)
+    return text
+
+
+def _identity(element: dict[str, Any]) -> Optional[tuple[str, str]]:
+    attributes = element.get("attributes") or {}
+    for name in _IDENTITY_ATTRIBUTES:
+        value = " ".join(str(attributes.get(name) or "").split())
+        if value:
+            return name, value
+    return None
+
+
+def _names_project(url: str) -> bool:
+    """Whether a (parameterized) URL points at one specific project that isn't a slot."""
+    if _UUID.search(_SLOT.sub("", url)):
+        return True
+    return any(not _SLOT.fullmatch(match) for match in _PROJECT_PATH.findall(url))
+
+
+def _succeeded(history: dict[str, Any]) -> bool:
+    """Whether the run's last action result is the agent's successful "done"."""
+    items = history.get("history") or []
+    results = (items[-1].get("result") or []) if items else []
+    last = (results[-1] or {}) if results else {}
+    return last.get("is_done") is True and last.get("success") is True
+
+
+def compile_history(
+    task: str, history: dict[str, Any], context: Optional[dict[str, Any]] = None
+) -> Optional[Macro]:
+    """
+    Compile a saved browser-use history into a macro.
+
+    Only actions that executed without error are kept. Returns None unless
+    the agent finished with a successful "done", or when the history contains
+    an action the replayer doesn't support, an element without an identifying
+    attribute, or navigation to a project id that isn't one of the task's slots.
+    """
+    if not _succeeded(history):
+        logger.debug("History did not end in success, not compiling")
+        return None
+    template, values = templatize(task)
+    steps: list[MacroStep] = []
+    final_text = ""
+    for item in history.get("history", []):
+        actions = (item.get("model_output") or {}).get("action") or []
+        results = item.get("result") or []
+        elements = (item.get("state") or {}).get("interacted_element") or []
+        # Actions after a page change aren't executed, so results can be shorter.
+        for position, (action, result) in enumerate(zip(actions, results)):
+            if not action or (result or {}).get("error"):
+                continue
+            name, params = next(iter(action.items()))
+            params = params or {}
+            if name not in _ELEMENT_ACTIONS | _PAGE_ACTIONS | _LOVABLE_ACTIONS:
+                logger.debug("History not compilable", action=name)
+                return None
+            if name == "done":
+                final_text = str(params.get("text") or "")
+                continue
+            step = MacroStep(action=name)
+            if name in _ELEMENT_ACTIONS:
+                element = elements[position] if position < len(elements) else None
+                identity = _identity(element) if element else None
+                if identity is None:
+                    logger.debug("History not compilable: element without identity", action=name)
+                    return None
+                step.selector = element.get("css_selector")
+                step.xpath = element.get("xpath")
+                step.identity_attr = identity[0]
+                step.identity = _parameterize(identity[1], values)
+            raw_value = {
+                "input_text": params.get("text"),
+                "go_to_url": params.get("url"),
+                "send_keys": params.get("keys"),
+                "scroll_down": params.get("amount"),
+                "scroll_up": params.get("amount"),
+                "wait": params.get("seconds"),
+                "lovable_submit_prompt": params.get("prompt"),
+                "lovable_wait_for_build": params.get("timeout_sec"),
+            }.get(name)
+            if raw_value is not None:
+                step.value = _parameterize(str(raw_value), values)
+            if name == "go_to_url" and _names_project(step.value or ""):
+                logger.debug("History not compilable: navigates to a fixed project")
+                return None
+            steps.append(step)
+    if not steps:
+        return None
+    return Macro(
+        template=template,
+        slot_count=len(values),
+        steps=steps,
+        context_key=context_key(context),
+        expects_preview_url=bool(_PREVIEW.search(final_text)),
+    )
+
+
+def _same_text(actual: Optional[str], expected: str) -> bool:
+    return " ".join((actual or "").split()).casefold() == expected.casefold()
+
+
+async def _locate(page: Page, step: MacroStep, identity: str, timeout_ms: int) -> Any:
+    """The visible element carrying the step's identity: by that attribute, then by position."""
+    by_identity = f"[{step.identity_attr}={json.dumps(identity)}]"
+    positional = [step.selector, f"xpath={step.xpath}" if step.xpath else None]
+    for selector in (by_identity, *positional):
+        if not selector:
+            continue
+        locator = page.locator(selector).first
+        try:
+            await locator.wait_for(state="visible", timeout=timeout_ms)
+        except Exception:
+            continue
+        actual = await locator.get_attribute(step.identity_attr)
+        if _same_text(actual, identity):
+            return locator
+    return None
+
+
+async def _replay_step(
+    page: Page, step: MacroStep, value: Optional[str], identity: Optional[str], timeout_ms: int
+) -> None:
+    """Run one step; raises _StepInvalid before acting when its element doesn't validate."""
+    if step.action in _ELEMENT_ACTIONS:
+        if not step.identity_attr or not identity:
+            raise _StepInvalid("no element identity recorded")
+        locator = await _locate(page, step, identity, timeout_ms)
+        if locator is None:
+            raise _StepInvalid(f"no visible element with {step.identity_attr} {identity!r}")
+        if step.action == "click_element":
+            await locator.click(timeout=timeout_ms)
+        else:
+            await locator.fill(value or "", timeout=timeout_ms)
+    elif step.action == "go_to_url":
+        await page.goto(value or "", wait_until="domcontentloaded", timeout=timeout_ms)
+    elif step.action == "send_keys":
+        await page.keyboard.press(value or "")
+    elif step.action in ("scroll_down", "scroll_up"):
+        amount = int(value) if value else 600
+        await page.mouse.wheel(0, amount if step.action == "scroll_down" else -amount)
+    elif step.action == "wait":
+        await asyncio.sleep(min(float(value or 1), MAX_WAIT_SEC))
+    elif step.action == "go_back":
+        await page.go_back(timeout=timeout_ms)
+    else:
+        if step.action == "lovable_submit_prompt":
+            _, error = await submit_prompt(page, value or "")
+        elif step.action == "lovable_wait_for_build":
+            _, error = await await_build(page, int(value) if value else 300)
+        else:
+            _, error = await read_preview_url(page)
+        if error:
+            raise ValueError(error)
+
+
+async def replay_macro(
+    page: Page,
+    macro: Macro,
+    values: list[str],
+    on_step: Optional[StepCallback] = None,
+    step_timeout_ms: int = 15000,
+) -> dict[str, Any]:
+    """
+    Replay a macro with this task's slot values.
+
+    Returns a dictionary with result_text, preview_url and project_url.
+    Raises MacroStepFailed at the first step that fails.
+    """
+    for index, step in enumerate(macro.steps, start=1):
+        value, identity = _fill_slots(step.value, values), _fill_slots(step.identity, values)
+        try:
+            await _replay_step(page, step, value, identity, step_timeout_ms)
+        except Exception as e:
+            reason = str(e) or type(e).__name__
+            started = not isinstance(e, _StepInvalid)
+            raise MacroStepFailed(index, step.action, reason, started) from e
+        if on_step is not None:
+            on_step(index, step, page.url)
+
+    preview_url = await extract_preview_url(page)
+    if macro.expects_preview_url and not preview_url:
+        raise MacroStepFailed(len(macro.steps), "done", "no preview URL after replay")
+    result_text = "Replayed compiled macro."
+    if preview_url:
+        result_text += f" Preview URL: {preview_url}"
+    return {"result_text": result_text, "preview_url": preview_url, "project_url": page.url}
+
+
+class MacroStore:
+    """Macros keyed by template and context, cached in memory and persisted as JSON files."""
+
+    def __init__(self, directory: str, max_failures: int = 2) -> None:
+        self.directory = directory
+        self.max_failures = max_failures
+        self._macros: dict[str, Optional[Macro]] = {}
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, template: str, context: str = "") -> Optional[Macro]:
+        key = template_key(template, context)
+        if key not in self._macros:
+            self._macros[key] = self._load(key)
+        macro = self._macros[key]
+        if macro is None or macro.template != template or macro.context_key != context:
+            return None
+        return macro
+
+    def find(
+        self, task: str, context: Optional[dict[str, Any]] = None
+    ) -> tuple[Optional[Macro], list[str]]:
+        """Return the macro matching the task's template and context, and its slot values."""
+        template, values = templatize(task)
+        macro = self.get(template, context_key(context))
+        if macro is None or macro.slot_count != len(values) or not macro.verifiable:
+            return None, values
+        return macro, values
+
+    def _load(self, key: str) -> Optional[Macro]:
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                return Macro.from_dict(json.load(f))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning("Failed to load macro", key=key, error=str(e))
+            return None
+
+    def save(self, macro: Macro) -> None:
+        # Macros replay typed values, so the directory is private to the gateway's user.
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        tmp_path = self._path(macro.key) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(macro.to_dict(), f)
+        os.replace(tmp_path, self._path(macro.key))
+        self._macros[macro.key] = macro
+
+    def record_success(self, macro: Macro) -> None:
+        macro.replays += 1
+        macro.failures = 0
+        self.save(macro)
+
+    def record_failure(self, macro: Macro) -> None:
+        """Count a failed replay; drop the macro once it fails too often."""
+        macro.failures += 1
+        if macro.failures < self.max_failures:
+            self.save(macro)
+            return
+        logger.info("Dropping unreliable macro", template=macro.template)
+        self._macros[macro.key] = None
+        try:
+            os.remove(self._path(macro.key))
+        except FileNotFoundError:
+            pass
+
+    def compile_from_file(
+        self, task: str, history_path: str, context: Optional[dict[str, Any]] = None
+    ) -> Optional[Macro]:
+        """Compile and store a macro from a saved agent history file."""
+        try:
+            with open(history_path, encoding="utf-8") as f:
+                history = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.debug("No agent history to compile", path=history_path, error=str(e))
+            return None
+        macro = compile_history(task, history, context)
+        if macro is None:
+            return None
+        self.save(macro)
+        logger.info("Compiled macro", template=macro.template, steps=len(macro.steps))
+        return macro
+
+
+_macro_store: Optional[MacroStore] = None
+
+
+def get_macro_store() -> Optional[MacroStore]:
+    """Return the process-wide macro store, or None when macros are disabled."""
+    global _macro_store
+    settings = get_settings()
+    if not settings.macros_enabled:
+        return None
+    if _macro_store is None or _macro_store.directory != settings.macro_dir:
+        _macro_store = MacroStore(
+            directory=settings.macro_dir, max_failures=settings.macro_max_failures
+        )
+    _macro_store.max_failures = settings.macro_max_failures
+    return _macro_store
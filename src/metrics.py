@@ -0,0 +1,306 @@
+"""
+Prometheus-compatible metrics for the gateway and agent internals.
+
+Metrics are plain counters and fixed-bucket histograms updated with simple
+in-place increments, without locks: every update happens on the event loop (or,
+for the legacy blocking entry point, under the GIL), so a rare lost increment is
+the worst case. Scraping renders a snapshot copy of each series and never waits
+on request handling. Values owned by other components (scheduler occupancy,
+browser pool) are read through callbacks at scrape time, so they cost nothing
+between scrapes. Browser worker processes drain their counters and histograms
+into periodic reports that the gateway merges into its own registry, so one
+scrape covers the runs of every worker.
+"""
+
+import abc
+import bisect
+import math
+from typing import Any, Callable, Iterable, Optional
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Browser runs take seconds to tens of minutes, so default buckets start at 100ms.
+DURATION_BUCKETS = (0.1, 0.5, 1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800)
+
+LabelValues = tuple[str, ...]
+Sample = tuple[dict[str, str], float]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    inner = ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels.items())
+    return "{" + inner + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric(abc.ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: dict[str, Any]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: LabelValues) -> dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._render_samples())
+        return lines
+
+    @abc.abstractmethod
+    def _render_samples(self) -> list[str]:
+        """The metric's sample lines, without the HELP and TYPE header."""
+
+    def drain(self) -> dict[LabelValues, Any]:
+        """Take what was recorded since the last drain; callback metrics have nothing to take."""
+        return {}
+
+    def merge(self, values: dict[LabelValues, Any]) -> None:
+        """Add values drained from the same metric in another process."""
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, optionally labelled."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: Any) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def drain(self) -> dict[LabelValues, float]:
+        values, self._values = self._values, {}
+        return values
+
+    def merge(self, values: dict[LabelValues, float]) -> None:
+        for key, amount in values.items():
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _render_samples(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self._labels(key))} {_format_value(value)}"
+            for key, value in list(self._values.items())
+        ]
+
+
+class Histogram(_Metric):
+    """Fixed-bucket distribution of observed values."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Iterable[float] = DURATION_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per series: non-cumulative bucket counts (last slot is +Inf), then sum.
+        self._series: dict[LabelValues, list[float]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series.setdefault(key, [0.0] * (len(self.buckets) + 2))
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def count(self, **labels: Any) -> int:
+        series = self._series.get(self._key(labels))
+        return int(sum(series[:-1])) if series else 0
+
+    def drain(self) -> dict[LabelValues, list[float]]:
+        series, self._series = self._series, {}
+        return series
+
+    def merge(self, values: dict[LabelValues, list[float]]) -> None:
+        for key, other in values.items():
+            series = self._series.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            for index, amount in enumerate(other):
+                series[index] += amount
+
+    def _render_samples(self) -> list[str]:
+        lines = []
+        for key, series in list(self._series.items()):
+            snapshot = list(series)
+            labels = self._labels(key)
+            cumulative = 0.0
+            for bound, bucket_count in zip((*self.buckets, math.inf), snapshot[:-1]):
+                cumulative += bucket_count
+                bucket_labels = {**labels, "le": _format_value(bound)}
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(bucket_labels)} {_format_value(cumulative)}"
+                )
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(snapshot[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {_format_value(cumulative)}")
+        return lines
+
+
+class CallbackMetric(_Metric):
+    """Gauge or counter whose samples are read from another component at scrape time."""
+
+    def __init__(
+        self, name: str, documentation: str, kind: str, callback: Callable[[], Iterable[Sample]]
+    ) -> None:
+        super().__init__(name, documentation)
+        self.kind = kind
+        self._callback = callback
+
+    def _render_samples(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(labels)} {_format_value(value)}"
+            for labels, value in self._callback()
+        ]
+
+
+class MetricsRegistry:
+    """Ordered collection of metrics rendered in the Prometheus text format."""
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> Any:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Iterable[float] = DURATION_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(
+        self,
+        name: str,
+        documentation: str,
+        callback: Callable[[], Iterable[Sample]],
+        kind: str = "gauge",
+    ) -> CallbackMetric:
+        return self.register(CallbackMetric(name, documentation, kind, callback))
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def drain(self) -> dict[str, dict[LabelValues, Any]]:
+        """Take every series recorded since the last drain, for a worker's report."""
+        drained = {name: metric.drain() for name, metric in list(self._metrics.items())}
+        return {name: values for name, values in drained.items() if values}
+
+    def merge(self, drained: dict[str, dict[LabelValues, Any]]) -> None:
+        """Add a worker's drained series; metrics this process doesn't know are skipped."""
+        for name, values in drained.items():
+            metric = self._metrics.get(name)
+            if metric is not None:
+                metric.merge(values)
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in list(self._metrics.values()):
+            try:
+                lines.extend(metric.render())
+            except Exception:
+                # A failing callback must not take the whole scrape down.
+                continue
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+queue_wait_seconds = registry.histogram(
+    "lovable_gateway_queue_wait_seconds",
+    "Time runs spent waiting for a scheduler slot.",
+    ["priority"],
+)
+executor_queue_wait_seconds = registry.histogram(
+    "lovable_gateway_agent_executor_queue_wait_seconds",
+    "Time blocking agent work waited for an agent executor thread.",
+)
+run_duration_seconds = registry.histogram(
+    "lovable_gateway_run_duration_seconds",
+    "Total run duration from request to result, including queue wait.",
+    ["mode"],
+)
+attempt_duration_seconds = registry.histogram(
+    "lovable_gateway_agent_attempt_duration_seconds",
+    "Duration of individual browser agent attempts.",
+    ["outcome"],
+)
+agent_steps = registry.histogram(
+    "lovable_gateway_agent_steps",
+    "Agent steps per run, split by whether Lovable custom actions were used.",
+    ["lovable_actions"],
+    buckets=(1, 2, 5, 10, 20, 35, 50, 75, 100),
+)
+macro_replays_total = registry.counter(
+    "lovable_gateway_macro_replays_total",
+    "Compiled macro replays by outcome.",
+    ["outcome"],
+)
+blocked_requests_total = registry.counter(
+    "lovable_gateway_blocked_requests_total",
+    "Browser requests aborted or stubbed by the network blocking profile.",
+    ["resource_type", "action"],
+)
+blocked_bytes_estimated_total = registry.counter(
+    "lovable_gateway_blocked_bytes_estimated_total",
+    "Estimated response bytes avoided by the network blocking profile.",
+)
+runs_total = registry.counter(
+    "lovable_gateway_runs_total",
+    "Finished runs by outcome (ok or the mapped error code).",
+    ["mode", "outcome"],
+)
+agent_retries_total = registry.counter(
+    "lovable_gateway_agent_retries_total",
+    "Browser agent attempts beyond the first.",
+)
+agent_retries_denied_total = registry.counter(
+    "lovable_gateway_agent_retries_denied_total",
+    "Failed agent attempts not retried, by error code and reason (policy or budget).",
+    ["error_code", "reason"],
+)
+rate_limited_total = registry.counter(
+    "lovable_gateway_rate_limited_total",
+    "Requests rejected by the per-IP rate limiter.",
+    ["path"],
+)
+auth_refresh_total = registry.counter(
+    "lovable_gateway_auth_refresh_total",
+    "Session keep-alive rounds by result (refreshed, unchanged, logged_out, busy, error).",
+    ["result"],
+)
@@ -0,0 +1,204 @@
+"""
+Network request blocking for agent browser contexts.
+
+lovable.dev keeps the network busy with analytics, fonts, media and
+third-party trackers, which slows page loads and every DOM-settle wait. A
+RequestBlocker installs one route handler on a Playwright context that aborts
+requests of blocked resource types and stubs (answers with an empty 200)
+tracker scripts and beacons, so page code that expects them keeps working.
+
+Savings are counted per run. A blocked request is never fetched, so bytes
+saved are an estimate: the average size of allowed responses of the same
+resource type (or a built-in default until one has been seen).
+"""
+
+import re
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+import structlog
+
+from src.metrics import blocked_bytes_estimated_total, blocked_requests_total
+from src.settings import get_settings
+
+logger = structlog.get_logger(__name__)
+
+# Lovable-tuned defaults: the editor needs its scripts, XHR/websocket and images
+# (screenshots feed the agent), but not media, web fonts or third-party tracking.
+LOVABLE_BLOCKED_RESOURCE_TYPES = ("media", "font")
+LOVABLE_STUBBED_URL_PATTERNS = (
+    r"google-analytics\.com",
+    r"googletagmanager\.com",
+    r"doubleclick\.net",
+    r"connect\.facebook\.net",
+    r"facebook\.com/tr",
+    r"cdn\.segment\.(com|io)",
+    r"api\.segment\.io",
+    r"(cdn|api)\.mixpanel\.com",
+    r"([a-z-]+\.)?posthog\.com",
+    r"static\.hotjar\.com",
+    r"script\.hotjar\.com",
+    r"widget\.intercom\.io",
+    r"js\.intercomcdn\.com",
+    r"([a-z-]+\.)?clarity\.ms",
+    r"cdn\.amplitude\.com",
+    r"api2?\.amplitude\.com",
+    r"fullstory\.com",
+    r"browser-intake-datadoghq\.(com|eu)",
+    r"ingest\.sentry\.io",
+    r"([a-z-]+\.)?hs-(scripts|analytics)\.(com|net)",
+)
+
+# Rough response sizes used until real ones are observed, in bytes.
+_DEFAULT_SIZES = {
+    "media": 500_000,
+    "font": 40_000,
+    "image": 30_000,
+    "script": 60_000,
+    "stylesheet": 20_000,
+}
+_FALLBACK_SIZE = 2_000
+
+
+@dataclass
+class NetworkSavings:
+    """Requests and (estimated) bytes a blocker saved during one run."""
+
+    requests_blocked: int = 0
+    requests_stubbed: int = 0
+    estimated_bytes_saved: int = 0
+    by_resource_type: dict[str, int] = field(default_factory=dict)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "requests_blocked": self.requests_blocked,
+            "requests_stubbed": self.requests_stubbed,
+            "estimated_bytes_saved": self.estimated_bytes_saved,
+            "by_resource_type": dict(self.by_resource_type),
+        }
+
+
+# Savings of the run executing in the current task; blockers installed during a
+# run report into it.
+current_network_savings: ContextVar[Optional[NetworkSavings]] = ContextVar(
+    "current_network_savings", default=None
+)
+
+
+@dataclass
+class BlockingProfile:
+    """Which resource types to abort and which URL patterns to stub."""
+
+    blocked_resource_types: frozenset[str]
+    stubbed_url_patterns: tuple[str, ...]
+    _stub_re: Optional["re.Pattern[str]"] = field(init=False, repr=False, default=None)
+
+    def __post_init__(self) -> None:
+        pattern = "|".join(f"(?:{p})" for p in self.stubbed_url_patterns)
+        self._stub_re = re.compile(pattern, re.IGNORECASE) if pattern else None
+
+    def decide(self, url: str, resource_type: str) -> Optional[str]:
+        """Return "stub", "abort" or None (let the request through)."""
+        if self._stub_re is not None and self._stub_re.search(url):
+            return "stub"
+        if resource_type in self.blocked_resource_types:
+            return "abort"
+        return None
+
+
+def _csv(value: str) -> list[str]:
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def load_blocking_profile() -> Optional[BlockingProfile]:
+    """
+    Build the profile from the settings; None when blocking is off.
+
+    MCP_NETWORK_BLOCK_PROFILE selects "lovable" (default) or "off".
+    MCP_NETWORK_BLOCK_RESOURCE_TYPES replaces the blocked resource types, and
+    MCP_NETWORK_BLOCK_URL_PATTERNS adds stubbed URL regexes.
+    """
+    settings = get_settings()
+    if settings.network_block_profile.lower() in ("off", "none", ""):
+        return None
+    resource_types = settings.network_block_resource_types
+    return BlockingProfile(
+        blocked_resource_types=frozenset(
+            _csv(resource_types) if resource_types is not None else LOVABLE_BLOCKED_RESOURCE_TYPES
+        ),
+        stubbed_url_patterns=LOVABLE_STUBBED_URL_PATTERNS
+        + tuple(_csv(settings.network_block_url_patterns)),
+    )
+
+
+class RequestBlocker:
+    """Route handler applying a BlockingProfile to one browser context."""
+
+    def __init__(self, profile: BlockingProfile) -> None:
+        self.profile = profile
+        self.savings: Optional[NetworkSavings] = None
+        self._observed: dict[str, tuple[int, int]] = {}  # resource_type -> (total bytes, count)
+
+    async def install(self, context: Any) -> None:
+        await context.route("**/*", self._handle)
+        context.on("response", self._on_response)
+
+    def _estimated_size(self, resource_type: str) -> int:
+        total, count = self._observed.get(resource_type, (0, 0))
+        if count:
+            return total // count
+        return _DEFAULT_SIZES.get(resource_type, _FALLBACK_SIZE)
+
+    def _on_response(self, response: Any) -> None:
+        try:
+            length = int(response.headers.get("content-length", ""))
+        except (TypeError, ValueError):
+            return
+        resource_type = response.request.resource_type
+        total, count = self._observed.get(resource_type, (0, 0))
+        self._observed[resource_type] = (total + length, count + 1)
+
+    def _record(self, action: str, resource_type: str) -> None:
+        size = self._estimated_size(resource_type)
+        blocked_requests_total.inc(resource_type=resource_type, action=action)
+        blocked_bytes_estimated_total.inc(size)
+        savings = self.savings
+        if savings is None:
+            return
+        if action == "stub":
+            savings.requests_stubbed += 1
+        else:
+            savings.requests_blocked += 1
+        savings.estimated_bytes_saved += size
+        by_type = savings.by_resource_type
+        by_type[resource_type] = by_type.get(resource_type, 0) + 1
+
+    async def _handle(self, route: Any) -> None:
+        request = route.request
+        action = self.profile.decide(request.url, request.resource_type)
+        try:
+            if action is None:
+                await route.continue_()
+                return
+            self._record(action, request.resource_type)
+            if action == "stub":
+                is_script = request.resource_type == "script"
+                content_type = "application/javascript" if is_script else "text/plain"
+                await route.fulfill(status=200, body="", content_type=content_type)
+            else:
+                await route.abort("blockedbyclient")
+        except Exception as e:
+            # The page may have navigated away or closed mid-request.
+            logger.debug("Route handling failed", url=request.url[:200], error=str(e))
+
+
+async def install_request_blocking(context: Any) -> Optional[RequestBlocker]:
+    """Install the configured blocker on a context; it reports into the current run's savings."""
+    profile = load_blocking_profile()
+    if profile is None:
+        return None
+    blocker = RequestBlocker(profile)
+    blocker.savings = current_network_savings.get()
+    await blocker.install(context)
+    return blocker
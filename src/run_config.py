@@ -0,0 +1,101 @@
+"""
+Immutable per-run execution config.
+
+Everything a run needs from the settings snapshot (LLM, browser, timeouts,
+auth) is resolved once into a frozen RunConfig and passed explicitly down the
+runner, so concurrent runs never share or mutate process state (``os.environ``).
+Callers may override a small set of fields per request; the overrides can
+narrow the server's limits but never widen them.
+"""
+
+import dataclasses
+import os
+from dataclasses import dataclass, field
+from typing import Any, Mapping, Optional
+
+from src.auth_state import current_storage_state
+from src.settings import Settings, get_settings
+
+# Fields a request may override, and the bounds the server settings impose on them.
+OVERRIDABLE_FIELDS = frozenset(
+    {
+        "llm_model_name",
+        "llm_temperature",
+        "timeout_sec",
+        "retry_max",
+        "lovable_actions",
+        "fast_path_enabled",
+    }
+)
+_CAPPED_FIELDS = ("timeout_sec", "retry_max")
+
+
+@dataclass(frozen=True)
+class RunConfig:
+    """Settings for one run; build with from_settings() and derive with with_overrides()."""
+
+    llm_provider: str = "openrouter"
+    llm_model_name: str = "openai/gpt-5-mini"
+    llm_num_ctx: int = 8000
+    llm_temperature: float = 0.2
+    llm_base_url: str = "https://openrouter.ai/api/v1"
+    llm_api_key: str = field(default="", repr=False)
+    headless: bool = True
+    window_w: int = 1440
+    window_h: int = 1080
+    timeout_sec: int = 600
+    retry_max: int = 2
+    lovable_actions: bool = True
+    fast_path_enabled: bool = True
+    auth_path: str = ""
+    account: Optional[str] = None
+    # Parsed storage state for contexts this run creates; shared read-only, never mutated.
+    storage_state: Optional[dict[str, Any]] = field(default=None, repr=False, compare=False)
+
+    @classmethod
+    def from_settings(cls, settings: Optional[Settings] = None) -> "RunConfig":
+        """Resolve a config from a settings snapshot (the current one by default)."""
+        settings = settings or get_settings()
+        return cls(
+            llm_provider=settings.llm_provider,
+            llm_model_name=settings.llm_model_name,
+            llm_num_ctx=settings.llm_num_ctx,
+            llm_temperature=settings.llm_temperature,
+            llm_base_url=settings.llm_base_url,
+            llm_api_key=settings.llm_openrouter_api_key,
+            headless=settings.browser_headless,
+            window_w=settings.browser_window_width,
+            window_h=settings.browser_window_height,
+            timeout_sec=settings.agent_timeout_sec,
+            retry_max=settings.agent_retry_max,
+            lovable_actions=settings.agent_lovable_actions,
+            fast_path_enabled=settings.fast_path_enabled,
+            auth_path=os.path.abspath(settings.auth_state_path),
+            storage_state=current_storage_state(),
+        )
+
+    @property
+    def has_api_key(self) -> bool:
+        return len(self.llm_api_key) > 10
+
+    def with_overrides(self, overrides: Optional[Mapping[str, Any]]) -> "RunConfig":
+        """
+        A copy with request overrides applied.
+
+        Raises ValueError for fields that can't be overridden. Timeout and
+        retry overrides are capped at this config's values.
+        """
+        if not overrides:
+            return self
+        unknown = set(overrides) - OVERRIDABLE_FIELDS
+        if unknown:
+            raise ValueError(f"Run config fields can't be overridden: {', '.join(sorted(unknown))}")
+        changes = dict(overrides)
+        for name in _CAPPED_FIELDS:
+            if name in changes:
+                changes[name] = max(1, min(int(changes[name]), getattr(self, name)))
+        return dataclasses.replace(self, **changes)
+
+    def for_account(self, account: str, storage_state: Optional[dict[str, Any]]) -> "RunConfig":
+        """A copy that runs as another Lovable account."""
+        return dataclasses.replace(self, account=account, storage_state=storage_state)
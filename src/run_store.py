@@ -0,0 +1,124 @@
+"""
+Bounded in-memory store for asynchronous browser agent runs.
+
+Submitted runs are kept as small records (input + status) until they finish,
+then retained for ``ttl_sec`` so callers can fetch the result. The store never
+holds more than ``max_runs`` records: expired and then oldest finished runs are
+evicted first, and submissions are rejected once only pending runs remain.
+"""
+
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+import structlog
+
+from src.settings import Settings, get_settings
+
+logger = structlog.get_logger(__name__)
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+
+
+class RunStoreFull(Exception):
+    """Raised when every slot in the store is held by a pending run."""
+
+
+@dataclass
+class RunRecord:
+    """A submitted run and, once finished, its output."""
+
+    run_id: str
+    task: str
+    context: Optional[dict[str, Any]] = None
+    status: str = STATUS_QUEUED
+    output: Any = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    @property
+    def done(self) -> bool:
+        return self.finished_at is not None
+
+
+class RunStore:
+    """Run records keyed by run_id with TTL and capacity eviction."""
+
+    def __init__(self, max_runs: int = 10000, ttl_sec: float = 3600.0) -> None:
+        self.max_runs = max(1, max_runs)
+        self.ttl_sec = ttl_sec
+        self._runs: dict[str, RunRecord] = {}
+        # Finished run_ids in completion order, so eviction never scans pending runs.
+        self._finished: OrderedDict[str, float] = OrderedDict()
+        self._evicted = 0
+
+    def create(self, run_id: str, task: str, context: Optional[dict[str, Any]] = None) -> RunRecord:
+        """Register a new queued run, evicting finished runs if needed."""
+        self._evict_expired()
+        while len(self._runs) >= self.max_runs and self._finished:
+            self._evict_oldest()
+        if len(self._runs) >= self.max_runs:
+            raise RunStoreFull(f"Run store is full ({self.max_runs} pending runs)")
+        record = RunRecord(run_id=run_id, task=task, context=context)
+        self._runs[run_id] = record
+        return record
+
+    def get(self, run_id: str) -> Optional[RunRecord]:
+        self._evict_expired()
+        return self._runs.get(run_id)
+
+    def discard(self, run_id: str) -> None:
+        """Forget a run that was never started (e.g. rejected after creation)."""
+        if run_id not in self._finished:
+            self._runs.pop(run_id, None)
+
+    def mark_running(self, run_id: str) -> None:
+        record = self._runs.get(run_id)
+        if record is not None:
+            record.status = STATUS_RUNNING
+            record.started_at = time.time()
+
+    def finish(self, run_id: str, output: Any) -> None:
+        """Attach the final output; the record expires ttl_sec from now."""
+        record = self._runs.get(run_id)
+        if record is None:
+            return
+        record.output = output
+        record.status = getattr(output, "status", "done")
+        record.finished_at = time.time()
+        # Drop the input; only the output is needed once the run is done.
+        record.context = None
+        self._finished[run_id] = record.finished_at
+
+    def _evict_expired(self) -> None:
+        cutoff = time.time() - self.ttl_sec
+        while self._finished:
+            run_id, finished_at = next(iter(self._finished.items()))
+            if finished_at > cutoff:
+                break
+            self._evict_oldest()
+
+    def _evict_oldest(self) -> None:
+        run_id, _ = self._finished.popitem(last=False)
+        self._runs.pop(run_id, None)
+        self._evicted += 1
+
+    def stats(self) -> dict[str, Any]:
+        pending = len(self._runs) - len(self._finished)
+        return {
+            "runs": len(self._runs),
+            "pending": pending,
+            "finished": len(self._finished),
+            "evicted": self._evicted,
+            "max_runs": self.max_runs,
+            "ttl_sec": self.ttl_sec,
+        }
+
+
+def create_run_store(settings: Optional[Settings] = None) -> RunStore:
+    """Build the run store from a settings snapshot (the current one by default)."""
+    settings = settings or get_settings()
+    return RunStore(max_runs=settings.run_store_max, ttl_sec=settings.run_ttl_sec)
@@ -0,0 +1,233 @@
+"""
+Fair priority scheduler for browser agent runs.
+
+Replaces the bare global semaphore. At most ``concurrency`` runs execute at
+once; the rest wait in per-priority queues. Within a priority class, waiting
+clients are served round-robin (one run per client per turn), so a caller who
+queues fifty runs can't starve one who queues a single run. Queue depth is
+capped globally and per client; over-capacity submissions are rejected with an
+estimated retry delay instead of waiting unboundedly.
+"""
+
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Optional
+
+import structlog
+
+from src.settings import Settings, get_settings
+
+logger = structlog.get_logger(__name__)
+
+PRIORITIES = ("high", "normal", "low")
+
+
+class QueueFull(Exception):
+    """Raised when a run can't be queued; carries a Retry-After estimate."""
+
+    def __init__(self, message: str, retry_after: int) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@dataclass
+class Ticket:
+    """A queued (or granted) claim on one execution slot."""
+
+    client_key: str
+    priority: str
+    future: "asyncio.Future[None]"
+    enqueued_at: float = field(default_factory=time.monotonic)
+    granted_at: Optional[float] = None
+
+    @property
+    def queue_wait_sec(self) -> float:
+        end = self.granted_at if self.granted_at is not None else time.monotonic()
+        return end - self.enqueued_at
+
+
+class FairScheduler:
+    """Priority classes with per-client round-robin and bounded queues."""
+
+    def __init__(
+        self,
+        concurrency: int,
+        max_queue_depth: int = 1000,
+        max_queued_per_client: int = 100,
+    ) -> None:
+        self.concurrency = max(1, concurrency)
+        self.max_queue_depth = max_queue_depth
+        self.max_queued_per_client = max_queued_per_client
+        # priority -> client_key -> waiting tickets; client order is the round-robin order
+        self._queues: dict[str, OrderedDict[str, deque[Ticket]]] = {
+            p: OrderedDict() for p in PRIORITIES
+        }
+        self._queued = 0
+        self._queued_by_client: dict[str, int] = {}
+        self._active = 0
+        self._rejected = 0
+        self._avg_run_sec = 60.0
+
+    def submit(self, client_key: str, priority: str = "normal") -> Ticket:
+        """Queue a claim for a slot without waiting; raises QueueFull when over capacity."""
+        if priority not in self._queues:
+            raise ValueError(f"Unknown priority: {priority}")
+        client_queued = self._queued_by_client.get(client_key, 0)
+        # Caps only apply to runs that would actually have to wait for a slot.
+        if self._active + self._queued >= self.concurrency:
+            if self._queued >= self.max_queue_depth:
+                self._reject("Run queue is full")
+            if client_queued >= self.max_queued_per_client:
+                self._reject("Too many queued runs for this client")
+
+        ticket = Ticket(client_key, priority, asyncio.get_running_loop().create_future())
+        self._queues[priority].setdefault(client_key, deque()).append(ticket)
+        self._queued += 1
+        self._queued_by_client[client_key] = client_queued + 1
+        self._dispatch()
+        return ticket
+
+    @asynccontextmanager
+    async def run(self, ticket: Ticket) -> AsyncIterator[Ticket]:
+        """Wait for the ticket's slot, hold it for the block, then release it."""
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            if ticket.future.done() and not ticket.future.cancelled():
+                # Granted just as the waiter was cancelled: hand the slot back.
+                self._release(ticket)
+            else:
+                self._remove(ticket)
+            raise
+        try:
+            yield ticket
+        finally:
+            self._release(ticket)
+
+    @asynccontextmanager
+    async def slot(self, client_key: str, priority: str = "normal") -> AsyncIterator[Ticket]:
+        """Submit and wait in one step."""
+        async with self.run(self.submit(client_key, priority)) as ticket:
+            yield ticket
+
+    def resize(
+        self,
+        concurrency: int,
+        max_queue_depth: Optional[int] = None,
+        max_queued_per_client: Optional[int] = None,
+    ) -> None:
+        """
+        Change the limits in place.
+
+        Growing admits waiting runs at once; shrinking lets active runs finish
+        and holds new ones back until they fit under the new limit.
+        """
+        previous = self.concurrency
+        self.concurrency = max(1, concurrency)
+        if max_queue_depth is not None:
+            self.max_queue_depth = max_queue_depth
+        if max_queued_per_client is not None:
+            self.max_queued_per_client = max_queued_per_client
+        if self.concurrency != previous:
+            logger.info("Scheduler resized", concurrency=self.concurrency, previous=previous)
+        self._dispatch()
+
+    def retry_after(self) -> int:
+        """Seconds until a new submission would plausibly be accepted."""
+        backlog = self._queued + self._active
+        return max(1, math.ceil(self._avg_run_sec * backlog / self.concurrency))
+
+    def _reject(self, message: str) -> None:
+        self._rejected += 1
+        retry_after = self.retry_after()
+        logger.warning("Run rejected by scheduler", reason=message, retry_after=retry_after)
+        raise QueueFull(message, retry_after)
+
+    def _next_ticket(self) -> Optional[Ticket]:
+        for priority in PRIORITIES:
+            clients = self._queues[priority]
+            if not clients:
+                continue
+            client_key, tickets = clients.popitem(last=False)
+            ticket = tickets.popleft()
+            if tickets:
+                clients[client_key] = tickets
+            return ticket
+        return None
+
+    def _dispatch(self) -> None:
+        while self._active < self.concurrency:
+            ticket = self._next_ticket()
+            if ticket is None:
+                return
+            self._dequeued(ticket)
+            if ticket.future.done():
+                continue
+            self._active += 1
+            ticket.granted_at = time.monotonic()
+            ticket.future.set_result(None)
+
+    def _dequeued(self, ticket: Ticket) -> None:
+        self._queued -= 1
+        remaining = self._queued_by_client.get(ticket.client_key, 1) - 1
+        if remaining > 0:
+            self._queued_by_client[ticket.client_key] = remaining
+        else:
+            self._queued_by_client.pop(ticket.client_key, None)
+
+    def _remove(self, ticket: Ticket) -> None:
+        clients = self._queues[ticket.priority]
+        tickets = clients.get(ticket.client_key)
+        if tickets is None or ticket not in tickets:
+            return
+        tickets.remove(ticket)
+        if not tickets:
+            del clients[ticket.client_key]
+        self._dequeued(ticket)
+
+    def _release(self, ticket: Ticket) -> None:
+        self._active -= 1
+        if ticket.granted_at is not None:
+            run_sec = time.monotonic() - ticket.granted_at
+            self._avg_run_sec = 0.8 * self._avg_run_sec + 0.2 * run_sec
+        self._dispatch()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "concurrency": self.concurrency,
+            "active": self._active,
+            "queued": self._queued,
+            "queued_by_priority": {
+                p: sum(len(t) for t in clients.values()) for p, clients in self._queues.items()
+            },
+            "waiting_clients": len(self._queued_by_client),
+            "max_queue_depth": self.max_queue_depth,
+            "rejected": self._rejected,
+            "avg_run_sec": round(self._avg_run_sec, 2),
+        }
+
+
+def admission_concurrency(settings: Settings) -> int:
+    """
+    Runs a node lets through at once.
+
+    Runs execute where they are accepted unless a shared job backend spreads
+    them over the fleet; then the fleet-wide limit (when set) bounds admission.
+    """
+    if settings.job_backend != "memory" and settings.fleet_max_concurrency > 0:
+        return settings.fleet_max_concurrency
+    return settings.agent_concurrency
+
+
+def create_scheduler(settings: Optional[Settings] = None) -> FairScheduler:
+    """Build the scheduler from a settings snapshot (the current one by default)."""
+    settings = settings or get_settings()
+    return FairScheduler(
+        concurrency=admission_concurrency(settings),
+        max_queue_depth=settings.queue_max_depth,
+        max_queued_per_client=settings.queue_max_per_client,
+    )
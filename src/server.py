@@ -4,48 +4,244 @@ Production HTTP gateway for Lovable automation MCP service.
 Features:
 - Bearer token authentication
 - Per-IP rate limiting
-- Global concurrency control
+- Global concurrency control with fair per-client priority queueing
+- Single-flight coalescing of identical in-flight runs, with a short result cache
+- Warm Chromium pool shared across agent runs
+- Asynchronous job API (submit, poll by run_id, SSE progress stream)
 - Structured JSON logging
+- Prometheus-compatible /metrics
 - PRD output contract
 """
 
 import asyncio
+import hashlib
+import json
 import os
 import re
 import time
 import uuid
 from contextlib import asynccontextmanager
-from typing import Any, AsyncGenerator, Callable, Dict, Optional
+from typing import Any, AsyncGenerator, AsyncIterator, Callable, Dict, Literal, Optional
 
 import structlog
 from dotenv import load_dotenv
 from fastapi import FastAPI, Request, status
-from fastapi.responses import JSONResponse, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi_mcp import FastApiMCP  # type: ignore[import-untyped]
-from pydantic import BaseModel, Field
-from slowapi import Limiter
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+from slowapi import Limiter, _rate_limit_exceeded_handler
+from slowapi.errors import RateLimitExceeded
 from slowapi.util import get_remote_address
 
+from .accounts import create_account_pool, get_account_pool, set_account_pool
+from .agent_executor import (
+    create_agent_executor,
+    executor_workers,
+    get_agent_executor,
+    set_agent_executor,
+)
 from .agent_runner import run_browser_agent_async
-
-# Load environment variables from .env file
+from .auth_state import create_auth_store, set_auth_store
+from .browser_pool import create_browser_pool, get_browser_pool, set_browser_pool
+from .coalescer import Flight, create_coalescer
+from .errors import ErrorCode, classify_message, error_code_of, retry_budget
+from .events import EventSink, RunChannel, RunEvent, RunEventBus, run_event_sink
+from .fleet import create_fleet, get_fleet, set_fleet
+from .job_queue import create_job_backend, get_job_backend, set_job_backend
+from .metrics import (
+    CONTENT_TYPE,
+    queue_wait_seconds,
+    rate_limited_total,
+    registry,
+    run_duration_seconds,
+    runs_total,
+)
+from .run_config import RunConfig
+from .run_store import RunStoreFull, create_run_store
+from .scheduler import QueueFull, Ticket, admission_concurrency, create_scheduler
+from .session_keepalive import create_session_keepalives, keepalive_stats
+from .settings import Settings, changed_fields, get_settings, reload_settings, subscribe
+from .workers import create_worker_pool, get_worker_pool, set_worker_pool
+
+# MCP_* settings read .env themselves; this loads it for PORT and third-party libraries
 load_dotenv()
 
 logger = structlog.get_logger(__name__)
 
-# Configuration
+# Configuration: one validated settings snapshot (MCP_* env and .env), swapped on reload
 DEFAULT_BEARER_TOKEN = "test-token"
-BEARER_TOKEN = os.getenv("MCP_BEARER_TOKEN") or DEFAULT_BEARER_TOKEN
-RATE_LIMIT_PER_MIN = int(os.getenv("MCP_RATE_LIMIT_PER_MIN", "10"))
-AGENT_CONCURRENCY = int(os.getenv("MCP_AGENT_CONCURRENCY", "3"))
 VERSION = "0.1.0"
 
-# Global concurrency semaphore
-_concurrency_semaphore = asyncio.Semaphore(AGENT_CONCURRENCY)
+# Global concurrency: fair, priority-aware queueing in front of MCP_AGENT_CONCURRENCY slots
+scheduler = create_scheduler()
+
+# Identical in-flight runs share one execution (keyed by caller + task or Idempotency-Key)
+coalescer = create_coalescer()
+
+# In-memory auth state with its session expiry index; runs are rejected up front once the
+# session is dead
+auth_store = create_auth_store()
+set_auth_store(auth_store)
+
+# Submitted asynchronous runs, and the tasks executing them
+run_store = create_run_store()
+_run_tasks: set[asyncio.Task[None]] = set()
+
+# Live progress channels for submitted runs
+run_events = RunEventBus(
+    history_size=get_settings().run_events_history,
+    buffer_size=get_settings().run_events_buffer,
+)
+SSE_HEARTBEAT_SEC = 15.0
 
 # Rate limiter
 limiter = Limiter(key_func=get_remote_address)
 
+
+def _bearer_token() -> str:
+    return get_settings().bearer_token or DEFAULT_BEARER_TOKEN
+
+
+def _rate_limit() -> str:
+    """Per-IP run limit, read per request so a settings reload applies immediately."""
+    return f"{get_settings().rate_limit_per_min}/minute"
+
+
+def _apply_settings(old: Settings, new: Settings) -> None:
+    """Resize the scheduler, executor, caches and retry budget in place after a reload."""
+    scheduler.resize(admission_concurrency(new), new.queue_max_depth, new.queue_max_per_client)
+    coalescer.ttl_sec, coalescer.max_entries = new.coalesce_ttl_sec, new.coalesce_cache_max
+    run_store.max_runs, run_store.ttl_sec = new.run_store_max, new.run_ttl_sec
+    retry_budget.ratio = new.retry_budget_ratio
+    retry_budget.min_retries = new.retry_budget_min
+    retry_budget.window_sec = new.retry_budget_window_sec
+    fleet = get_fleet()
+    if fleet is not None:
+        fleet.resize(new.agent_concurrency, new.fleet_max_concurrency)
+    executor = get_agent_executor()
+    if executor is not None:
+        executor.resize(executor_workers(new))
+    # Worker processes read their settings at startup, so replace them to pick up the change.
+    workers = get_worker_pool()
+    if workers is not None and changed_fields(old, new):
+        workers.reload(new)
+
+
+subscribe(_apply_settings)
+
+
+def _scheduler_samples() -> list[tuple[dict[str, str], float]]:
+    stats = scheduler.stats()
+    samples = [({"state": "active"}, stats["active"]), ({"state": "capacity"}, stats["concurrency"])]
+    samples += [({"state": f"queued_{p}"}, n) for p, n in stats["queued_by_priority"].items()]
+    return samples
+
+
+def _browser_pool_stats() -> Optional[dict[str, Any]]:
+    """This process's pool, or the worker processes' pools added up."""
+    pool = get_browser_pool()
+    if pool is not None:
+        return pool.stats()
+    workers = get_worker_pool()
+    return workers.browser_pool_stats() if workers is not None else None
+
+
+def _browser_pool_samples() -> list[tuple[dict[str, str], float]]:
+    stats = _browser_pool_stats()
+    if stats is None:
+        return []
+    return [({"state": "idle"}, stats["idle"]), ({"state": "in_use"}, stats["in_use"])]
+
+
+def _agent_executor_samples() -> list[tuple[dict[str, str], float]]:
+    executor = get_agent_executor()
+    if executor is None:
+        return []
+    stats = executor.stats()
+    return [({"state": s}, stats[s]) for s in ("workers", "active", "idle", "queued")]
+
+
+def _worker_samples() -> list[tuple[dict[str, str], float]]:
+    workers = get_worker_pool()
+    if workers is None:
+        return []
+    stats = workers.stats()
+    draining = sum(1 for w in stats["workers"] if w["draining"])
+    return [
+        ({"state": "serving"}, len(stats["workers"]) - draining),
+        ({"state": "draining"}, draining),
+    ]
+
+
+def _worker_exit_samples() -> list[tuple[dict[str, str], float]]:
+    workers = get_worker_pool()
+    if workers is None:
+        return []
+    stats = workers.stats()
+    return [({"reason": "crash"}, stats["crashes"]), ({"reason": "retired"}, stats["retirements"])]
+
+
+def _account_samples() -> list[tuple[dict[str, str], float]]:
+    accounts = get_account_pool()
+    if accounts is None:
+        return []
+    return [({"account": a.name}, a.in_flight) for a in accounts.accounts]
+
+
+registry.callback(
+    "lovable_gateway_scheduler_slots",
+    "Scheduler slot occupancy: active runs, capacity and queued runs per priority.",
+    _scheduler_samples,
+)
+registry.callback(
+    "lovable_gateway_queue_rejected_total",
+    "Runs rejected because the scheduler queue was full.",
+    lambda: [({}, scheduler.stats()["rejected"])],
+    kind="counter",
+)
+registry.callback(
+    "lovable_gateway_coalesced_runs_total",
+    "Requests served by an identical in-flight run or the result cache.",
+    lambda: [
+        ({"source": "in_flight"}, coalescer.stats()["coalesced"]),
+        ({"source": "cache"}, coalescer.stats()["cache_hits"]),
+    ],
+    kind="counter",
+)
+registry.callback(
+    "lovable_gateway_browser_pool_browsers",
+    "Warm pooled browsers by state.",
+    _browser_pool_samples,
+)
+registry.callback(
+    "lovable_gateway_agent_executor_threads",
+    "Agent executor threads (workers, active, idle) and work queued for them.",
+    _agent_executor_samples,
+)
+registry.callback(
+    "lovable_gateway_worker_processes",
+    "Browser worker processes taking new runs (serving) or finishing before replacement.",
+    _worker_samples,
+)
+registry.callback(
+    "lovable_gateway_worker_exits_total",
+    "Browser worker processes that crashed or were replaced for memory or run count.",
+    _worker_exit_samples,
+    kind="counter",
+)
+registry.callback(
+    "lovable_gateway_account_runs_in_flight",
+    "Runs in flight per Lovable account (multi-account mode).",
+    _account_samples,
+)
+registry.callback(
+    "lovable_gateway_auth_session_seconds_left",
+    "Seconds until the indexed Lovable session expires.",
+    lambda: []
+    if auth_store is None or auth_store.seconds_left() is None
+    else [({}, auth_store.seconds_left())],
+)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
     """Manage application lifespan events."""
@@ -56,8 +252,74 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
         transport = getattr(mcp, "_http_transport", None)
     if transport is not None:
         await transport._ensure_session_manager_started()  # type: ignore[attr-defined]
-    yield
-    # Shutdown: cleanup if needed
+
+    # Blocking agent work (history, macros, browser profiles) gets its own bounded threads
+    executor = create_agent_executor()
+    set_agent_executor(executor)
+
+    # Shared job queue (MCP_JOB_BACKEND); account caps take fleet leases from it
+    set_job_backend(create_job_backend())
+
+    # Pre-launch the warm browser pool (disabled when MCP_BROWSER_POOL_SIZE=0)
+    # Load the auth state first: pooled contexts are launched with the parsed copy.
+    if auth_store is not None:
+        await auth_store.start()
+    accounts = create_account_pool()
+    if accounts is not None:
+        await accounts.start()
+        set_account_pool(accounts)
+    # With worker processes, Chromium runs in the workers (each with its own pool), not here;
+    # accounts stay here so their caps and quarantine cover every worker.
+    workers = create_worker_pool()
+    if workers is not None:
+        await workers.start()
+        set_worker_pool(workers)
+    pool = create_browser_pool() if workers is None else None
+    if pool is not None:
+        await pool.start()
+        set_browser_pool(pool)
+        if auth_store is not None:
+            auth_store.subscribe(pool.set_storage_state)
+    # One keep-alive for MCP_AUTH_STATE_PATH, or one per account store; with worker
+    # processes there is no pool here and the worker in slot 0 runs them instead
+    keepalives = create_session_keepalives(auth_store, pool, accounts)
+    app.state.session_keepalives = keepalives
+    for keepalive in keepalives:
+        await keepalive.start()
+    # With a shared backend this node also claims and executes runs queued by any node
+    fleet = create_fleet(_run_locally)
+    if fleet is not None:
+        await fleet.start()
+        set_fleet(fleet)
+    try:
+        yield
+    finally:
+        for keepalive in keepalives:
+            await keepalive.stop()
+        if auth_store is not None:
+            await auth_store.stop()
+        # Shutdown: stop submitted runs, then close pooled browsers
+        for task in list(_run_tasks):
+            task.cancel()
+        await asyncio.gather(*_run_tasks, return_exceptions=True)
+        if fleet is not None:
+            set_fleet(None)
+            await fleet.stop()
+        if workers is not None:
+            set_worker_pool(None)
+            await workers.stop()
+        if pool is not None:
+            set_browser_pool(None)
+            await pool.stop()
+        if accounts is not None:
+            set_account_pool(None)
+            await accounts.stop()
+        set_agent_executor(None)
+        executor.shutdown()
+        backend = get_job_backend()
+        set_job_backend(None)
+        if backend is not None:
+            backend.close()
 
 
 # FastAPI app
@@ -71,11 +333,36 @@ app = FastAPI(
 app.state.limiter = limiter
 
 
+@app.exception_handler(RateLimitExceeded)
+async def rate_limit_handler(request: Request, exc: RateLimitExceeded) -> Response:
+    """Count rate-limit rejections, then answer with slowapi's 429."""
+    rate_limited_total.inc(path=request.url.path)
+    return _rate_limit_exceeded_handler(request, exc)
+
+
+class RunConfigOverrides(BaseModel):
+    """Per-run settings a caller may change; timeout and retries can only be lowered."""
+
+    model_config = ConfigDict(extra="forbid")
+
+    llm_model_name: Optional[str] = None
+    llm_temperature: Optional[float] = Field(default=None, ge=0, le=2)
+    timeout_sec: Optional[int] = Field(default=None, ge=1)
+    retry_max: Optional[int] = Field(default=None, ge=1)
+    lovable_actions: Optional[bool] = None
+    fast_path_enabled: Optional[bool] = None
+
+
 class RunInput(BaseModel):
     """Input schema for the browser agent tool."""
 
     task: str
     context: Optional[Dict[str, Any]] = None
+    priority: Literal["high", "normal", "low"] = "normal"
+    config: Optional[RunConfigOverrides] = None
+
+    def overrides(self) -> Optional[Dict[str, Any]]:
+        return self.config.model_dump(exclude_none=True) if self.config is not None else None
 
 
 class RunOutput(BaseModel):
@@ -109,18 +396,80 @@ def _extract_preview_url(text: str) -> str | None:
     return None
 
 
+def _preview_url_from_steps(steps: list[dict[str, Any]]) -> str | None:
+    """Find the last preview URL the agent navigated to."""
+    for step in reversed(steps):
+        preview_url = _extract_preview_url(step.get("url") or "")
+        if preview_url:
+            return preview_url
+    return None
+
+
+def _client_key(request: Request) -> str:
+    """
+    Identify the caller for fair queueing.
+
+    Callers sharing the gateway token can tell themselves apart with an
+    X-Client-Id header; otherwise runs are grouped by bearer token.
+    """
+    client_id = request.headers.get("X-Client-Id")
+    if client_id:
+        return f"client:{client_id[:64]}"
+    token = request.headers.get("Authorization", "")
+    return "token:" + hashlib.sha256(token.encode()).hexdigest()[:12]
+
+
+def _dedup_key(payload: "RunInput", request: Request) -> str:
+    return coalescer.key_for(
+        _client_key(request),
+        payload.task,
+        payload.context,
+        request.headers.get("Idempotency-Key"),
+        payload.overrides(),
+    )
+
+
+def _queue_full_response(e: QueueFull) -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        content={"error": str(e)},
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
+def _observe_run(output: RunOutput, mode: str) -> RunOutput:
+    """Record a finished run's duration and outcome."""
+    run_duration_seconds.observe(output.elapsed_sec or 0.0, mode=mode)
+    runs_total.inc(mode=mode, outcome="ok" if output.ok else output.error_code or "UNKNOWN_ERROR")
+    return output
+
+
+def _auth_rejection(run_id: str, start_time: float, mode: str) -> Optional[RunOutput]:
+    """An AUTH_EXPIRED output when the indexed Lovable session is dead, else None."""
+    accounts = get_account_pool()
+    if accounts is not None:
+        reason = accounts.preflight()
+    else:
+        reason = auth_store.preflight() if auth_store is not None else None
+    if reason is None:
+        return None
+    logger.warning("Run rejected by auth preflight", run_id=run_id, reason=reason)
+    return _observe_run(
+        RunOutput(
+            ok=False,
+            status="error",
+            run_id=run_id,
+            error_code=ErrorCode.AUTH_EXPIRED.value,
+            message=reason,
+            elapsed_sec=time.time() - start_time,
+        ),
+        mode,
+    )
+
+
 def _map_error_code(error: str) -> str:
-    """Map exception to error code."""
-    error_lower = error.lower()
-    if "timeout" in error_lower or "timed out" in error_lower:
-        return "TIMEOUT_BUILD"
-    if "auth" in error_lower or "login" in error_lower or "expired" in error_lower:
-        return "AUTH_EXPIRED"
-    if "selector" in error_lower or "element" in error_lower or "ui" in error_lower:
-        return "UI_CHANGED"
-    if "network" in error_lower or "connection" in error_lower:
-        return "NETWORK_ERROR"
-    return "UNKNOWN_ERROR"
+    """Map an unclassified error message to an error code."""
+    return classify_message(error).value
 
 
 @app.middleware("http")
@@ -139,7 +488,7 @@ async def auth_middleware(request: Request, call_next: Callable[[Request], Any])
         )
 
     token = auth_header[7:]
-    if token != BEARER_TOKEN:
+    if token != _bearer_token():
         logger.warning("Invalid bearer token", path=request.url.path)
         return JSONResponse(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -149,64 +498,115 @@ async def auth_middleware(request: Request, call_next: Callable[[Request], Any])
     return await call_next(request)
 
 
+async def _fleet_stats() -> Optional[Dict[str, Any]]:
+    fleet, backend = get_fleet(), get_job_backend()
+    if fleet is None or backend is None:
+        return None
+    try:
+        queue = await backend.call(backend.stats)
+    except Exception as e:
+        queue = {"error": str(e)}
+    return {**fleet.stats(), "queue": queue}
+
+
+def _keepalive_stats() -> Optional[dict[str, Any]]:
+    workers = get_worker_pool()
+    if workers is not None:
+        return workers.keepalive_stats()
+    return keepalive_stats(getattr(app.state, "session_keepalives", []))
+
+
 @app.get("/health")
 async def health_check() -> Dict[str, Any]:
     """Health check endpoint."""
+    executor = get_agent_executor()
+    workers = get_worker_pool()
+    accounts = get_account_pool()
     return {
         "ok": True,
         "version": VERSION,
-        "concurrency": AGENT_CONCURRENCY,
-        "rate_limit_per_min": RATE_LIMIT_PER_MIN,
+        "concurrency": scheduler.concurrency,
+        "rate_limit_per_min": get_settings().rate_limit_per_min,
+        "browser_pool": _browser_pool_stats(),
+        "scheduler": scheduler.stats(),
+        "agent_executor": executor.stats() if executor is not None else None,
+        "workers": workers.stats() if workers is not None else None,
+        "fleet": await _fleet_stats(),
+        "coalescer": coalescer.stats(),
+        "auth": auth_store.stats() if auth_store is not None else None,
+        "accounts": accounts.stats() if accounts is not None else None,
+        "session_keepalive": _keepalive_stats(),
+        "retry_budget": retry_budget.stats(),
+        "runs": run_store.stats(),
+        "run_events": run_events.stats(),
     }
 
 
-@app.post(
-    "/tools/run_browser_agent",
-    response_model=RunOutput,
-    summary="Run Lovable browser agent",
-    operation_id="run_browser_agent",
-)
-@limiter.limit(f"{RATE_LIMIT_PER_MIN}/minute")  # type: ignore[misc]
-async def run_browser_agent_endpoint(payload: RunInput, request: Request) -> RunOutput:  # noqa: ARG001
-    """
-    Execute a browser automation task.
-
-    Returns PRD-compliant response with preview URL extraction and error mapping.
-    """
-    run_id = str(uuid.uuid4())
-    start_time = time.time()
-
-    logger.info("Browser agent request", run_id=run_id, task=payload.task[:100])
-
+async def _run_locally(
+    task: str, context: Optional[Dict[str, Any]], config: RunConfig
+) -> Dict[str, Any]:
+    """Run on this node: in a worker process when there are workers, else in-process."""
+    workers = get_worker_pool()
+    runner = workers.run if workers is not None else run_browser_agent_async
+    return await runner(task, context, config)
+
+
+async def _execute_run(
+    run_id: str,
+    payload: RunInput,
+    start_time: float,
+    ticket: Optional[Ticket] = None,
+    mode: str = "sync",
+) -> RunOutput:
+    """Run the agent and shape its result; the caller holds a scheduler slot."""
+    execution_start = time.time()
+    timings: dict[str, Any] = {
+        "queue_wait_sec": round(ticket.queue_wait_sec, 3) if ticket is not None else 0.0,
+    }
+    if ticket is not None:
+        queue_wait_seconds.observe(ticket.queue_wait_sec, priority=ticket.priority)
     try:
-        async with _concurrency_semaphore:
-            result = await run_browser_agent_async(payload.task, payload.context)
+        config = RunConfig.from_settings().with_overrides(payload.overrides())
+        fleet = get_fleet()
+        if fleet is not None:
+            # Any node may execute it; that node applies the overrides to its own settings.
+            result = await fleet.run(
+                payload.task, payload.context, payload.overrides(), job_id=run_id
+            )
+        else:
+            result = await _run_locally(payload.task, payload.context, config)
 
         elapsed = time.time() - start_time
+        timings["execution_sec"] = round(time.time() - execution_start, 3)
 
         if not result.get("ok"):
             error_msg = result.get("error", "Unknown error")
-            error_code = _map_error_code(error_msg)
+            error_code = result.get("error_code") or _map_error_code(error_msg)
             logger.error(
                 "Browser agent failed",
                 run_id=run_id,
                 error_code=error_code,
                 elapsed=elapsed,
             )
-            return RunOutput(
-                ok=False,
-                status="error",
-                run_id=run_id,
-                error_code=error_code,
-                message=error_msg,
-                raw=result.get("result_text", ""),
-                steps=result.get("steps", []),
-                debug=result.get("debug", {}),
-                elapsed_sec=elapsed,
+            return _observe_run(
+                RunOutput(
+                    ok=False,
+                    status="error",
+                    run_id=run_id,
+                    error_code=error_code,
+                    message=error_msg,
+                    raw=result.get("result_text", ""),
+                    steps=result.get("steps", []),
+                    debug={**result.get("debug", {}), **timings},
+                    elapsed_sec=elapsed,
+                ),
+                mode,
             )
 
         result_text = result.get("result_text", "")
-        preview_url = _extract_preview_url(result_text)
+        preview_url = _extract_preview_url(result_text) or _preview_url_from_steps(
+            result.get("steps", [])
+        )
 
         logger.info(
             "Browser agent succeeded",
@@ -215,39 +615,356 @@ async def run_browser_agent_endpoint(payload: RunInput, request: Request) -> Run
             elapsed=elapsed,
         )
 
-        return RunOutput(
-            ok=True,
-            status="done",
-            run_id=run_id,
-            preview_url=preview_url,
-            project_url=result.get("project_url"),
-            raw=result_text,
-            steps=result.get("steps", []),
-            debug=result.get("debug", {}),
-            elapsed_sec=elapsed,
+        return _observe_run(
+            RunOutput(
+                ok=True,
+                status="done",
+                run_id=run_id,
+                preview_url=preview_url,
+                project_url=result.get("project_url"),
+                raw=result_text,
+                steps=result.get("steps", []),
+                debug={**result.get("debug", {}), **timings},
+                elapsed_sec=elapsed,
+            ),
+            mode,
         )
 
     except Exception as e:
         elapsed = time.time() - start_time
-        error_code = _map_error_code(str(e))
+        timings["execution_sec"] = round(time.time() - execution_start, 3)
+        error_code = error_code_of(e) or _map_error_code(str(e))
         logger.exception(
             "Unexpected error in browser agent",
             run_id=run_id,
             error_code=error_code,
             elapsed=elapsed,
         )
-        return RunOutput(
-            ok=False,
-            status="error",
-            run_id=run_id,
-            error_code=error_code,
-            message=str(e),
-            elapsed_sec=elapsed,
+        return _observe_run(
+            RunOutput(
+                ok=False,
+                status="error",
+                run_id=run_id,
+                error_code=error_code,
+                message=str(e),
+                debug=timings,
+                elapsed_sec=elapsed,
+            ),
+            mode,
         )
 
 
+async def _attached_output(flight: Flight) -> Optional[RunOutput]:
+    """The output of the run a duplicate attached to; None when that run was abandoned."""
+    try:
+        return await flight.result()  # type: ignore[no-any-return]
+    except asyncio.CancelledError:
+        task = asyncio.current_task()
+        if not flight.abandoned or (task is not None and task.cancelling()):
+            raise
+        return None
+
+
+@app.post(
+    "/tools/run_browser_agent",
+    response_model=RunOutput,
+    summary="Run Lovable browser agent",
+    operation_id="run_browser_agent",
+)
+@limiter.limit(_rate_limit)  # type: ignore[misc]
+async def run_browser_agent_endpoint(payload: RunInput, request: Request) -> RunOutput:
+    """
+    Execute a browser automation task.
+
+    Returns PRD-compliant response with preview URL extraction and error mapping.
+    """
+    run_id = str(uuid.uuid4())
+    start_time = time.time()
+
+    logger.info("Browser agent request", run_id=run_id, task=payload.task[:100])
+
+    rejected = _auth_rejection(run_id, start_time, "sync")
+    if rejected is not None:
+        return rejected
+
+    dedup_key = _dedup_key(payload, request)
+    flight = coalescer.get(dedup_key)
+    while flight is not None:
+        logger.info("Attached to identical run", run_id=flight.run_id, done=flight.done)
+        output = await _attached_output(flight)
+        if output is not None:
+            return output
+        # The leading request went away before its run finished: run it again as the leader.
+        logger.info("Identical run was abandoned, running it again", run_id=flight.run_id)
+        flight = coalescer.get(dedup_key)
+
+    try:
+        ticket = scheduler.submit(_client_key(request), payload.priority)
+    except QueueFull as e:
+        return _queue_full_response(e)  # type: ignore[return-value]
+
+    flight = coalescer.begin(dedup_key, run_id)
+    try:
+        async with scheduler.run(ticket):
+            output = await _execute_run(run_id, payload, start_time, ticket)
+    except BaseException:
+        coalescer.abandon(dedup_key, flight)
+        raise
+    coalescer.complete(dedup_key, flight, output)
+    return output
+
+
+def _channel_sink(channel: RunChannel) -> EventSink:
+    """Publish runner events to a channel, surfacing the preview URL once seen."""
+    seen_preview: set[str] = set()
+
+    def sink(event: str, data: dict[str, Any]) -> None:
+        channel.publish(event, data)
+        if event == "url":
+            preview_url = _extract_preview_url(data.get("url", ""))
+            if preview_url and preview_url not in seen_preview:
+                seen_preview.add(preview_url)
+                channel.publish("preview_url", {"preview_url": preview_url})
+
+    return sink
+
+
+def _finish_submitted(run_id: str, output: RunOutput) -> None:
+    run_store.finish(run_id, output)
+    channel = run_events.get(run_id)
+    if channel is not None:
+        channel.publish("done", output.model_dump())
+    run_events.close(run_id)
+
+
+def _cancelled_output(run_id: str, start_time: float) -> RunOutput:
+    return RunOutput(
+        ok=False,
+        status="error",
+        run_id=run_id,
+        error_code="UNKNOWN_ERROR",
+        message="Run cancelled: gateway shutting down",
+        elapsed_sec=time.time() - start_time,
+    )
+
+
+async def _run_submitted(
+    run_id: str,
+    payload: RunInput,
+    start_time: float,
+    ticket: Ticket,
+    dedup_key: str,
+    flight: Flight,
+) -> None:
+    """Execute a submitted run in the background and store its output."""
+    channel = run_events.get(run_id)
+    if channel is not None:
+        run_event_sink.set(_channel_sink(channel))
+    try:
+        async with scheduler.run(ticket):
+            run_store.mark_running(run_id)
+            if channel is not None:
+                channel.publish("status", {"status": "running"})
+            output = await _execute_run(run_id, payload, start_time, ticket, mode="async")
+    except asyncio.CancelledError:
+        coalescer.abandon(dedup_key, flight)
+        _finish_submitted(run_id, _cancelled_output(run_id, start_time))
+        raise
+    coalescer.complete(dedup_key, flight, output)
+    _finish_submitted(run_id, output)
+
+
+async def _follow_flight(flight: Flight, start_time: float) -> None:
+    """Store the output of a synchronous run that a submission attached to."""
+    try:
+        output = await flight.result()
+    except asyncio.CancelledError:
+        run_store.finish(flight.run_id, _cancelled_output(flight.run_id, start_time))
+        if not flight.abandoned:
+            raise
+        return
+    run_store.finish(flight.run_id, output)
+
+
+def _spawn_run_task(coro: Any) -> None:
+    task = asyncio.create_task(coro)
+    _run_tasks.add(task)
+    task.add_done_callback(_run_tasks.discard)
+
+
+def _attach_submitted(flight: Flight, payload: RunInput) -> Any:
+    """Answer a duplicate submission with the run it coalesced into."""
+    record = run_store.get(flight.run_id)
+    if record is None:
+        # The original was a synchronous call (or its record expired): track it under its run_id.
+        record = run_store.create(flight.run_id, payload.task, payload.context)
+        if flight.done:
+            run_store.finish(flight.run_id, flight.future.result())
+        else:
+            _spawn_run_task(_follow_flight(flight, record.created_at))
+    logger.info("Attached to identical run", run_id=flight.run_id, status=record.status)
+    if record.done:
+        return record.output
+    return _pending_output(flight.run_id, record.status)
+
+
+def _pending_output(run_id: str, status_: str) -> RunOutput:
+    return RunOutput(ok=True, status=status_, run_id=run_id)
+
+
+@app.post(
+    "/runs",
+    response_model=RunOutput,
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Submit Lovable browser agent run",
+    operation_id="submit_browser_agent_run",
+)
+@limiter.limit(_rate_limit)  # type: ignore[misc]
+async def submit_run_endpoint(payload: RunInput, request: Request) -> Any:
+    """
+    Queue a browser automation task and return its run_id immediately.
+
+    Poll GET /runs/{run_id} for the result, or follow GET /runs/{run_id}/events.
+    An identical submission still in flight (or recently finished) returns the
+    existing run_id instead of starting a new run.
+    """
+    run_id = str(uuid.uuid4())
+    dedup_key = _dedup_key(payload, request)
+    try:
+        flight = coalescer.get(dedup_key)
+        if flight is not None:
+            return _attach_submitted(flight, payload)
+        record = run_store.create(run_id, payload.task, payload.context)
+        rejected = _auth_rejection(run_id, record.created_at, "async")
+        if rejected is not None:
+            run_store.finish(run_id, rejected)
+            return rejected
+    except RunStoreFull as e:
+        logger.warning("Run submission rejected", error=str(e))
+        return JSONResponse(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            content={"error": str(e)},
+        )
+    try:
+        ticket = scheduler.submit(_client_key(request), payload.priority)
+    except QueueFull as e:
+        run_store.discard(run_id)
+        return _queue_full_response(e)
+
+    logger.info("Browser agent run submitted", run_id=run_id, task=payload.task[:100])
+    run_events.open(run_id).publish("status", {"status": record.status})
+    flight = coalescer.begin(dedup_key, run_id)
+    _spawn_run_task(
+        _run_submitted(run_id, payload, record.created_at, ticket, dedup_key, flight)
+    )
+    return _pending_output(run_id, record.status)
+
+
+@app.get(
+    "/runs/{run_id}",
+    response_model=RunOutput,
+    summary="Get Lovable browser agent run",
+    operation_id="get_browser_agent_run",
+)
+async def get_run_endpoint(run_id: str) -> Any:
+    """
+    Fetch a submitted run.
+
+    Returns status "queued" or "running" while pending, then the same payload
+    as POST /tools/run_browser_agent.
+    """
+    record = run_store.get(run_id)
+    if record is None:
+        return JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content={"error": "Run not found"},
+        )
+    if record.done:
+        return record.output
+    return _pending_output(run_id, record.status)
+
+
+def _format_sse(item: RunEvent) -> str:
+    return f"id: {item.id}\nevent: {item.event}\ndata: {json.dumps(item.data, default=str)}\n\n"
+
+
+async def _stream_channel(channel: RunChannel) -> AsyncIterator[str]:
+    async for item in channel.subscribe().events(heartbeat_sec=SSE_HEARTBEAT_SEC):
+        # Comment lines keep proxies from closing an idle stream between agent steps.
+        yield ": keep-alive\n\n" if item is None else _format_sse(item)
+
+
+@app.get(
+    "/runs/{run_id}/events",
+    summary="Stream Lovable browser agent run progress",
+    operation_id="stream_browser_agent_run",
+    response_class=StreamingResponse,
+)
+async def run_events_endpoint(run_id: str) -> Any:
+    """
+    Server-Sent Events stream of a submitted run.
+
+    Emits ``status``, ``step``, ``url`` and ``preview_url`` events as the agent
+    produces them, then a final ``done`` event carrying the RunOutput.
+    """
+    channel = run_events.get(run_id)
+    if channel is None:
+        record = run_store.get(run_id)
+        if record is None or not record.done:
+            return JSONResponse(
+                status_code=status.HTTP_404_NOT_FOUND,
+                content={"error": "Run not found"},
+            )
+        # Finished before the client connected: replay just the final output.
+        channel = RunChannel(run_id)
+        channel.publish("done", record.output.model_dump())
+        channel.close()
+
+    return StreamingResponse(
+        _stream_channel(channel),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/admin/reload-settings", include_in_schema=False)
+async def reload_settings_endpoint() -> Response:
+    """
+    Re-read the MCP_* environment and .env and swap in the new settings.
+
+    Invalid values are rejected with 422 and the running settings are kept.
+    The scheduler is resized in place; runs already executing are unaffected.
+    """
+    old = get_settings()
+    try:
+        new = reload_settings()
+    except ValidationError as e:
+        logger.warning("Settings reload rejected", errors=e.error_count())
+        return JSONResponse(
+            status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+            content={
+                "error": "Invalid settings; keeping the current ones",
+                "fields": sorted({".".join(map(str, err["loc"])) for err in e.errors()}),
+            },
+        )
+    return JSONResponse(
+        content={
+            "ok": True,
+            "changed": changed_fields(old, new),
+            "concurrency": scheduler.concurrency,
+        }
+    )
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint() -> Response:
+    """Prometheus scrape endpoint (text exposition format)."""
+    return PlainTextResponse(registry.render(), media_type=CONTENT_TYPE)
+
+
 # Mount MCP after routes are registered so middleware and schemas apply to /mcp.
-mcp = FastApiMCP(app)
+# The SSE stream never completes as a single response, so it is not an MCP tool.
+mcp = FastApiMCP(app, exclude_operations=["stream_browser_agent_run"])
 mcp.mount_http()
 
 
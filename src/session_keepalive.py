@@ -0,0 +1,193 @@
+"""
+Background keep-alive for the Lovable session.
+
+Every interval_sec the keep-alive borrows an idle pooled browser, reloads the
+Lovable dashboard in its already-authenticated context and reads the context's
+storage state back. Lovable refreshes its session cookies/tokens on that
+visit; when the captured session differs from the stored one and doesn't end
+sooner, it is written to the auth state file and swapped into the store, so
+the session is extended without anyone re-running save_auth_state.py.
+
+With several Lovable accounts (MCP_AUTH_STATE_DIR) there is one keep-alive per
+account store; each borrows a browser bound to its account, and their rounds
+are spread over the interval so they don't compete for idle browsers.
+"""
+
+import asyncio
+import time
+from typing import Any, Optional
+
+import structlog
+
+from src.accounts import AccountPool
+from src.auth_state import SESSION_COOKIE_PREFIX, AuthStateStore, index_session
+from src.browser_pool import BrowserPool
+from src.lovable_adapter.selectors import DASHBOARD_URL, DEFAULT_TIMEOUT
+from src.lovable_adapter.settle import settle_max_ms, wait_for_page_settled
+from src.metrics import auth_refresh_total
+from src.settings import get_settings
+
+logger = structlog.get_logger(__name__)
+
+
+def _session_cookies(state: Optional[dict[str, Any]]) -> dict[str, tuple[Any, Any]]:
+    """Session cookie name -> (value, expires), for telling whether a refresh changed anything."""
+    if not state:
+        return {}
+    return {
+        str(c.get("name")): (c.get("value"), c.get("expires"))
+        for c in state.get("cookies", [])
+        if str(c.get("name", "")).startswith(SESSION_COOKIE_PREFIX)
+    }
+
+
+class SessionKeepAlive:
+    """Periodically refresh the Lovable session through a pooled browser."""
+
+    def __init__(
+        self,
+        store: AuthStateStore,
+        pool: BrowserPool,
+        interval_sec: float = 1800.0,
+        url: str = DASHBOARD_URL,
+        account: Optional[str] = None,
+        offset_sec: float = 0.0,
+    ) -> None:
+        self.store = store
+        self.pool = pool
+        self.interval_sec = interval_sec
+        self.url = url
+        # Set for an account store: browsers are checked out bound to that account.
+        self.account = account
+        self.offset_sec = offset_sec
+        self._task: Optional[asyncio.Task[None]] = None
+        self._last_result: Optional[str] = None
+        self._last_run_at: Optional[float] = None
+        self._refreshes = 0
+
+    async def refresh(self) -> str:
+        """Run one keep-alive round and return its result."""
+        if self.pool.stats()["idle"] == 0:
+            # Don't take a browser a queued run is waiting for; try again next round.
+            return self._finish("busy")
+        try:
+            auth = self.store if self.account is not None else None
+            async with self.pool.acquire(auth) as browser:
+                state = await self._capture(browser)
+                if state is None:
+                    return self._finish("logged_out")
+                if not self._is_newer(state):
+                    return self._finish("unchanged")
+                self.store.save(state)
+                # This context already holds the refreshed session; don't relaunch it.
+                browser.state_generation = (
+                    self.store.snapshot.version if auth is not None else self.pool.state_generation
+                )
+        except Exception as e:
+            logger.warning("Session keep-alive failed", account=self.account, error=str(e))
+            return self._finish("error")
+        self._refreshes += 1
+        logger.info(
+            "Lovable session refreshed",
+            account=self.account,
+            expires_at=self.store.index.expires_at,
+            source=self.store.index.source,
+        )
+        return self._finish("refreshed")
+
+    async def _capture(self, browser: Any) -> Optional[dict[str, Any]]:
+        """Reload Lovable in the pooled context and return its storage state, None if logged out."""
+        context = browser.context
+        if context is None:
+            raise RuntimeError("Pooled browser has no context")
+        page = context.pages[0] if context.pages else await context.new_page()
+        await page.goto(self.url, wait_until="domcontentloaded", timeout=DEFAULT_TIMEOUT)
+        await wait_for_page_settled(page, timeout_ms=settle_max_ms())
+        if "login" in page.url.lower():
+            return None
+        state: dict[str, Any] = await context.storage_state()
+        return state if index_session(state).has_session else None
+
+    def _is_newer(self, state: dict[str, Any]) -> bool:
+        """True when the captured session changed and doesn't expire before the stored one."""
+        current = self.store.snapshot.state
+        if _session_cookies(state) == _session_cookies(current):
+            return False
+        new_expiry = index_session(state).expires_at
+        old_expiry = self.store.index.expires_at
+        return new_expiry is None or old_expiry is None or new_expiry >= old_expiry
+
+    def _finish(self, result: str) -> str:
+        self._last_result = result
+        self._last_run_at = time.time()
+        auth_refresh_total.inc(result=result)
+        if result == "logged_out":
+            logger.warning(
+                "Session keep-alive found Lovable logged out; refresh the auth state",
+                account=self.account,
+            )
+        return result
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "interval_sec": self.interval_sec,
+            "last_result": self._last_result,
+            "last_run_at": self._last_run_at,
+            "refreshes": self._refreshes,
+        }
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self) -> None:
+        await asyncio.sleep(self.offset_sec)
+        while True:
+            await asyncio.sleep(self.interval_sec)
+            await self.refresh()
+
+
+def create_session_keepalives(
+    store: Optional[AuthStateStore],
+    pool: Optional[BrowserPool],
+    accounts: Optional[AccountPool] = None,
+) -> list[SessionKeepAlive]:
+    """
+    Build the keep-alives from MCP_AUTH_KEEPALIVE_SEC (0 disables them).
+
+    One per account store when accounts are given, else one for the single
+    auth store. Needs the browser pool; returns an empty list otherwise.
+    """
+    interval_sec = get_settings().auth_keepalive_sec
+    if pool is None or interval_sec <= 0:
+        return []
+    if accounts is not None:
+        count = len(accounts.accounts)
+        return [
+            SessionKeepAlive(
+                store=account.store,
+                pool=pool,
+                interval_sec=interval_sec,
+                account=account.name,
+                offset_sec=interval_sec * index / count,
+            )
+            for index, account in enumerate(accounts.accounts)
+        ]
+    if store is None:
+        return []
+    return [SessionKeepAlive(store=store, pool=pool, interval_sec=interval_sec)]
+
+
+def keepalive_stats(keepalives: list[SessionKeepAlive]) -> Optional[dict[str, Any]]:
+    """/health view: the single keep-alive's stats, or per account in multi-account mode."""
+    if not keepalives:
+        return None
+    if keepalives[0].account is None:
+        return keepalives[0].stats()
+    return {"accounts": {k.account: k.stats() for k in keepalives}}
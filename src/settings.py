@@ -0,0 +1,143 @@
+"""
+Typed gateway settings, parsed once and swapped atomically on reload.
+
+Settings are read from the MCP_* environment (and .env) into a frozen
+snapshot at startup. Every module reads the same snapshot through
+get_settings() instead of converting environment strings on every run.
+reload_settings() validates a fresh snapshot first and only then swaps it in
+and notifies listeners (the server resizes the scheduler), so a bad value
+never replaces a working configuration.
+"""
+
+from typing import Callable, Optional
+
+import structlog
+from pydantic import Field
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+logger = structlog.get_logger(__name__)
+
+
+class Settings(BaseSettings):
+    """One immutable snapshot of the gateway configuration."""
+
+    model_config = SettingsConfigDict(
+        env_prefix="MCP_", env_file=".env", extra="ignore", frozen=True
+    )
+
+    # Gateway
+    bearer_token: str = Field(default="", repr=False)
+    rate_limit_per_min: int = Field(default=10, ge=1)
+    agent_concurrency: int = Field(default=3, ge=1)
+    agent_executor_workers: int = Field(default=0, ge=0)  # 0: match agent_concurrency
+    queue_max_depth: int = Field(default=1000, ge=0)
+    queue_max_per_client: int = Field(default=100, ge=0)
+    coalesce_ttl_sec: float = Field(default=300, ge=0)
+    coalesce_cache_max: int = Field(default=1000, ge=1)
+    run_store_max: int = Field(default=10000, ge=1)
+    run_ttl_sec: float = Field(default=3600, ge=0)
+    run_events_history: int = Field(default=50, ge=0)
+    run_events_buffer: int = Field(default=100, ge=1)
+
+    # "memory" runs what each gateway process accepts; "sqlite:///path" shares one job
+    # queue between gateway processes on the same host
+    job_backend: str = Field(default="memory", pattern=r"^(memory|sqlite:///.+)$")
+    job_poll_sec: float = Field(default=0.5, gt=0)
+    job_retention_sec: float = Field(default=3600, ge=0)
+    fleet_max_concurrency: int = Field(default=0, ge=0)  # 0: only the per-process limits
+    node_id: str = ""
+
+    # Worker processes (0 runs browsers in the gateway process; a reload replaces the workers)
+    worker_processes: int = Field(default=0, ge=0)
+    worker_max_rss_mb: float = Field(default=1024, ge=0)
+    worker_max_jobs: int = Field(default=0, ge=0)
+
+    # Runs
+    agent_timeout_sec: int = Field(default=600, ge=1)
+    agent_retry_max: int = Field(default=2, ge=1)
+    agent_lovable_actions: bool = True
+    fast_path_enabled: bool = True
+    retry_budget_ratio: float = Field(default=0.2, ge=0)
+    retry_budget_min: int = Field(default=3, ge=0)
+    retry_budget_window_sec: float = Field(default=60, gt=0)
+    macros_enabled: bool = False
+    macro_dir: str = "./data/macros"
+    macro_max_failures: int = Field(default=2, ge=1)
+    page_settle_quiet_ms: int = Field(default=500, ge=0)
+    page_settle_max_ms: int = Field(default=5000, ge=0)
+
+    # Auth and accounts
+    auth_state_path: str = "./auth.json"
+    auth_state_dir: str = ""  # one storage state per account; "" uses auth_state_path only
+    auth_expiry_skew_sec: float = Field(default=60, ge=0)
+    auth_recheck_sec: float = Field(default=5, gt=0)
+    auth_preflight: bool = True
+    auth_keepalive_sec: float = Field(default=1800, ge=0)  # 0: no keep-alive
+    account_max_concurrency: int = Field(default=1, ge=1)
+    account_quarantine_after: int = Field(default=3, ge=1)
+    account_quarantine_sec: float = Field(default=300, ge=0)
+
+    # LLM
+    llm_provider: str = "openrouter"
+    llm_model_name: str = "openai/gpt-5-mini"
+    llm_num_ctx: int = Field(default=8000, ge=1)
+    llm_temperature: float = Field(default=0.2, ge=0, le=2)
+    llm_base_url: str = "https://openrouter.ai/api/v1"
+    llm_openrouter_api_key: str = Field(default="", repr=False)
+
+    # Browser
+    browser_headless: bool = True
+    browser_window_width: int = Field(default=1440, ge=1)
+    browser_window_height: int = Field(default=1080, ge=1)
+    browser_pool_size: int = Field(default=0, ge=0)  # read at startup; 0 disables the pool
+    browser_pool_max_uses: int = Field(default=20, ge=1)
+    browser_pool_health_interval_sec: float = Field(default=30, gt=0)
+    network_block_profile: str = Field(default="lovable", pattern=r"(?i)^(lovable|off|none)?$")
+    network_block_resource_types: Optional[str] = None  # comma-separated; replaces the defaults
+    network_block_url_patterns: str = ""  # comma-separated regexes stubbed in addition
+
+
+SettingsListener = Callable[[Settings, Settings], None]
+
+_settings: Optional[Settings] = None
+_listeners: list[SettingsListener] = []
+
+
+def get_settings() -> Settings:
+    """The current snapshot (parsed on first use)."""
+    global _settings
+    if _settings is None:
+        _settings = Settings()
+    return _settings
+
+
+def subscribe(listener: SettingsListener) -> None:
+    """Call listener(old, new) after every successful reload."""
+    _listeners.append(listener)
+
+
+def changed_fields(old: Settings, new: Settings) -> list[str]:
+    """Names of the settings that differ between two snapshots."""
+    return sorted(
+        name for name in Settings.model_fields if getattr(old, name) != getattr(new, name)
+    )
+
+
+def reload_settings() -> Settings:
+    """
+    Parse the environment again and swap in the new snapshot.
+
+    Raises pydantic.ValidationError, leaving the current snapshot in place,
+    when any value is invalid.
+    """
+    global _settings
+    new = Settings()
+    old = get_settings()
+    _settings = new
+    logger.info("Settings reloaded", changed=changed_fields(old, new))
+    for listener in _listeners:
+        try:
+            listener(old, new)
+        except Exception as e:
+            logger.warning("Settings listener failed", error=str(e))
+    return new
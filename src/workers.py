@@ -0,0 +1,583 @@
+"""
+Out-of-process browser workers.
+
+With MCP_WORKER_PROCESSES > 0 the gateway process drives no Chromium itself:
+N long-lived worker processes each bring up their own auth state, account
+stores, agent executor and warm browser pool, and execute runs sent to them
+over a local pipe. The API process keeps scheduling, auth preflight, run events
+and account selection, so heavy agent runs (vision screenshots, large DOMs) no longer compete with
+request handling for the GIL or memory, and a crash takes down one worker
+instead of the gateway.
+
+Runs go to the worker with the fewest runs in flight. With several Lovable
+accounts the gateway takes the account slot (and its lease) before sending the
+run and records the outcome, so per-account caps and quarantine hold across
+all workers; the worker only runs as the account named in the config. A
+settings reload replaces every worker so the new values reach them. Progress events are
+forwarded back and published to the run's channel as if the run were local. A
+worker that dies fails its in-flight runs and is restarted; one that grows past
+MCP_WORKER_MAX_RSS_MB (or has served MCP_WORKER_MAX_JOBS runs) is replaced:
+a fresh worker takes new runs while the old one finishes its current ones.
+
+Each worker reports every few seconds and before each result: its RSS (so the
+memory limit applies to a long run, not just between runs), its browser pool
+and keep-alive stats for /health, and its drained metric series, which the
+gateway merges so /metrics covers every worker. Retry-budget decisions are
+made by the gateway's budget, so the retry ratio is global rather than per
+worker. Only the worker in slot 0 runs the session keep-alive; the others pick
+the refreshed state up from the auth file.
+"""
+
+import asyncio
+import itertools
+import multiprocessing
+import os
+import resource
+import signal
+import threading
+import time
+from dataclasses import dataclass, field
+from multiprocessing.connection import Connection
+from multiprocessing.process import BaseProcess
+from typing import Any, Awaitable, Callable, Optional
+
+import structlog
+
+from src.accounts import get_account_pool
+from src.errors import AuthExpired, ErrorCode, classify_error, retry_budget
+from src.events import EventSink, run_event_sink
+from src.metrics import registry
+from src.run_config import RunConfig
+from src.settings import Settings, get_settings
+
+logger = structlog.get_logger(__name__)
+
+Runner = Callable[[str, Optional[dict[str, Any]], RunConfig], Awaitable[dict[str, Any]]]
+
+# Messages are tuples. Gateway -> worker: ("run", job_id, task, context, config),
+# ("cancel", job_id), ("retry_allowed", request_id, allowed), ("stop",).
+# Worker -> gateway: ("event", job_id, event, data), ("stats", report),
+# ("done", job_id, result), ("retry_attempt",), ("retry_spend", request_id).
+
+
+def _rss_mb() -> float:
+    """This process's resident memory in MB."""
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # Peak rather than current RSS, but never lower than it.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _read_into_loop(
+    conn: Connection,
+    loop: asyncio.AbstractEventLoop,
+    on_message: Callable[[Optional[tuple[Any, ...]]], None],
+    name: str,
+) -> threading.Thread:
+    """
+    Receive from conn on a thread and hand each message to on_message on the loop.
+
+    recv() blocks until the whole message has arrived, which for a large result
+    can be well after the pipe first turns readable. None marks the end of the pipe.
+    """
+
+    def read() -> None:
+        while True:
+            try:
+                message = conn.recv()
+            except Exception:
+                # EOF, a closed pipe or a message that won't unpickle: the peer is gone.
+                message = None
+            try:
+                loop.call_soon_threadsafe(on_message, message)
+            except RuntimeError:
+                return  # the loop has closed
+            if message is None:
+                return
+
+    thread = threading.Thread(target=read, name=name, daemon=True)
+    thread.start()
+    return thread
+
+
+async def _start_runtime(slot: int) -> tuple[list[Callable[[], Awaitable[None]]], list[Any]]:
+    """Bring up what the gateway lifespan would for local runs; returns stops and keep-alives."""
+    from src.accounts import create_account_pool, set_account_pool
+    from src.agent_executor import create_agent_executor, set_agent_executor
+    from src.auth_state import create_auth_store, set_auth_store
+    from src.browser_pool import create_browser_pool, set_browser_pool
+    from src.session_keepalive import create_session_keepalives
+
+    stops: list[Callable[[], Awaitable[None]]] = []
+    auth_store = create_auth_store()
+    set_auth_store(auth_store)
+    await auth_store.start()
+    stops.append(auth_store.stop)
+
+    # Only for the account stores: the gateway picks the account and holds its slot.
+    accounts = create_account_pool()
+    if accounts is not None:
+        await accounts.start()
+        set_account_pool(accounts)
+        stops.append(accounts.stop)
+
+    executor = create_agent_executor()
+    set_agent_executor(executor)
+
+    async def stop_executor() -> None:
+        set_agent_executor(None)
+        executor.shutdown()
+
+    stops.append(stop_executor)
+
+    pool = create_browser_pool()
+    if pool is not None:
+        await pool.start()
+        set_browser_pool(pool)
+        auth_store.subscribe(pool.set_storage_state)
+        stops.append(pool.stop)
+
+    # One worker refreshes the sessions; the others reload the saved auth file.
+    keepalives = create_session_keepalives(auth_store, pool, accounts) if slot == 0 else []
+    for keepalive in keepalives:
+        await keepalive.start()
+        stops.append(keepalive.stop)
+    return stops, keepalives
+
+
+async def _serve(
+    conn: Connection, slot: int, runner: Optional[Runner], stats_interval_sec: float
+) -> None:
+    """Worker loop: run jobs from the pipe until told to stop or the gateway goes away."""
+    from src.browser_pool import get_browser_pool
+    from src.session_keepalive import keepalive_stats
+
+    if runner is None:
+        from src.agent_runner import run_browser_agent_async
+
+        runner = run_browser_agent_async
+    loop = asyncio.get_running_loop()
+    inbox: asyncio.Queue[Optional[tuple[Any, ...]]] = asyncio.Queue()
+    jobs: dict[int, asyncio.Task[None]] = {}
+    retry_replies: dict[int, asyncio.Future[bool]] = {}
+    retry_ids = itertools.count(1)
+    # Events can be emitted from agent executor threads while the loop sends.
+    send_lock = threading.Lock()
+
+    def send(message: tuple[Any, ...]) -> None:
+        try:
+            with send_lock:
+                conn.send(message)
+        except OSError as e:
+            logger.debug("Failed to reach gateway", error=str(e))
+
+    async def spend_retry() -> bool:
+        request_id = next(retry_ids)
+        retry_replies[request_id] = loop.create_future()
+        send(("retry_spend", request_id))
+        try:
+            return await retry_replies[request_id]
+        finally:
+            retry_replies.pop(request_id, None)
+
+    def report() -> dict[str, Any]:
+        pool = get_browser_pool()
+        return {
+            "rss_mb": _rss_mb(),
+            "metrics": registry.drain(),
+            "browser_pool": pool.stats() if pool is not None else None,
+            "session_keepalive": keepalive_stats(keepalives) if keepalives else None,
+        }
+
+    async def report_periodically() -> None:
+        while True:
+            await asyncio.sleep(stats_interval_sec)
+            send(("stats", report()))
+
+    async def run_job(job_id: int, task: str, context: Any, config: RunConfig) -> None:
+        run_event_sink.set(lambda event, data: send(("event", job_id, event, data)))
+        try:
+            result = await runner(task, context, config)
+        except Exception as e:
+            error = classify_error(e)
+            result = {
+                "ok": False,
+                "result_text": "",
+                "error": str(error),
+                "error_code": error.code.value,
+            }
+        finally:
+            jobs.pop(job_id, None)
+        # Metrics and memory first, so they are in by the time the caller has the result.
+        send(("stats", report()))
+        send(("done", job_id, result))
+
+    retry_budget.forward_to(lambda: send(("retry_attempt",)), spend_retry)
+    stops, keepalives = await _start_runtime(slot)
+    _read_into_loop(conn, loop, inbox.put_nowait, name="gateway-reader")
+    reporter = asyncio.create_task(report_periodically())
+    try:
+        while True:
+            message = await inbox.get()
+            if message is None or message[0] == "stop":
+                break
+            if message[0] == "run":
+                jobs[message[1]] = asyncio.create_task(run_job(*message[1:]))
+            elif message[0] == "cancel" and message[1] in jobs:
+                jobs[message[1]].cancel()
+            elif message[0] == "retry_allowed":
+                reply = retry_replies.get(message[1])
+                if reply is not None and not reply.done():
+                    reply.set_result(message[2])
+    finally:
+        reporter.cancel()
+        for job in jobs.values():
+            job.cancel()
+        await asyncio.gather(*jobs.values(), return_exceptions=True)
+        for stop in reversed(stops):
+            try:
+                await stop()
+            except Exception as e:
+                logger.warning("Worker shutdown step failed", error=str(e))
+        conn.close()
+
+
+def _worker_main(
+    conn: Connection, slot: int, runner: Optional[Runner], stats_interval_sec: float
+) -> None:
+    """Entry point of a worker process."""
+    # The gateway handles Ctrl-C; workers stop when told to or when the pipe closes.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logger.info("Browser worker started", slot=slot, pid=os.getpid())
+    asyncio.run(_serve(conn, slot, runner, stats_interval_sec))
+
+
+@dataclass
+class _Worker:
+    """One worker process as seen from the gateway."""
+
+    slot: int
+    process: BaseProcess
+    conn: Connection
+    # job_id -> (future resolved with the run result, the run's event sink)
+    jobs: dict[int, tuple["asyncio.Future[dict[str, Any]]", Optional[EventSink]]] = field(
+        default_factory=dict
+    )
+    served: int = 0
+    rss_mb: float = 0.0
+    draining: bool = False
+    started_at: float = field(default_factory=time.time)
+    # From the worker's latest report
+    browser_pool: Optional[dict[str, Any]] = None
+    session_keepalive: Optional[dict[str, Any]] = None
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "pid": self.process.pid,
+            "in_flight": len(self.jobs),
+            "served": self.served,
+            "rss_mb": round(self.rss_mb, 1),
+            "draining": self.draining,
+            "uptime_sec": round(time.time() - self.started_at, 1),
+            "browser_pool": self.browser_pool,
+        }
+
+
+class WorkerPool:
+    """Dispatches runs to worker processes and keeps ``size`` of them serving."""
+
+    def __init__(
+        self,
+        size: int,
+        max_rss_mb: float = 0.0,
+        max_jobs: int = 0,
+        restart_delay_sec: float = 1.0,
+        stats_interval_sec: float = 5.0,
+        runner: Optional[Runner] = None,
+    ) -> None:
+        self.size = max(1, size)
+        self.max_rss_mb = max_rss_mb
+        self.max_jobs = max_jobs
+        self.restart_delay_sec = restart_delay_sec
+        self.stats_interval_sec = stats_interval_sec
+        # A module-level coroutine function run in the workers instead of the agent runner.
+        self.runner = runner
+        self._workers: list[_Worker] = []
+        self._available = asyncio.Event()
+        self._job_ids = itertools.count(1)
+        self._stopping = False
+        self._crashes = 0
+        self._retirements = 0
+
+    async def start(self) -> None:
+        for slot in range(self.size):
+            self._spawn(slot)
+
+    def _spawn(self, slot: int) -> None:
+        if self._stopping:
+            return
+        ctx = multiprocessing.get_context("spawn")
+        parent, child = ctx.Pipe()
+        process = ctx.Process(
+            target=_worker_main,
+            args=(child, slot, self.runner, self.stats_interval_sec),
+            name=f"browser-worker-{slot}",
+            daemon=True,
+        )
+        process.start()
+        child.close()
+        worker = _Worker(slot=slot, process=process, conn=parent)
+        self._workers.append(worker)
+        _read_into_loop(
+            parent,
+            asyncio.get_running_loop(),
+            lambda message: self._on_message(worker, message),
+            name=f"browser-worker-{slot}-reader",
+        )
+        self._available.set()
+        logger.info("Spawned browser worker", slot=slot, pid=process.pid)
+
+    def _serving(self) -> list[_Worker]:
+        return [w for w in self._workers if not w.draining]
+
+    async def run(
+        self,
+        task: str,
+        context: Optional[dict[str, Any]] = None,
+        config: Optional[RunConfig] = None,
+    ) -> dict[str, Any]:
+        """Run a task on the least-loaded worker; same contract as run_browser_agent_async."""
+        if config is None:
+            config = RunConfig.from_settings()
+        accounts = get_account_pool()
+        if accounts is None:
+            return await self._dispatch(task, context, config)
+        try:
+            return await accounts.run_as_account(
+                config, lambda account_config, _: self._dispatch(task, context, account_config)
+            )
+        except AuthExpired as e:
+            return {
+                "ok": False,
+                "result_text": "",
+                "error": str(e),
+                "error_code": ErrorCode.AUTH_EXPIRED.value,
+            }
+
+    async def _dispatch(
+        self, task: str, context: Optional[dict[str, Any]], config: RunConfig
+    ) -> dict[str, Any]:
+        while not self._serving():
+            self._available.clear()
+            await self._available.wait()
+        worker = min(self._serving(), key=lambda w: len(w.jobs))
+        job_id = next(self._job_ids)
+        future: asyncio.Future[dict[str, Any]] = asyncio.get_running_loop().create_future()
+        worker.jobs[job_id] = (future, run_event_sink.get())
+        # A broken pipe surfaces as EOF on the reader, which fails the job.
+        self._send(worker, ("run", job_id, task, context, config))
+        try:
+            return await future
+        except asyncio.CancelledError:
+            if worker.jobs.pop(job_id, None) is not None:
+                self._send(worker, ("cancel", job_id))
+                self._stop_if_drained(worker)
+            raise
+
+    def _send(self, worker: _Worker, message: tuple[Any, ...]) -> None:
+        try:
+            worker.conn.send(message)
+        except OSError as e:
+            logger.warning("Failed to reach browser worker", pid=worker.process.pid, error=str(e))
+
+    def _on_message(self, worker: _Worker, message: Optional[tuple[Any, ...]]) -> None:
+        if message is None:
+            self._on_exit(worker)
+            return
+        if message[0] == "event":
+            job = worker.jobs.get(message[1])
+            if job is not None and job[1] is not None:
+                try:
+                    job[1](message[2], message[3])
+                except Exception as e:
+                    logger.debug("Failed to publish worker event", error=str(e))
+        elif message[0] == "stats":
+            report = message[1]
+            worker.rss_mb = report["rss_mb"]
+            worker.browser_pool = report["browser_pool"]
+            worker.session_keepalive = report["session_keepalive"]
+            registry.merge(report["metrics"])
+            self._check_limits(worker)
+        elif message[0] == "done":
+            _, job_id, result = message
+            worker.served += 1
+            job = worker.jobs.pop(job_id, None)
+            if job is not None and not job[0].done():
+                job[0].set_result(result)
+            self._check_limits(worker)
+            self._stop_if_drained(worker)
+        elif message[0] == "retry_attempt":
+            retry_budget.record_attempt()
+        elif message[0] == "retry_spend":
+            self._send(worker, ("retry_allowed", message[1], retry_budget.try_spend()))
+
+    def _check_limits(self, worker: _Worker) -> None:
+        """Replace a worker that grew too large or served its quota of runs."""
+        if worker.draining:
+            return
+        over_memory = self.max_rss_mb > 0 and worker.rss_mb > self.max_rss_mb
+        over_jobs = self.max_jobs > 0 and worker.served >= self.max_jobs
+        if not over_memory and not over_jobs:
+            return
+        self._replace(worker, reason="memory" if over_memory else "max_jobs")
+
+    def _replace(self, worker: _Worker, reason: str) -> None:
+        """Spawn a fresh worker for the slot; the old one stops once its runs are done."""
+        worker.draining = True
+        self._retirements += 1
+        logger.info(
+            "Replacing browser worker",
+            pid=worker.process.pid,
+            rss_mb=round(worker.rss_mb, 1),
+            served=worker.served,
+            reason=reason,
+        )
+        self._spawn(worker.slot)
+
+    def reload(self, settings: Settings) -> None:
+        """
+        Apply a settings reload: adopt the new limits and replace every worker.
+
+        Workers read their settings when they start, so only fresh ones see the
+        new executor, browser pool and auth values.
+        """
+        self.max_rss_mb = settings.worker_max_rss_mb
+        self.max_jobs = settings.worker_max_jobs
+        serving = sorted(self._serving(), key=lambda w: w.slot)
+        size = max(1, settings.worker_processes)
+        for worker in serving[size:]:
+            worker.draining = True
+            self._stop_if_drained(worker)
+        for worker in serving[:size]:
+            self._replace(worker, reason="settings")
+            self._stop_if_drained(worker)
+        for slot in range(len(serving), size):
+            self._spawn(slot)
+        self.size = size
+
+    def _stop_if_drained(self, worker: _Worker) -> None:
+        if worker.draining and not worker.jobs:
+            self._send(worker, ("stop",))
+
+    def _on_exit(self, worker: _Worker) -> None:
+        """The worker's pipe closed: fail its runs and restart it unless that was expected."""
+        if worker.conn.closed:
+            return
+        worker.conn.close()
+        if worker in self._workers:
+            self._workers.remove(worker)
+        expected = worker.draining or self._stopping
+        for future, _ in worker.jobs.values():
+            if not future.done():
+                future.set_result(_worker_lost_result(worker))
+        worker.jobs.clear()
+        if expected:
+            return
+        self._crashes += 1
+        logger.error(
+            "Browser worker exited unexpectedly",
+            slot=worker.slot,
+            pid=worker.process.pid,
+            exit_code=worker.process.exitcode,
+        )
+        # Delay the restart so a worker that can't start doesn't spin.
+        asyncio.get_running_loop().call_later(self.restart_delay_sec, self._spawn, worker.slot)
+
+    async def stop(self, timeout_sec: float = 10.0) -> None:
+        """Ask every worker to stop, then terminate the ones that don't within the timeout."""
+        self._stopping = True
+        workers = list(self._workers)
+        for worker in workers:
+            self._send(worker, ("stop",))
+        deadline = time.monotonic() + timeout_sec
+        while any(w.process.is_alive() for w in workers) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        for worker in workers:
+            if worker.process.is_alive():
+                logger.warning("Terminating browser worker", pid=worker.process.pid)
+                worker.process.terminate()
+        # join() blocks while the process is reaped; keep that off the event loop.
+        await asyncio.gather(*(asyncio.to_thread(w.process.join, 1) for w in workers))
+        for worker in workers:
+            self._on_exit(worker)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "size": self.size,
+            "workers": [w.stats() for w in self._workers],
+            "in_flight": sum(len(w.jobs) for w in self._workers),
+            "crashes": self._crashes,
+            "retirements": self._retirements,
+        }
+
+    def browser_pool_stats(self) -> Optional[dict[str, Any]]:
+        """The workers' browser pools added up, from their latest reports."""
+        reports = [w.browser_pool for w in self._workers if w.browser_pool is not None]
+        if not reports:
+            return None
+        total: dict[str, Any] = {"workers": len(reports)}
+        for key, value in reports[0].items():
+            values = [report.get(key) for report in reports]
+            if isinstance(value, bool):
+                total[key] = all(values)
+            elif isinstance(value, (int, float)) and key != "max_uses":
+                total[key] = sum(v for v in values if isinstance(v, (int, float)))
+            else:
+                total[key] = value
+        return total
+
+    def keepalive_stats(self) -> Optional[dict[str, Any]]:
+        """The session keep-alive stats of the worker running it."""
+        for worker in self._workers:
+            if worker.session_keepalive is not None:
+                return worker.session_keepalive
+        return None
+
+
+def _worker_lost_result(worker: _Worker) -> dict[str, Any]:
+    return {
+        "ok": False,
+        "result_text": "",
+        "error": f"Browser worker {worker.process.pid} exited during the run",
+        "error_code": ErrorCode.UNKNOWN_ERROR.value,
+    }
+
+
+_worker_pool: Optional[WorkerPool] = None
+
+
+def get_worker_pool() -> Optional[WorkerPool]:
+    """Return the gateway's worker pool, or None when runs execute in-process."""
+    return _worker_pool
+
+
+def set_worker_pool(pool: Optional[WorkerPool]) -> None:
+    global _worker_pool
+    _worker_pool = pool
+
+
+def create_worker_pool(settings: Optional[Settings] = None) -> Optional[WorkerPool]:
+    """Build the pool from a settings snapshot, or None when MCP_WORKER_PROCESSES is 0."""
+    settings = settings or get_settings()
+    if settings.worker_processes <= 0:
+        return None
+    return WorkerPool(
+        size=settings.worker_processes,
+        max_rss_mb=settings.worker_max_rss_mb,
+        max_jobs=settings.worker_max_jobs,
+    )
@@ -7,7 +7,18 @@ import sys
 
 # Set test environment variables BEFORE importing server module
 os.environ["MCP_BEARER_TOKEN"] = "test-token"
+# Tests reuse the same task text with different mocked outcomes; don't cache results across them
+os.environ["MCP_COALESCE_TTL_SEC"] = "0"
 
 # Now we can import pytest and other modules
 import pytest  # noqa: E402
 
+
+from src.settings import reload_settings  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def _fresh_settings():
+    """Start every test from the environment's settings; tests reload again after setenv."""
+    reload_settings()
+    yield
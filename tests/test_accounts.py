@@ -0,0 +1,191 @@
+"""
+Tests for multi-account scheduling and quarantine.
+"""
+
+import asyncio
+import json
+import time
+from unittest.mock import patch
+
+import pytest
+
+from src import accounts as accounts_module
+from src.accounts import Account, AccountPool, create_account_pool
+from src.agent_runner import run_browser_agent_async
+from src.auth_state import AuthStateStore
+from src.errors import AuthExpired
+from src.settings import reload_settings
+
+
+def _write_state(path, expires):
+    path.write_text(
+        json.dumps(
+            {
+                "cookies": [
+                    {
+                        "name": "lovable-session-id.id",
+                        "domain": ".lovable.dev",
+                        "value": path.stem,
+                        "expires": expires,
+                    }
+                ],
+                "origins": [],
+            }
+        )
+    )
+
+
+def _account(tmp_path, name, expires=None, max_concurrency=1):
+    path = tmp_path / f"{name}.json"
+    _write_state(path, expires if expires is not None else time.time() + 3600)
+    store = AuthStateStore(str(path))
+    store.reload()
+    return Account(name=name, store=store, max_concurrency=max_concurrency)
+
+
+class TestAccountScheduling:
+    """Test runs are spread over accounts within their caps."""
+
+    @pytest.mark.asyncio
+    async def test_least_loaded_account_is_picked(self, tmp_path):
+        """Test concurrent runs land on different accounts before any account doubles up."""
+        pool = AccountPool(
+            [_account(tmp_path, "a", max_concurrency=2), _account(tmp_path, "b", max_concurrency=2)]
+        )
+
+        async with pool.acquire() as first, pool.acquire() as second:
+            assert {first.name, second.name} == {"a", "b"}
+            async with pool.acquire() as third:
+                assert third.in_flight == 2
+
+    @pytest.mark.asyncio
+    async def test_waits_when_every_account_is_at_its_cap(self, tmp_path):
+        """Test a run waits for a slot and gets it once another run finishes."""
+        pool = AccountPool([_account(tmp_path, "a")])
+        release = asyncio.Event()
+
+        async def hold():
+            async with pool.acquire():
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+
+        async def second():
+            async with pool.acquire() as account:
+                return account.name
+
+        waiter = asyncio.create_task(second())
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+
+        release.set()
+        assert await asyncio.wait_for(waiter, timeout=1) == "a"
+        await holder
+
+    @pytest.mark.asyncio
+    async def test_expired_accounts_are_skipped(self, tmp_path):
+        """Test a dead session is never assigned, and all-dead fails fast."""
+        pool = AccountPool(
+            [_account(tmp_path, "dead", expires=time.time() - 10), _account(tmp_path, "live")]
+        )
+        async with pool.acquire() as account:
+            assert account.name == "live"
+
+        dead = AccountPool([_account(tmp_path, "dead", expires=time.time() - 10)])
+        assert dead.preflight() is not None
+        with pytest.raises(AuthExpired):
+            async with dead.acquire():
+                pass
+
+
+class TestQuarantine:
+    """Test failing accounts are taken out of rotation."""
+
+    def test_consecutive_failures_quarantine(self, tmp_path):
+        """Test account-level failures quarantine after the threshold; success resets the count."""
+        account = _account(tmp_path, "a")
+        pool = AccountPool([account], quarantine_after=2, quarantine_sec=60)
+
+        pool.record(account, "NETWORK_ERROR")
+        pool.record(account, None)
+        pool.record(account, "NETWORK_ERROR")
+        assert not account.quarantined(time.time())
+
+        pool.record(account, "NETWORK_ERROR")
+        assert account.quarantined(time.time())
+        assert pool.stats()["quarantines"] == 1
+
+    def test_auth_expired_quarantines_immediately(self, tmp_path):
+        """Test a rejected session is quarantined on the first failure."""
+        account = _account(tmp_path, "a")
+        pool = AccountPool([account], quarantine_after=5)
+
+        pool.record(account, "AUTH_EXPIRED")
+        assert account.quarantined(time.time())
+
+    def test_task_level_failures_do_not_count(self, tmp_path):
+        """Test UI changes and timeouts don't count against the account."""
+        account = _account(tmp_path, "a")
+        pool = AccountPool([account], quarantine_after=1)
+
+        pool.record(account, "UI_CHANGED")
+        pool.record(account, "TIMEOUT_BUILD")
+        assert not account.quarantined(time.time())
+
+    @pytest.mark.asyncio
+    async def test_quarantined_account_is_avoided(self, tmp_path):
+        """Test runs go to the healthy account while another is quarantined."""
+        bad, good = _account(tmp_path, "bad"), _account(tmp_path, "good")
+        pool = AccountPool([bad, good], quarantine_after=1)
+        pool.record(bad, "NETWORK_ERROR")
+
+        for _ in range(2):
+            async with pool.acquire() as account:
+                assert account.name == "good"
+
+
+class TestAccountConfig:
+    """Test the pool is built from MCP_AUTH_STATE_DIR."""
+
+    def test_one_account_per_storage_state(self, tmp_path, monkeypatch):
+        """Test every JSON file becomes an account with the configured cap."""
+        for name in ("alpha", "beta"):
+            _write_state(tmp_path / f"{name}.json", time.time() + 3600)
+        monkeypatch.setenv("MCP_AUTH_STATE_DIR", str(tmp_path))
+        monkeypatch.setenv("MCP_ACCOUNT_MAX_CONCURRENCY", "2")
+        reload_settings()
+
+        pool = create_account_pool()
+
+        assert [a.name for a in pool.accounts] == ["alpha", "beta"]
+        assert pool.stats()["capacity"] == 4
+
+    def test_disabled_without_directory(self, monkeypatch):
+        """Test single-account mode is kept when no directory is configured."""
+        monkeypatch.delenv("MCP_AUTH_STATE_DIR", raising=False)
+        assert create_account_pool() is None
+
+
+class TestRunnerAccounts:
+    """Test runs execute with their account's storage state."""
+
+    @pytest.mark.asyncio
+    async def test_run_uses_assigned_account_state(self, tmp_path):
+        """Test the run's config carries the account's storage state and failures count."""
+        account = _account(tmp_path, "alpha")
+        pool = AccountPool([account], quarantine_after=1)
+        seen = []
+
+        async def fake_routed(task, context, config, browser=None):
+            seen.append((config.account, config.storage_state["cookies"][0]["value"]))
+            return {"ok": False, "result_text": "", "error": "reset", "error_code": "NETWORK_ERROR"}
+
+        with patch.object(accounts_module, "_account_pool", pool), patch(
+            "src.agent_runner.get_browser_pool", return_value=None
+        ), patch("src.agent_runner._run_routed", side_effect=fake_routed):
+            result = await run_browser_agent_async("rename my workspace")
+
+        assert seen == [("alpha", "alpha")]
+        assert result["debug"]["account"] == "alpha"
+        assert account.quarantined(time.time())
@@ -0,0 +1,122 @@
+"""
+Tests for the dedicated agent executor.
+"""
+
+import asyncio
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src import server
+from src.agent_executor import AgentExecutor, run_blocking, set_agent_executor
+from src.settings import reload_settings
+
+AUTH = {"Authorization": "Bearer test-token"}
+
+
+class TestAgentExecutor:
+    """Test blocking work runs on the named, bounded pool."""
+
+    @pytest.mark.asyncio
+    async def test_runs_on_named_worker_threads(self):
+        """Test work runs off the event loop on an agent-worker thread."""
+        executor = AgentExecutor(max_workers=2)
+        try:
+            name = await executor.run(lambda: threading.current_thread().name)
+        finally:
+            executor.shutdown()
+
+        assert name.startswith("agent-worker")
+        assert executor.stats()["completed"] == 1
+
+    @pytest.mark.asyncio
+    async def test_bounded_with_queue_accounting(self):
+        """Test work beyond the worker count queues and is reported as queued."""
+        executor = AgentExecutor(max_workers=1)
+        release = threading.Event()
+        try:
+            first = asyncio.ensure_future(executor.run(release.wait))
+            second = asyncio.ensure_future(executor.run(lambda: "done"))
+            await asyncio.sleep(0.05)
+            stats = executor.stats()
+            assert (stats["active"], stats["idle"], stats["queued"]) == (1, 0, 1)
+
+            release.set()
+            assert await asyncio.wait_for(second, timeout=1) == "done"
+            await first
+        finally:
+            release.set()
+            executor.shutdown()
+
+        assert executor.stats()["queued"] == 0
+
+    @pytest.mark.asyncio
+    async def test_failures_are_raised_and_counted(self):
+        """Test an exception propagates to the caller and counts as failed."""
+        executor = AgentExecutor(max_workers=1)
+
+        def boom():
+            raise OSError("disk full")
+
+        try:
+            with pytest.raises(OSError):
+                await executor.run(boom)
+        finally:
+            executor.shutdown()
+
+        assert executor.stats()["failed"] == 1
+
+    @pytest.mark.asyncio
+    async def test_cancelled_queued_work_is_dropped(self):
+        """Test a caller cancelled while queued never runs and leaves the queue."""
+        executor = AgentExecutor(max_workers=1)
+        release = threading.Event()
+        ran = []
+        try:
+            blocker = asyncio.ensure_future(executor.run(release.wait))
+            queued = asyncio.ensure_future(executor.run(ran.append, 1))
+            await asyncio.sleep(0.05)
+            queued.cancel()
+            await asyncio.sleep(0.05)
+            release.set()
+            await blocker
+        finally:
+            release.set()
+            executor.shutdown()
+
+        assert ran == []
+        assert executor.stats()["queued"] == 0
+
+    @pytest.mark.asyncio
+    async def test_resize_keeps_accounting(self):
+        """Test resizing swaps the pool and reports the new worker count."""
+        executor = AgentExecutor(max_workers=1)
+        executor.resize(4)
+        try:
+            assert await executor.run(lambda: 42) == 42
+        finally:
+            executor.shutdown()
+
+        assert executor.stats()["workers"] == 4
+
+    @pytest.mark.asyncio
+    async def test_run_blocking_inline_without_executor(self):
+        """Test callers outside the gateway run blocking work inline."""
+        set_agent_executor(None)
+        assert await run_blocking(threading.current_thread) is threading.current_thread()
+
+
+class TestGatewayExecutor:
+    """Test the gateway owns the executor and reports it."""
+
+    def test_health_and_metrics(self, monkeypatch):
+        """Test the executor is sized from MCP_AGENT_CONCURRENCY and exposed."""
+        monkeypatch.setenv("MCP_AGENT_CONCURRENCY", "4")
+        reload_settings()
+        with TestClient(server.app) as client:
+            health = client.get("/health").json()
+            metrics = client.get("/metrics", headers=AUTH).text
+
+        assert health["agent_executor"]["workers"] == 4
+        assert 'lovable_gateway_agent_executor_threads{state="idle"} 4' in metrics
@@ -2,12 +2,20 @@
 Tests for agent runner module.
 """
 
+import asyncio
 import subprocess
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, patch
 
 import pytest
 
-from src.agent_runner import run_browser_agent, run_browser_agent_async
+from src.agent_runner import (
+    _run_saik0s_cli,
+    _settled_context_class,
+    run_browser_agent,
+    run_browser_agent_async,
+)
+from src.lovable_adapter.router import FlowFailed
+from src.settings import reload_settings
 
 
 class TestRunBrowserAgent:
@@ -55,12 +63,199 @@ class TestRunBrowserAgent:
 
     @pytest.mark.asyncio
     @patch("src.agent_runner.run_browser_agent")
-    async def test_run_browser_agent_async(self, mock_sync):
-        """Test async wrapper for browser agent."""
-        mock_sync.return_value = {"ok": True, "result_text": "success"}
+    @patch("src.agent_runner._run_saik0s", new_callable=AsyncMock)
+    async def test_run_browser_agent_async(self, mock_native, mock_sync):
+        """Test async runner awaits the agent natively without the sync path."""
+        mock_native.return_value = "success"
 
         result = await run_browser_agent_async("build a todo app")
 
         assert result["ok"] is True
-        assert mock_sync.called
+        assert result["result_text"] == "success"
+        assert mock_native.await_count == 1
+        assert not mock_sync.called
+        assert result["debug"]["agent_steps"] == 0
 
+    @pytest.mark.asyncio
+    @patch("src.agent_runner._run_saik0s", new_callable=AsyncMock)
+    async def test_run_browser_agent_async_error(self, mock_native):
+        """Test async runner maps agent errors to the result dictionary."""
+        mock_native.side_effect = TimeoutError("Browser agent timed out after 600s")
+
+        result = await run_browser_agent_async("build a todo app")
+
+        assert result["ok"] is False
+        assert "timed out" in result["error"]
+
+    @pytest.mark.asyncio
+    async def test_run_browser_agent_async_cancellation(self):
+        """Test cancelling the caller cancels the agent coroutine."""
+        started = asyncio.Event()
+        cancelled = asyncio.Event()
+
+        async def _slow_agent(task, cdp_url=None, steps=None, history_path=None, config=None):
+            started.set()
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+            return "never"
+
+        with patch("src.agent_runner._run_saik0s", _slow_agent):
+            runner = asyncio.create_task(run_browser_agent_async("build a todo app"))
+            await started.wait()
+            runner.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await runner
+
+        assert cancelled.is_set()
+
+    @patch("src.agent_runner._run_saik0s", new_callable=AsyncMock)
+    def test_sync_cli_wrapper_runs_native_path(self, mock_native):
+        """Test the sync compatibility wrapper drives the async implementation."""
+        mock_native.return_value = "done"
+
+        assert _run_saik0s_cli("build a todo app") == "done"
+        mock_native.assert_awaited_once_with("build a todo app", cdp_url=None)
+
+
+
+class TestFastPath:
+    """Test routing of recognized tasks to the deterministic flows."""
+
+    TASK = 'Create project "Todo" with prompt: Build a todo app'
+
+    @pytest.mark.asyncio
+    @patch("src.agent_runner._standalone_page")
+    @patch("src.agent_runner.run_project_flow", new_callable=AsyncMock)
+    @patch("src.agent_runner._run_saik0s", new_callable=AsyncMock)
+    async def test_recognized_task_skips_agent(self, mock_agent, mock_flow, _page):
+        """Test a successful flow answers without starting the LLM agent."""
+        mock_flow.return_value = {
+            "result_text": "Preview URL: https://abc.lovable.dev",
+            "preview_url": "https://abc.lovable.dev",
+            "project_url": "https://lovable.dev/projects/1",
+        }
+
+        result = await run_browser_agent_async(self.TASK)
+
+        assert result["ok"] is True
+        assert result["debug"]["path"] == "flow"
+        assert mock_agent.await_count == 0
+
+    @pytest.mark.asyncio
+    @patch("src.agent_runner._standalone_page")
+    @patch("src.agent_runner.run_project_flow", new_callable=AsyncMock)
+    @patch("src.agent_runner._run_saik0s", new_callable=AsyncMock)
+    async def test_failed_flow_falls_back_to_agent(self, mock_agent, mock_flow, _page):
+        """Test a flow that fails before entering the prompt hands the task to the agent."""
+        mock_flow.side_effect = FlowFailed("open_project", "could not open project 'Todo'")
+        mock_agent.return_value = "https://abc.lovable.dev"
+
+        result = await run_browser_agent_async(self.TASK)
+
+        assert result["ok"] is True
+        assert result["debug"]["path"] == "agent"
+        assert "open_project" in result["debug"]["flow_error"]
+        assert mock_agent.await_args.args[0] == self.TASK
+
+    @staticmethod
+    def _fail_after(stages, failure):
+        """A flow that completes stages on the project page, then raises failure."""
+
+        async def flow(page, request, on_stage=None, **kwargs):
+            for stage in stages:
+                on_stage(stage, "https://lovable.dev/projects/1")
+            raise failure
+
+        return flow
+
+    @pytest.mark.asyncio
+    @patch("src.agent_runner._standalone_page")
+    @patch("src.agent_runner.run_project_flow")
+    @patch("src.agent_runner._run_saik0s", new_callable=AsyncMock)
+    async def test_failure_after_build_resumes_instead_of_resubmitting(
+        self, mock_agent, mock_flow, _page
+    ):
+        """Test a build that was triggered is finished by the agent, not submitted again."""
+        mock_flow.side_effect = self._fail_after(
+            ["login", "open_project", "paste_prompt", "trigger_build"],
+            FlowFailed("wait_for_build", "build did not complete in time"),
+        )
+        mock_agent.return_value = "https://abc.lovable.dev"
+
+        result = await run_browser_agent_async(self.TASK)
+
+        task = mock_agent.await_args.args[0]
+        assert "https://lovable.dev/projects/1" in task
+        assert "Do not submit any prompt" in task
+        assert "Build a todo app" not in task
+        assert result["debug"]["flow_stage"] == "wait_for_build"
+
+    @pytest.mark.asyncio
+    @patch("src.agent_runner._standalone_page")
+    @patch("src.agent_runner.run_project_flow")
+    @patch("src.agent_runner._run_saik0s", new_callable=AsyncMock)
+    async def test_failed_build_trigger_returns_flow_error(self, mock_agent, mock_flow, _page):
+        """Test a failure at the build click is reported rather than risking a second submit."""
+        mock_flow.side_effect = self._fail_after(
+            ["login", "open_project", "paste_prompt"],
+            FlowFailed("trigger_build", "build button not found"),
+        )
+
+        result = await run_browser_agent_async(self.TASK)
+
+        assert result["ok"] is False
+        assert result["error_code"] == "UI_CHANGED"
+        assert result["debug"]["flow_stage"] == "trigger_build"
+        assert mock_agent.await_count == 0
+
+    @pytest.mark.asyncio
+    @patch("src.agent_runner.run_project_flow", new_callable=AsyncMock)
+    @patch("src.agent_runner._run_saik0s", new_callable=AsyncMock)
+    async def test_fast_path_can_be_disabled(self, mock_agent, mock_flow, monkeypatch):
+        """Test MCP_FAST_PATH_ENABLED=false sends every task to the agent."""
+        monkeypatch.setenv("MCP_FAST_PATH_ENABLED", "false")
+        reload_settings()
+        mock_agent.return_value = "done"
+
+        await run_browser_agent_async(self.TASK)
+
+        assert mock_flow.await_count == 0
+
+
+class TestSettledContext:
+    """Test the agent's per-step page wait uses DOM quiescence."""
+
+    class _Base:
+        def __init__(self):
+            self.default_waits = 0
+            self.get_current_page = AsyncMock(return_value=object())
+            self._check_and_handle_navigation = AsyncMock()
+
+        async def _wait_for_page_and_frames_load(self, timeout_overwrite=None):
+            self.default_waits += 1
+
+    @pytest.mark.asyncio
+    @patch("src.agent_runner.wait_for_page_settled", new_callable=AsyncMock)
+    async def test_step_wait_settles_page(self, mock_settle):
+        """Test the step wait settles the current page instead of the default wait."""
+        context = _settled_context_class(self._Base)()
+
+        await context._wait_for_page_and_frames_load()
+
+        mock_settle.assert_awaited_once()
+        context._check_and_handle_navigation.assert_awaited_once()
+        assert context.default_waits == 0
+
+    @pytest.mark.asyncio
+    @patch("src.agent_runner.wait_for_page_settled", new_callable=AsyncMock)
+    async def test_falls_back_to_default_wait(self, mock_settle):
+        """Test a settle error falls back to browser-use's own wait."""
+        mock_settle.side_effect = RuntimeError("page closed")
+        context = _settled_context_class(self._Base)()
+
+        await context._wait_for_page_and_frames_load()
+
+        assert context.default_waits == 1
@@ -0,0 +1,195 @@
+"""
+Tests for the auth state store, expiry index and run preflight.
+"""
+
+import asyncio
+import base64
+import json
+import os
+import time
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src import server
+from src.auth_state import AuthStateStore, index_session, jwt_expiry
+
+AUTH = {"Authorization": "Bearer test-token"}
+
+
+def _jwt(exp):
+    payload = base64.urlsafe_b64encode(json.dumps({"exp": exp}).encode()).decode().rstrip("=")
+    return f"eyJhbGciOiJIUzI1NiJ9.{payload}.signature"
+
+
+def _state(cookie_expires, token_exp=None):
+    return {
+        "cookies": [
+            {
+                "name": "lovable-session-id.id",
+                "domain": ".lovable.dev",
+                "expires": cookie_expires,
+                "value": _jwt(token_exp) if token_exp is not None else "opaque",
+            },
+            {"name": "_ga", "domain": ".lovable.dev", "expires": 1, "value": "x"},
+        ],
+        "origins": [],
+    }
+
+
+def _write(path, state, mtime=None):
+    path.write_text(json.dumps(state))
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+class TestSessionIndex:
+    """Test parsing session expiry from a storage state."""
+
+    def test_jwt_expiry(self):
+        """Test the exp claim is read and non-JWT values are ignored."""
+        assert jwt_expiry(_jwt(1234)) == 1234
+        assert jwt_expiry("not-a-jwt") is None
+        assert jwt_expiry("a.%%%.c") is None
+
+    def test_earliest_of_cookie_and_jwt(self):
+        """Test the session ends at whichever of cookie and token expires first."""
+        now = time.time()
+        index = index_session(_state(now + 86400, token_exp=now + 3600))
+        assert index.source == "jwt"
+        assert index.expires_at == now + 3600
+        assert index.cookie_names == ("lovable-session-id.id",)
+
+    def test_session_cookie_without_expiry(self):
+        """Test browser-session cookies (expires -1) don't count as expired."""
+        index = index_session(_state(-1))
+        assert index.has_session is True
+        assert index.expires_at is None
+
+
+class TestAuthPreflight:
+    """Test preflight decisions and re-validation."""
+
+    def test_preflight_rejects_dead_session(self, tmp_path):
+        """Test an expired session is rejected and a valid one allowed."""
+        path = tmp_path / "auth.json"
+        _write(path, _state(time.time() - 10))
+        store = AuthStateStore(str(path), skew_sec=60)
+        store.reload()
+
+        assert store.status() == "expired"
+        assert "expired" in store.preflight()
+
+        _write(path, _state(time.time() + 3600), mtime=time.time() + 5)
+        store.reload()
+        assert store.status() == "valid"
+        assert store.preflight() is None
+
+    def test_missing_file_does_not_reject(self, tmp_path):
+        """Test runs aren't blocked when there is no auth state to judge."""
+        store = AuthStateStore(str(tmp_path / "missing.json"))
+        store.reload()
+        assert store.status() == "missing"
+        assert store.preflight() is None
+
+    def test_unchanged_file_is_not_reparsed(self, tmp_path):
+        """Test re-validation skips parsing when the file's mtime is unchanged."""
+        path = tmp_path / "auth.json"
+        _write(path, _state(time.time() + 3600))
+        store = AuthStateStore(str(path))
+        store.reload()
+
+        with patch("src.auth_state.load_storage_state") as mock_load:
+            store.reload()
+        mock_load.assert_not_called()
+
+
+class TestAuthStateStore:
+    """Test new versions of the file are swapped in without a restart."""
+
+    def test_changed_file_is_swapped_in(self, tmp_path):
+        """Test a rewritten file becomes a new version and listeners get the parsed state."""
+        path = tmp_path / "auth.json"
+        _write(path, _state(time.time() + 3600), mtime=1000)
+        store = AuthStateStore(str(path))
+        seen = []
+        store.subscribe(seen.append)
+        first = store.get()
+
+        rotated = _state(time.time() + 7200)
+        _write(path, rotated, mtime=2000)
+        assert store.reload() is True
+
+        assert store.snapshot.version == 2
+        assert store.get() == rotated
+        assert store.get() is not first
+        assert seen == [first, rotated]
+
+    def test_get_does_not_read_the_file_again(self, tmp_path):
+        """Test runs are handed the in-memory copy once it is loaded."""
+        path = tmp_path / "auth.json"
+        _write(path, _state(time.time() + 3600))
+        store = AuthStateStore(str(path))
+        store.get()
+
+        with patch("src.auth_state.load_storage_state") as mock_load:
+            store.get()
+            store.get()
+        mock_load.assert_not_called()
+
+    def test_unparseable_write_keeps_previous_version(self, tmp_path):
+        """Test a file caught mid-write doesn't replace the loaded state."""
+        path = tmp_path / "auth.json"
+        state = _state(time.time() + 3600)
+        _write(path, state, mtime=1000)
+        store = AuthStateStore(str(path))
+        store.reload()
+
+        path.write_text('{"cookies": [')
+        os.utime(path, (2000, 2000))
+        assert store.reload() is False
+        assert store.get() == state
+        assert store.snapshot.version == 1
+
+    @pytest.mark.asyncio
+    async def test_watcher_picks_up_rotation(self, tmp_path):
+        """Test the background poll swaps in a rotated file."""
+        path = tmp_path / "auth.json"
+        _write(path, _state(time.time() - 10), mtime=1000)
+        store = AuthStateStore(str(path), interval_sec=0.01)
+        await store.start()
+        assert store.status() == "expired"
+
+        _write(path, _state(time.time() + 3600), mtime=2000)
+        try:
+            for _ in range(100):
+                if store.status() == "valid":
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            await store.stop()
+        assert store.status() == "valid"
+
+
+class TestServerPreflight:
+    """Test the gateway rejects runs before queueing them."""
+
+    @patch("src.server.run_browser_agent_async", new_callable=AsyncMock)
+    def test_expired_session_rejected_without_running(self, mock_agent, tmp_path):
+        """Test sync and submitted runs get AUTH_EXPIRED and the agent never starts."""
+        path = tmp_path / "auth.json"
+        _write(path, _state(time.time() - 10))
+        store = AuthStateStore(str(path))
+        store.reload()
+
+        with patch.object(server, "auth_store", store):
+            client = TestClient(server.app)
+            sync = client.post("/tools/run_browser_agent", json={"task": "a"}, headers=AUTH)
+            submitted = client.post("/runs", json={"task": "b"}, headers=AUTH)
+            polled = client.get(f"/runs/{submitted.json()['run_id']}", headers=AUTH)
+
+        assert sync.json()["error_code"] == "AUTH_EXPIRED"
+        assert submitted.json()["error_code"] == "AUTH_EXPIRED"
+        assert polled.json()["status"] == "error"
+        assert mock_agent.await_count == 0
@@ -0,0 +1,229 @@
+"""
+Tests for the warm browser pool.
+"""
+
+import asyncio
+import json
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from src import browser_pool
+from src.agent_runner import run_browser_agent_async
+from src.auth_state import AuthStateStore
+from src.browser_pool import BrowserPool, PooledBrowser
+
+
+def _fake_pool(size=1, max_uses=2):
+    """Build a pool whose launches and health checks never touch Chromium."""
+    pool = BrowserPool(size=size, max_uses=max_uses, health_interval_sec=3600)
+    counter = {"n": 0}
+
+    async def _launch(auth_key=None):
+        counter["n"] += 1
+        pool._launches += 1
+        return PooledBrowser(
+            browser_id=counter["n"],
+            port=9000 + counter["n"],
+            user_data_dir="/tmp/x",
+            auth_key=auth_key,
+            state_generation=pool._auth_for(auth_key)[0],
+        )
+
+    pool._launch = _launch
+    pool._close = AsyncMock()
+    pool.is_healthy = AsyncMock(return_value=True)
+    return pool
+
+
+async def _fill(pool):
+    for _ in range(pool.size):
+        pool._idle.put_nowait(await pool._launch())
+
+
+class TestBrowserPool:
+    """Test pool checkout, recycling and health handling."""
+
+    @pytest.mark.asyncio
+    async def test_acquire_tracks_occupancy(self):
+        """Test checked-out browsers are reported as in use."""
+        pool = _fake_pool(size=2)
+        await _fill(pool)
+
+        async with pool.acquire() as browser:
+            assert browser.cdp_url.startswith("http://127.0.0.1:")
+            stats = pool.stats()
+            assert stats["in_use"] == 1
+            assert stats["idle"] == 1
+
+        await asyncio.gather(*pool._background)
+        assert pool.stats()["in_use"] == 0
+        assert pool.stats()["idle"] == 2
+
+    @pytest.mark.asyncio
+    async def test_recycles_after_max_uses(self):
+        """Test a browser is replaced once it reaches max_uses."""
+        pool = _fake_pool(size=1, max_uses=2)
+        await _fill(pool)
+
+        for _ in range(2):
+            async with pool.acquire() as browser:
+                first_id = browser.browser_id
+            await asyncio.gather(*pool._background)
+
+        async with pool.acquire() as browser:
+            assert browser.browser_id != first_id
+        assert pool.stats()["recycles"] == 1
+        pool._close.assert_awaited()
+
+    @pytest.mark.asyncio
+    async def test_unhealthy_browser_is_replaced(self):
+        """Test acquire skips browsers that fail the CDP health check."""
+        pool = _fake_pool(size=1)
+        await _fill(pool)
+        pool.is_healthy = AsyncMock(side_effect=[False, True])
+
+        async with pool.acquire() as browser:
+            assert browser.browser_id == 2
+        assert pool.stats()["health_failures"] == 1
+
+
+class TestAuthenticatedContexts:
+    """Test storage state loading and context reset."""
+
+    def test_load_storage_state_dict(self, tmp_path):
+        """Test a full storage state file is parsed."""
+        path = tmp_path / "auth.json"
+        path.write_text(json.dumps({"cookies": [{"name": "a"}], "origins": [{"origin": "x"}]}))
+
+        state = browser_pool.load_storage_state(str(path))
+        assert state == {"cookies": [{"name": "a"}], "origins": [{"origin": "x"}]}
+
+    def test_load_storage_state_cookie_list(self, tmp_path):
+        """Test a bare cookie list is accepted."""
+        path = tmp_path / "auth.json"
+        path.write_text(json.dumps([{"name": "a"}]))
+
+        state = browser_pool.load_storage_state(str(path))
+        assert state == {"cookies": [{"name": "a"}], "origins": []}
+
+    def test_load_storage_state_missing(self, tmp_path):
+        """Test a missing file yields None."""
+        assert browser_pool.load_storage_state(str(tmp_path / "nope.json")) is None
+
+    @pytest.mark.asyncio
+    async def test_reset_restores_authenticated_page(self):
+        """Test release re-applies cookies, closes extra tabs and reloads the dashboard."""
+        pool = _fake_pool(size=1)
+        pool.storage_state = {"cookies": [{"name": "session"}], "origins": []}
+        main_page, extra_page = AsyncMock(), AsyncMock()
+        context = MagicMock()
+        context.pages = [main_page, extra_page]
+        context.clear_cookies = AsyncMock()
+        context.add_cookies = AsyncMock()
+        browser = PooledBrowser(browser_id=1, port=9001, user_data_dir="/tmp/x", context=context)
+        pool._idle.put_nowait(browser)
+
+        async with pool.acquire():
+            pass
+        await asyncio.gather(*pool._background)
+
+        context.add_cookies.assert_awaited_with([{"name": "session"}])
+        extra_page.close.assert_awaited()
+        main_page.goto.assert_awaited()
+        assert pool.stats()["resets"] == 1
+        assert pool.stats()["idle"] == 1
+
+    @pytest.mark.asyncio
+    async def test_failed_reset_recycles(self):
+        """Test a context that can't be reset is replaced."""
+        pool = _fake_pool(size=1)
+        pool.storage_state = {"cookies": [], "origins": []}
+        context = MagicMock()
+        context.clear_cookies = AsyncMock(side_effect=RuntimeError("target closed"))
+        browser = PooledBrowser(browser_id=1, port=9001, user_data_dir="/tmp/x", context=context)
+        pool._idle.put_nowait(browser)
+
+        async with pool.acquire():
+            pass
+        await asyncio.gather(*pool._background)
+
+        stats = pool.stats()
+        assert stats["reset_failures"] == 1
+        assert stats["recycles"] == 1
+        assert stats["idle"] == 1
+
+    @pytest.mark.asyncio
+    async def test_new_storage_state_reaches_idle_and_busy_browsers(self):
+        """Test idle contexts are relaunched on checkout and busy ones on release."""
+        pool = _fake_pool(size=2)
+        pool.storage_state = {"cookies": [{"name": "old"}], "origins": []}
+        idle_context, busy_context = MagicMock(), MagicMock()
+        for context in (idle_context, busy_context):
+            context.pages = [AsyncMock()]
+            context.clear_cookies = AsyncMock()
+            context.add_cookies = AsyncMock()
+        idle = PooledBrowser(browser_id=1, port=9001, user_data_dir="/tmp/x", context=idle_context)
+        busy = PooledBrowser(browser_id=2, port=9002, user_data_dir="/tmp/x", context=busy_context)
+        pool._idle.put_nowait(busy)
+        pool._idle.put_nowait(idle)
+
+        async with pool.acquire() as first:
+            assert first is busy
+            pool.set_storage_state({"cookies": [{"name": "new"}], "origins": []})
+            async with pool.acquire() as second:
+                assert second is not idle
+                assert second.state_generation == 1
+                idle_context.add_cookies.assert_not_awaited()
+        await asyncio.gather(*pool._background)
+
+        pool._close.assert_any_await(idle)
+
+        assert pool.stats()["recycles"] == 2
+        assert pool.stats()["auth_state_generation"] == 1
+
+    @pytest.mark.asyncio
+    async def test_account_runs_prefer_their_own_browsers(self, tmp_path):
+        """Test a browser is relaunched for an account once, then reused for that account."""
+        path = tmp_path / "alpha.json"
+        path.write_text(json.dumps({"cookies": [{"name": "alpha"}], "origins": []}))
+        alpha = AuthStateStore(str(path))
+        pool = _fake_pool(size=2)
+        await _fill(pool)
+
+        async with pool.acquire(alpha) as browser:
+            assert browser.auth_key == str(path)
+            bound_id = browser.browser_id
+        await asyncio.gather(*pool._background)
+        async with pool.acquire() as default:
+            assert default.auth_key is None
+        async with pool.acquire(alpha) as browser:
+            assert browser.browser_id == bound_id
+
+        assert pool.stats()["account_rebinds"] == 1
+        pool._close.assert_awaited_once()
+
+
+class TestPoolIntegration:
+    """Test the runner and server use the pool when configured."""
+
+    def test_pool_disabled_by_default(self, monkeypatch):
+        """Test no pool is created without MCP_BROWSER_POOL_SIZE."""
+        monkeypatch.delenv("MCP_BROWSER_POOL_SIZE", raising=False)
+        assert browser_pool.create_browser_pool() is None
+
+    @pytest.mark.asyncio
+    @patch("src.agent_runner._run_saik0s", new_callable=AsyncMock)
+    async def test_async_runner_passes_cdp_url(self, mock_native):
+        """Test the async runner hands the pooled CDP endpoint to the agent."""
+        mock_native.return_value = "success"
+        pool = _fake_pool(size=1)
+        await _fill(pool)
+        browser_pool.set_browser_pool(pool)
+        try:
+            result = await run_browser_agent_async("build a todo app")
+        finally:
+            browser_pool.set_browser_pool(None)
+
+        assert result["ok"] is True
+        assert mock_native.call_args.kwargs["cdp_url"] == "http://127.0.0.1:9001"
@@ -0,0 +1,138 @@
+"""
+Tests for single-flight coalescing of identical runs.
+"""
+
+import asyncio
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from src import server
+from src.coalescer import RunCoalescer
+
+AUTH = {"Authorization": "Bearer test-token"}
+
+
+class TestRunCoalescer:
+    """Test keys, in-flight sharing and the result cache."""
+
+    def test_key_normalizes_whitespace_and_context_order(self):
+        """Test cosmetic differences in the task don't defeat dedup."""
+        first = RunCoalescer.key_for("c", "build  a\ntodo app", {"a": 1, "b": 2})
+        second = RunCoalescer.key_for("c", " build a\ntodo app ", {"b": 2, "a": 1})
+        assert first == second
+        assert RunCoalescer.key_for("other", "build a\ntodo app", {"a": 1, "b": 2}) != first
+
+    def test_idempotency_key_overrides_task(self):
+        """Test an explicit Idempotency-Key groups different task texts."""
+        assert RunCoalescer.key_for("c", "one", idempotency_key="k") == RunCoalescer.key_for(
+            "c", "two", idempotency_key="k"
+        )
+
+    @pytest.mark.asyncio
+    async def test_waiters_share_in_flight_output(self):
+        """Test duplicates attach to the running flight and get the same output."""
+        coalescer = RunCoalescer(ttl_sec=60)
+        flight = coalescer.begin("k", "run-1")
+        waiters = [asyncio.create_task(coalescer.get("k").result()) for _ in range(3)]
+
+        output = SimpleNamespace(ok=True)
+        coalescer.complete("k", flight, output)
+
+        assert await asyncio.gather(*waiters) == [output] * 3
+        assert coalescer.get("k") is flight
+        assert coalescer.stats()["coalesced"] == 3
+
+    @pytest.mark.asyncio
+    async def test_failures_not_cached(self):
+        """Test a failed run is shared with waiters but a later retry runs again."""
+        coalescer = RunCoalescer(ttl_sec=60)
+        flight = coalescer.begin("k", "run-1")
+        coalescer.complete("k", flight, SimpleNamespace(ok=False))
+
+        assert coalescer.get("k") is None
+
+    @pytest.mark.asyncio
+    async def test_cache_ttl_and_lru(self):
+        """Test cached results expire after the TTL and the oldest are evicted first."""
+        coalescer = RunCoalescer(ttl_sec=60, max_entries=1)
+        for key in ("a", "b"):
+            coalescer.complete(key, coalescer.begin(key, key), SimpleNamespace(ok=True))
+        assert coalescer.get("a") is None
+
+        flight = coalescer.get("b")
+        flight.finished_at = time.time() - 120
+        assert coalescer.get("b") is None
+
+
+class TestCoalescedEndpoints:
+    """Test coalescing through the HTTP API."""
+
+    @patch("src.server.run_browser_agent_async")
+    def test_duplicate_submission_returns_same_run(self, mock_agent, monkeypatch):
+        """Test an identical submission while the first is running reuses its run_id."""
+        monkeypatch.setattr(server, "coalescer", RunCoalescer(ttl_sec=0))
+
+        async def _slow_runner(task, context=None, config=None):
+            await asyncio.sleep(0.2)
+            return {"ok": True, "result_text": "done"}
+
+        mock_agent.side_effect = _slow_runner
+
+        with TestClient(server.app) as client:
+            first = client.post("/runs", json={"task": "build"}, headers=AUTH).json()
+            second = client.post("/runs", json={"task": " build "}, headers=AUTH).json()
+
+        assert second["run_id"] == first["run_id"]
+        assert mock_agent.call_count == 1
+
+    @patch("src.server.run_browser_agent_async")
+    def test_idempotency_key_served_from_cache(self, mock_agent, monkeypatch):
+        """Test a retry with the same Idempotency-Key gets the cached output."""
+        monkeypatch.setattr(server, "coalescer", RunCoalescer(ttl_sec=60))
+        mock_agent.return_value = {"ok": True, "result_text": "done"}
+        headers = {**AUTH, "Idempotency-Key": "order-42"}
+
+        with TestClient(server.app) as client:
+            first = client.post("/tools/run_browser_agent", json={"task": "a"}, headers=headers)
+            retry = client.post("/tools/run_browser_agent", json={"task": "b"}, headers=headers)
+
+        assert retry.json()["run_id"] == first.json()["run_id"]
+        assert mock_agent.call_count == 1
+
+    @pytest.mark.asyncio
+    @patch("src.server.run_browser_agent_async")
+    async def test_duplicate_reruns_when_leader_is_abandoned(self, mock_agent, monkeypatch):
+        """Test a caller attached to a cancelled request runs the task itself."""
+        monkeypatch.setattr(server, "coalescer", RunCoalescer(ttl_sec=0))
+        server.limiter.reset()
+        started = asyncio.Event()
+
+        async def _runner(task, context=None, config=None):
+            if mock_agent.call_count == 1:
+                started.set()
+                await asyncio.sleep(60)
+            return {"ok": True, "result_text": "done"}
+
+        mock_agent.side_effect = _runner
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+
+            def post():
+                return client.post("/tools/run_browser_agent", json={"task": "build"}, headers=AUTH)
+
+            leader = asyncio.ensure_future(post())
+            await asyncio.wait_for(started.wait(), timeout=10)
+            duplicate = asyncio.ensure_future(post())
+            await asyncio.sleep(0.1)
+            leader.cancel()
+            response = await asyncio.wait_for(duplicate, timeout=10)
+        server.limiter.reset()
+
+        assert response.status_code == 200
+        assert response.json()["ok"] is True
+        assert mock_agent.call_count == 2
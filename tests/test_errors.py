@@ -0,0 +1,168 @@
+"""
+Tests for the agent error taxonomy and retry policy.
+"""
+
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+from src.agent_runner import _run_saik0s, run_browser_agent_async
+from src.errors import (
+    AgentTimeout,
+    AuthExpired,
+    ErrorCode,
+    NetworkError,
+    RetryBudget,
+    classify_error,
+    classify_message,
+    retry_policy,
+)
+from src.settings import reload_settings
+
+
+class TestClassification:
+    """Test failures are mapped to typed errors."""
+
+    def test_exception_types_win_over_messages(self):
+        """Test the exception type decides before its message is looked at."""
+        assert isinstance(classify_error(TimeoutError("login page")), AgentTimeout)
+        assert isinstance(classify_error(ConnectionResetError("peer")), NetworkError)
+        assert classify_error(ImportError("browser_use")).code == ErrorCode.CONFIG_ERROR
+        playwright_timeout = PlaywrightTimeoutError("Timeout 30000ms exceeded.")
+        assert classify_error(playwright_timeout).code == ErrorCode.UI_CHANGED
+        assert retry_policy(ErrorCode.UI_CHANGED).retryable
+
+    @pytest.mark.parametrize(
+        "message,code",
+        [
+            ("Invalid API key provided (401)", ErrorCode.CONFIG_ERROR),
+            ("Redirected to login: session expired", ErrorCode.AUTH_EXPIRED),
+            ("net::ERR_CONNECTION_RESET at https://lovable.dev", ErrorCode.NETWORK_ERROR),
+            ("Error code: 429 - rate limit exceeded", ErrorCode.NETWORK_ERROR),
+            ("Lovable prompt input not found on this page", ErrorCode.UI_CHANGED),
+            ("Something went wrong", ErrorCode.UNKNOWN_ERROR),
+            ("Page.goto: 403 Forbidden", ErrorCode.AUTH_EXPIRED),
+            ("Locator.click: Timeout 30000ms exceeded.", ErrorCode.UI_CHANGED),
+            ("Lovable build did not complete within 300s", ErrorCode.TIMEOUT_BUILD),
+            ("Could not find the author field", ErrorCode.UNKNOWN_ERROR),
+            ("Cached preview link expired, reloading", ErrorCode.UNKNOWN_ERROR),
+            ("Click the Log in button in the header", ErrorCode.UNKNOWN_ERROR),
+            (
+                "Element with index 401 does not exist - retry or use alternative actions",
+                ErrorCode.UI_CHANGED,
+            ),
+            ("HTTP 401 returned by https://lovable.dev/api/projects", ErrorCode.AUTH_EXPIRED),
+            ("Response status: 403", ErrorCode.AUTH_EXPIRED),
+        ],
+    )
+    def test_messages(self, message, code):
+        """Test text-only failures are classified by message."""
+        assert classify_message(message) == code
+
+    def test_classified_error_passes_through(self):
+        """Test an already typed error is returned as is."""
+        error = AuthExpired("expired")
+        assert classify_error(error) is error
+
+
+class TestRetryPolicy:
+    """Test per-code policies and the global budget."""
+
+    def test_fast_fail_codes(self):
+        """Test expired sessions and configuration errors are never retried."""
+        assert retry_policy(ErrorCode.AUTH_EXPIRED).retryable is False
+        assert retry_policy(ErrorCode.CONFIG_ERROR).retryable is False
+        assert retry_policy(ErrorCode.NETWORK_ERROR).retryable is True
+
+    def test_network_backoff_is_exponential_with_jitter(self):
+        """Test network retries wait up to base * 2^n, capped."""
+        policy = retry_policy(ErrorCode.NETWORK_ERROR)
+        delays = [policy.delay(n) for n in (1, 2, 3, 10)]
+        assert 0 <= delays[0] <= 1
+        assert 0 <= delays[1] <= 2
+        assert 0 <= delays[2] <= 4
+        assert delays[3] <= policy.max_delay_sec
+
+    def test_budget_caps_retries(self):
+        """Test retries beyond ratio x attempts (or the minimum) are refused."""
+        budget = RetryBudget(ratio=0.5, min_retries=1, window_sec=60)
+        for _ in range(4):
+            budget.record_attempt()
+
+        assert [budget.try_spend() for _ in range(3)] == [True, True, False]
+        assert budget.stats()["denied_total"] == 1
+
+    @pytest.mark.asyncio
+    async def test_forwarded_budget_decides_elsewhere(self):
+        """Test a forwarding budget counts and spends through the other budget."""
+        gateway = RetryBudget(ratio=0, min_retries=1, window_sec=60)
+        budget = RetryBudget()
+
+        async def spend():
+            return gateway.try_spend()
+
+        budget.forward_to(gateway.record_attempt, spend)
+        budget.record_attempt()
+
+        assert [await budget.spend(), await budget.spend()] == [True, False]
+        assert gateway.stats()["attempts_in_window"] == 1
+        assert budget.stats()["attempts_in_window"] == 0
+
+
+class TestRunnerRetries:
+    """Test the runner applies the policy to agent failures."""
+
+    @pytest.fixture(autouse=True)
+    def _env(self, monkeypatch):
+        monkeypatch.setenv("MCP_LLM_OPENROUTER_API_KEY", "sk-or-test-key-123456")
+        monkeypatch.setenv("MCP_AGENT_RETRY_MAX", "3")
+        reload_settings()
+
+    @pytest.mark.asyncio
+    @patch("src.agent_runner._run_org_agent", new_callable=AsyncMock)
+    async def test_auth_expired_fails_fast(self, mock_agent):
+        """Test an expired session is not retried."""
+        mock_agent.side_effect = RuntimeError("Redirected to login page, session expired")
+
+        with pytest.raises(AuthExpired):
+            await _run_saik0s("rename my workspace")
+
+        assert mock_agent.await_count == 1
+
+    @pytest.mark.asyncio
+    @patch("src.agent_runner._retry_wait", return_value=0)
+    @patch("src.agent_runner._run_org_agent", new_callable=AsyncMock)
+    async def test_network_error_is_retried(self, mock_agent, _wait):
+        """Test network errors are retried up to MCP_AGENT_RETRY_MAX attempts."""
+        mock_agent.side_effect = [ConnectionResetError("reset"), ConnectionResetError("reset"), "ok"]
+
+        assert await _run_saik0s("rename my workspace") == "ok"
+        assert mock_agent.await_count == 3
+
+    @pytest.mark.asyncio
+    @patch("src.agent_runner._retry_wait", return_value=0)
+    @patch("src.agent_runner._run_org_agent", new_callable=AsyncMock)
+    async def test_exhausted_budget_stops_retries(self, mock_agent, _wait):
+        """Test no retry happens once the global budget is spent."""
+        mock_agent.side_effect = ConnectionResetError("reset")
+
+        with patch("src.agent_runner.retry_budget", RetryBudget(ratio=0, min_retries=0)):
+            with pytest.raises(NetworkError):
+                await _run_saik0s("rename my workspace")
+
+        assert mock_agent.await_count == 1
+
+    @pytest.mark.asyncio
+    async def test_missing_api_key_is_config_error(self, monkeypatch):
+        """Test a missing LLM key is reported as CONFIG_ERROR without launching a browser."""
+        monkeypatch.setenv("MCP_LLM_OPENROUTER_API_KEY", "")
+        monkeypatch.setenv("MCP_FAST_PATH_ENABLED", "false")
+        monkeypatch.setenv("MCP_MACROS_ENABLED", "false")
+        reload_settings()
+
+        with patch("src.agent_runner._run_org_agent", new_callable=AsyncMock) as mock_agent:
+            result = await run_browser_agent_async("rename my workspace")
+
+        assert result["error_code"] == "CONFIG_ERROR"
+        assert mock_agent.await_count == 0
@@ -0,0 +1,160 @@
+"""
+Tests for run progress events and the SSE endpoint.
+"""
+
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src.agent_runner import _make_step_callback
+from src.events import RunChannel, emit_run_event, run_event_sink
+from src.server import _channel_sink, app
+
+AUTH = {"Authorization": "Bearer test-token"}
+
+
+async def _collect(subscription):
+    return [item async for item in subscription]
+
+
+class TestRunChannel:
+    """Test event fan-out and buffering."""
+
+    @pytest.mark.asyncio
+    async def test_subscribers_receive_events_until_close(self):
+        """Test each subscriber sees every event, then the stream ends."""
+        channel = RunChannel("r1")
+        first, second = channel.subscribe(), channel.subscribe()
+
+        channel.publish("step", {"step": 1})
+        channel.publish("step", {"step": 2})
+        channel.close()
+
+        for events in (await _collect(first), await _collect(second)):
+            assert [e.data["step"] for e in events] == [1, 2]
+        assert channel.subscriber_count == 0
+
+    @pytest.mark.asyncio
+    async def test_slow_subscriber_drops_oldest(self):
+        """Test a full subscriber buffer drops old events instead of growing."""
+        channel = RunChannel("r1", history_size=0, buffer_size=2)
+        subscription = channel.subscribe()
+
+        for i in range(5):
+            channel.publish("step", {"step": i})
+        channel.close()
+
+        events = await _collect(subscription)
+        assert [e.data["step"] for e in events] == [3, 4]
+        assert subscription.dropped == 3
+
+    @pytest.mark.asyncio
+    async def test_late_subscriber_gets_history(self):
+        """Test a subscriber joining mid-run replays recent events."""
+        channel = RunChannel("r1", history_size=10)
+        channel.publish("status", {"status": "queued"})
+        subscription = channel.subscribe()
+        channel.close()
+
+        events = await _collect(subscription)
+        assert [e.event for e in events] == ["status"]
+
+    @pytest.mark.asyncio
+    async def test_heartbeat_when_idle(self):
+        """Test an idle stream yields None heartbeats."""
+        channel = RunChannel("r1")
+        stream = channel.subscribe().events(heartbeat_sec=0.01)
+
+        assert await stream.__anext__() is None
+        await stream.aclose()
+        assert channel.subscriber_count == 0
+
+
+class TestEmitters:
+    """Test runner-side event emission."""
+
+    @pytest.mark.asyncio
+    async def test_emit_uses_context_sink(self):
+        """Test emit_run_event is a no-op without a sink and forwards with one."""
+        received = []
+        emit_run_event("step", {"step": 1})
+
+        token = run_event_sink.set(lambda event, data: received.append((event, data)))
+        try:
+            emit_run_event("step", {"step": 2})
+        finally:
+            run_event_sink.reset(token)
+
+        assert received == [("step", {"step": 2})]
+
+    @pytest.mark.asyncio
+    async def test_step_callback_records_steps_and_url_changes(self):
+        """Test the agent step callback records steps and emits URL changes once."""
+        steps, received = [], []
+        callback = _make_step_callback(steps, attempt=1)
+        state = SimpleNamespace(url="https://lovable.dev/projects/1", title="Project")
+        output = SimpleNamespace(current_state=SimpleNamespace(next_goal="Build"), action=[])
+
+        token = run_event_sink.set(lambda event, data: received.append(event))
+        try:
+            await callback(state, output, 2)
+            await callback(state, output, 3)
+        finally:
+            run_event_sink.reset(token)
+
+        assert [s["step"] for s in steps] == [1, 2]
+        assert steps[0]["next_goal"] == "Build"
+        assert received == ["step", "url", "step"]
+
+    def test_channel_sink_surfaces_preview_url_once(self):
+        """Test URL events on a preview domain produce a single preview_url event."""
+        channel = RunChannel("r1")
+        sink = _channel_sink(channel)
+
+        sink("url", {"url": "https://abc123.lovable.dev/"})
+        sink("url", {"url": "https://abc123.lovable.dev/"})
+
+        events = [e.event for e in channel._history]
+        assert events == ["url", "preview_url", "url"]
+
+
+class TestEventsEndpoint:
+    """Test the SSE endpoint."""
+
+    def test_unknown_run(self):
+        """Test streaming an unknown run returns 404."""
+        with TestClient(app) as client:
+            response = client.get("/runs/nope/events", headers=AUTH)
+        assert response.status_code == 404
+
+    @patch("src.server.run_browser_agent_async")
+    def test_finished_run_streams_done(self, mock_agent):
+        """Test a run that already finished streams its final output."""
+
+        async def _fake_runner(task, context=None, config=None):
+            emit_run_event("url", {"url": "https://abc123.lovable.dev"})
+            await asyncio.sleep(0)
+            return {"ok": True, "result_text": "done"}
+
+        mock_agent.side_effect = _fake_runner
+
+        with TestClient(app) as client:
+            run_id = client.post("/runs", json={"task": "build"}, headers=AUTH).json()["run_id"]
+            for _ in range(50):
+                if client.get(f"/runs/{run_id}", headers=AUTH).json()["status"] == "done":
+                    break
+                time.sleep(0.02)
+
+            with client.stream("GET", f"/runs/{run_id}/events", headers=AUTH) as response:
+                assert response.headers["content-type"].startswith("text/event-stream")
+                body = "".join(response.iter_text())
+
+        assert "event: done" in body
+        data = json.loads(body.split("data: ", 1)[1].strip())
+        assert data["run_id"] == run_id
+        assert data["preview_url"] is None
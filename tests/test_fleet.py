@@ -0,0 +1,259 @@
+"""
+Tests for the shared job queue and fleet-wide limits.
+
+Two dispatchers (or account pools) on one SQLite file stand in for two nodes.
+"""
+
+import asyncio
+import time
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src import server
+from src.accounts import Account, AccountPool
+from src.auth_state import AuthStateStore
+from src.fleet import FleetDispatcher
+from src.job_queue import Job, JobBackend, SqliteJobBackend
+from src.settings import reload_settings
+
+AUTH = {"Authorization": "Bearer test-token"}
+
+
+def _job(job_id, created_at=None):
+    return Job(job_id=job_id, task=f"task {job_id}", created_at=created_at or time.time())
+
+
+def _dispatcher(backend, runner, node_id, capacity=1, global_limit=0):
+    return FleetDispatcher(
+        backend, runner, node_id=node_id, capacity=capacity, global_limit=global_limit,
+        poll_sec=0.02,
+    )
+
+
+class TestSqliteJobBackend:
+    """Test claims, results and leases on the SQLite backend."""
+
+    def test_claims_oldest_first_within_global_limit(self, tmp_path):
+        """Test runs are claimed in order and never beyond the fleet-wide limit."""
+        backend = SqliteJobBackend(str(tmp_path / "jobs.db"))
+        backend.submit(_job("old", created_at=1.0))
+        backend.submit(_job("new", created_at=2.0))
+
+        assert backend.claim("a", limit=1, lease_sec=60).job_id == "old"
+        assert backend.claim("b", limit=1, lease_sec=60) is None
+
+        backend.finish("old", {"ok": True})
+        assert backend.claim("b", limit=1, lease_sec=60).job_id == "new"
+        assert backend.get("old").result == {"ok": True}
+
+    def test_cancel_queued_and_running(self, tmp_path):
+        """Test a queued run is finished as cancelled and a running one is flagged."""
+        backend = SqliteJobBackend(str(tmp_path / "jobs.db"))
+        backend.submit(_job("running"))
+        backend.claim("a", limit=0, lease_sec=60)
+        backend.submit(_job("queued"))
+
+        backend.cancel("queued")
+        backend.cancel("running")
+
+        assert backend.get("queued").status == "done"
+        assert backend.get("queued").result["ok"] is False
+        assert backend.cancel_requested(["running", "queued"]) == ["running"]
+
+    def test_expired_claim_is_failed(self, tmp_path):
+        """Test a run whose node went away is failed instead of blocking the limit."""
+        backend = SqliteJobBackend(str(tmp_path / "jobs.db"))
+        backend.submit(_job("lost"))
+        backend.claim("gone", limit=1, lease_sec=-1)
+
+        assert backend.expire() == 1
+        assert backend.get("lost").result["error_code"] == "UNKNOWN_ERROR"
+        backend.submit(_job("next"))
+        assert backend.claim("a", limit=1, lease_sec=60).job_id == "next"
+
+    def test_account_leases_are_capped(self, tmp_path):
+        """Test an account can't be leased beyond its cap across nodes."""
+        backend = SqliteJobBackend(str(tmp_path / "jobs.db"))
+
+        first = backend.acquire_account("a", "alpha", max_concurrency=1, lease_sec=60)
+        assert first is not None
+        assert backend.acquire_account("b", "alpha", max_concurrency=1, lease_sec=60) is None
+
+        backend.release_account(first)
+        assert backend.acquire_account("b", "alpha", max_concurrency=1, lease_sec=60)
+
+    def test_second_host_is_refused(self, tmp_path):
+        """Test the file can't be shared across hosts until the first one lets go."""
+        path = str(tmp_path / "jobs.db")
+        first = SqliteJobBackend(path, host="machine-a")
+        SqliteJobBackend(path, host="machine-a")
+
+        with pytest.raises(ValueError, match="one host only"):
+            SqliteJobBackend(path, host="machine-b")
+
+        first.close()
+        assert SqliteJobBackend(path, host="machine-b").host == "machine-b"
+
+    def test_backend_interface_is_abstract(self):
+        """Test a backend missing methods can't be instantiated."""
+        with pytest.raises(TypeError):
+            JobBackend()
+
+
+class TestFleetDispatch:
+    """Test runs accepted on one node execute on whichever node has capacity."""
+
+    @pytest.mark.asyncio
+    async def test_run_executes_on_another_node(self, tmp_path):
+        """Test a node without a claim loop gets its result from the node that ran it."""
+        backend = SqliteJobBackend(str(tmp_path / "jobs.db"))
+        seen = []
+
+        async def runner(task, context, config):
+            seen.append((task, config.llm_model_name))
+            return {"ok": True, "result_text": "done"}
+
+        accepting = _dispatcher(backend, runner, "accepting")
+        executing = _dispatcher(backend, runner, "executing")
+        await executing.start()
+        try:
+            result = await asyncio.wait_for(
+                accepting.run("rename", overrides={"llm_model_name": "m-x"}), timeout=5
+            )
+        finally:
+            await executing.stop()
+
+        assert result == {"ok": True, "result_text": "done"}
+        assert seen == [("rename", "m-x")]
+        assert executing.stats()["executed"] == 1
+
+    @pytest.mark.asyncio
+    async def test_global_limit_holds_across_nodes(self, tmp_path):
+        """Test two nodes with spare capacity never exceed the fleet-wide limit together."""
+        backend = SqliteJobBackend(str(tmp_path / "jobs.db"))
+        running = 0
+        peak = 0
+
+        async def runner(task, context, config):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.05)
+            running -= 1
+            return {"ok": True, "result_text": task}
+
+        nodes = [_dispatcher(backend, runner, n, capacity=2, global_limit=1) for n in "ab"]
+        for node in nodes:
+            await node.start()
+        try:
+            results = await asyncio.wait_for(
+                asyncio.gather(*(nodes[i % 2].run(f"t{i}") for i in range(4))), timeout=10
+            )
+        finally:
+            for node in nodes:
+                await node.stop()
+
+        assert [r["result_text"] for r in results] == ["t0", "t1", "t2", "t3"]
+        assert peak == 1
+
+    @pytest.mark.asyncio
+    async def test_cancelled_caller_stops_the_run(self, tmp_path):
+        """Test cancelling the accepting side cancels the run on the executing node."""
+        backend = SqliteJobBackend(str(tmp_path / "jobs.db"))
+        started = asyncio.Event()
+
+        async def runner(task, context, config):
+            started.set()
+            await asyncio.sleep(60)
+
+        node = _dispatcher(backend, runner, "a")
+        await node.start()
+        try:
+            caller = asyncio.ensure_future(node.run("hang", job_id="hang"))
+            await asyncio.wait_for(started.wait(), timeout=5)
+            caller.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await caller
+            for _ in range(100):
+                if backend.get("hang").status == "done":
+                    break
+                await asyncio.sleep(0.02)
+        finally:
+            await node.stop()
+
+        assert backend.get("hang").result["error"] == "Run cancelled"
+
+
+class TestFleetAccounts:
+    """Test per-account caps hold across nodes."""
+
+    @pytest.mark.asyncio
+    @patch("src.accounts.LEASE_POLL_SEC", 0.05)
+    async def test_account_cap_is_fleet_wide(self, tmp_path):
+        """Test a second node waits for the account until the first node's run ends."""
+        backend = SqliteJobBackend(str(tmp_path / "jobs.db"))
+        state = tmp_path / "alpha.json"
+        state.write_text('{"cookies": [], "origins": []}')
+
+        def pool(node):
+            store = AuthStateStore(str(state), preflight_enabled=False)
+            store.reload()
+            account = Account(name="alpha", store=store, max_concurrency=1)
+            return AccountPool([account], leases=backend, node_id=node, lease_sec=60)
+
+        first, second = pool("a"), pool("b")
+        release = asyncio.Event()
+
+        async def hold():
+            async with first.acquire():
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0.05)
+
+        async def take():
+            async with second.acquire() as account:
+                return account.name
+
+        waiter = asyncio.create_task(take())
+        await asyncio.sleep(0.1)
+        assert not waiter.done()
+
+        release.set()
+        await holder
+        assert await asyncio.wait_for(waiter, timeout=3) == "alpha"
+
+
+class TestFleetGateway:
+    """Test the gateway routes runs through the shared queue when configured."""
+
+    @pytest.fixture(autouse=True)
+    def _fresh_limiter(self):
+        """Keep this test's run out of the per-IP window the other server tests share."""
+        server.limiter.reset()
+        yield
+        server.limiter.reset()
+
+    @patch("src.server.run_browser_agent_async", new_callable=AsyncMock)
+    def test_sync_run_goes_through_queue(self, mock_agent, tmp_path, monkeypatch):
+        """Test the run is queued, claimed by this node and reported in /health."""
+        monkeypatch.setenv("MCP_JOB_BACKEND", f"sqlite:///{tmp_path / 'jobs.db'}")
+        monkeypatch.setenv("MCP_JOB_POLL_SEC", "0.02")
+        reload_settings()
+        mock_agent.return_value = {"ok": True, "result_text": "done"}
+
+        with TestClient(server.app) as client:
+            response = client.post(
+                "/tools/run_browser_agent",
+                json={"task": "a", "config": {"llm_model_name": "m-x"}},
+                headers=AUTH,
+            )
+            health = client.get("/health").json()
+
+        assert response.status_code == 200
+        assert response.json()["ok"] is True
+        assert mock_agent.await_args.args[2].llm_model_name == "m-x"
+        assert health["fleet"]["executed"] == 1
+        assert health["fleet"]["queue"]["running"] == 0
@@ -2,11 +2,20 @@
 Tests for Lovable adapter modules (selectors and flows).
 """
 
-from unittest.mock import AsyncMock, MagicMock
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 
-from src.lovable_adapter import flows, selectors
+from src.lovable_adapter import (
+    actions,
+    build_signals,
+    flows,
+    preview,
+    router,
+    selectors,
+    settle,
+)
 
 
 class TestSelectors:
@@ -113,10 +122,11 @@ class TestFlows:
         locator_mock.first = AsyncMock()
         locator_mock.first.click = AsyncMock()
         page.locator = MagicMock(return_value=locator_mock)
-        page.wait_for_load_state = AsyncMock()
 
-        result = await flows.open_or_create_project(page, "TestProject")
+        with patch.object(flows, "wait_for_page_settled", AsyncMock(return_value=True)) as wait:
+            result = await flows.open_or_create_project(page, "TestProject")
         assert result is True
+        wait.assert_awaited_once()
 
     @pytest.mark.asyncio
     async def test_open_or_create_project_exception(self):
@@ -173,8 +183,8 @@ class TestFlows:
     @pytest.mark.asyncio
     async def test_wait_for_build_success(self):
         """Test wait_for_build returns True on success."""
-        page = AsyncMock()
-        page.wait_for_selector = AsyncMock()
+        page = MagicMock()
+        page.wait_for_function = AsyncMock()
 
         result = await flows.wait_for_build(page, timeout=5000)
         assert result is True
@@ -182,48 +192,62 @@ class TestFlows:
     @pytest.mark.asyncio
     async def test_wait_for_build_timeout(self):
         """Test wait_for_build returns False on timeout."""
-        page = AsyncMock()
-        page.wait_for_selector = AsyncMock(side_effect=Exception("Timeout"))
+        page = MagicMock()
+        page.wait_for_function = AsyncMock(side_effect=Exception("Timeout"))
 
-        result = await flows.wait_for_build(page, timeout=1000)
+        result = await flows.wait_for_build(page, timeout=100)
         assert result is False
 
+    def _preview_page(self, found=None, frame_urls=()):
+        page = MagicMock()
+        page.frames = [MagicMock(url=url) for url in frame_urls]
+        page.evaluate = AsyncMock(return_value=found)
+        page.content = AsyncMock(side_effect=AssertionError("page was serialized"))
+        return page
+
     @pytest.mark.asyncio
     async def test_extract_preview_url_success(self):
-        """Test extract_preview_url returns URL on success."""
-        page = AsyncMock()
-        locator_mock = AsyncMock()
-        locator_mock.count = AsyncMock(return_value=1)
-        locator_mock.first = AsyncMock()
-        locator_mock.first.get_attribute = AsyncMock(return_value="https://abc123.lovable.dev")
-        page.locator = MagicMock(return_value=locator_mock)
+        """Test extract_preview_url returns the URL found by the targeted scan."""
+        page = self._preview_page(found="https://abc123.lovable.dev")
 
         result = await flows.extract_preview_url(page)
-        assert result is not None
-        assert "lovable.dev" in result
+        assert result == "https://abc123.lovable.dev"
 
     @pytest.mark.asyncio
     async def test_extract_preview_url_none(self):
         """Test extract_preview_url returns None when not found."""
-        page = AsyncMock()
-        page.locator = MagicMock(return_value=AsyncMock())
-        page.locator.return_value.get_attribute = AsyncMock(return_value=None)
+        page = self._preview_page(frame_urls=["https://lovable.dev/projects/1"])
 
         result = await flows.extract_preview_url(page)
         assert result is None
 
     @pytest.mark.asyncio
-    async def test_extract_preview_url_from_content(self):
-        """Test extract_preview_url extracts from page content."""
-        page = AsyncMock()
-        locator_mock = AsyncMock()
-        locator_mock.count = AsyncMock(return_value=0)
-        page.locator = MagicMock(return_value=locator_mock)
-        page.content = AsyncMock(return_value="Visit https://myapp.lovable.dev for preview")
+    async def test_extract_preview_url_from_frame(self):
+        """Test a preview iframe's URL is used without evaluating the page."""
+        page = self._preview_page(frame_urls=["https://myapp.lovable.dev/index.html"])
 
         result = await flows.extract_preview_url(page)
-        assert result is not None
-        assert "lovable.dev" in result
+        assert result == "https://myapp.lovable.dev"
+        page.evaluate.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_extract_preview_url_cached_on_run(self):
+        """Test a URL captured from the network is served from the run cache."""
+        run = preview.RunPreview()
+        token = preview.current_run_preview.set(run)
+        try:
+            capture = preview.install_preview_capture(MagicMock())
+            capture._on_request(MagicMock(resource_type="script", url="https://x.lovable.dev/a.js"))
+            capture._on_request(MagicMock(resource_type="document", url="https://www.lovable.dev/"))
+            capture._on_request(MagicMock(resource_type="document", url="https://shop.lovable.dev/"))
+            page = self._preview_page()
+
+            assert await flows.extract_preview_url(page) == "https://shop.lovable.dev"
+            assert await flows.extract_preview_url(page) == "https://shop.lovable.dev"
+        finally:
+            preview.current_run_preview.reset(token)
+        assert run.source == "network"
+        page.evaluate.assert_not_awaited()
 
     @pytest.mark.asyncio
     async def test_open_or_create_project_create_new(self):
@@ -237,7 +261,246 @@ class TestFlows:
         page.locator = MagicMock(side_effect=[project_link, create_btn])
         page.fill = AsyncMock()
         page.click = AsyncMock()
-        page.wait_for_load_state = AsyncMock()
 
-        result = await flows.open_or_create_project(page, "NewProject")
+        with patch.object(flows, "wait_for_page_settled", AsyncMock(return_value=True)):
+            result = await flows.open_or_create_project(page, "NewProject")
         assert result is True
+
+
+class TestBuildSignals:
+    """Test event-driven build completion detection."""
+
+    def _page(self):
+        page = MagicMock()
+        handlers = {}
+        page.on = MagicMock(side_effect=lambda event, handler: handlers.__setitem__(event, handler))
+        async def status_text_never_appears(*args, **kwargs):
+            await asyncio.sleep(10)
+
+        page.wait_for_function = AsyncMock(side_effect=status_text_never_appears)
+        return page, handlers
+
+    @pytest.mark.parametrize(
+        "payload,outcome",
+        [
+            ('{"id": "b1", "status": "completed"}', "complete"),
+            (b'{"buildStatus":"ready"}', "complete"),
+            ('{"state": "failed", "error": "tsc"}', "failed"),
+            ('{"status": "building"}', None),
+            (None, None),
+        ],
+    )
+    def test_classify_payload(self, payload, outcome):
+        """Test status payloads are classified."""
+        assert build_signals.classify_build_payload(payload) == outcome
+
+    @pytest.mark.asyncio
+    async def test_websocket_frame_completes_build(self):
+        """Test a websocket status frame resolves the wait without the DOM check."""
+        page, handlers = self._page()
+        socket = MagicMock()
+        frames = {}
+        socket.on = MagicMock(side_effect=lambda event, handler: frames.__setitem__(event, handler))
+
+        async def feed():
+            await asyncio.sleep(0.01)
+            handlers["websocket"](socket)
+            frames["framereceived"]('{"type": "build", "status": "success"}')
+
+        asyncio.ensure_future(feed())
+        assert await build_signals.wait_for_build_signal(page, timeout=5000) == "complete"
+        page.remove_listener.assert_called()
+
+    @pytest.mark.asyncio
+    async def test_failed_status_response(self):
+        """Test a failed build reported by the status API ends the wait early."""
+        page, handlers = self._page()
+        response = MagicMock(url="https://lovable.dev/api/projects/1/builds/7")
+        response.text = AsyncMock(return_value='{"status": "error"}')
+
+        async def feed():
+            await asyncio.sleep(0.01)
+            handlers["response"](response)
+            handlers["response"](MagicMock(url="https://lovable.dev/assets/app.js"))
+
+        asyncio.ensure_future(feed())
+        assert await build_signals.wait_for_build_signal(page, timeout=5000) == "failed"
+        assert await flows.wait_for_build(page, timeout=50) is False
+
+    @pytest.mark.asyncio
+    async def test_dom_fallback_requires_status_change(self):
+        """Test the DOM check compares against the status seen before the build was triggered."""
+        page, _ = self._page()
+        page.evaluate = AsyncMock(return_value="Ready")
+        button = MagicMock(count=AsyncMock(return_value=1), click=AsyncMock())
+        page.locator = MagicMock(return_value=button)
+
+        assert await flows.trigger_build(page) is True
+        page.evaluate.return_value = "Building"
+        assert await build_signals.wait_for_build_signal(page, timeout=50) is None
+
+        assert page.wait_for_function.await_args.kwargs["arg"][2] == "Ready"
+        # Without a fresh trigger, the status at the start of the wait is the baseline.
+        await build_signals.wait_for_build_signal(page, timeout=50)
+        assert page.wait_for_function.await_args.kwargs["arg"][2] == "Building"
+
+    def test_status_regions_exclude_live_regions(self):
+        """Test toasts and other aria-live regions can't complete a build."""
+        assert "aria-live" not in selectors.BUILD_STATUS_REGION_SELECTOR
+
+
+class TestPageSettled:
+    """Test the DOM-quiescence wait."""
+
+    def _page(self, quiet_for):
+        page = MagicMock()
+        page.evaluate = AsyncMock(side_effect=quiet_for)
+        return page
+
+    @pytest.mark.asyncio
+    async def test_resolves_once_quiet(self):
+        """Test the wait returns as soon as the DOM has been quiet long enough."""
+        readings = iter([0, 5])
+        page = self._page(lambda _js: next(readings, 1000))
+
+        assert await settle.wait_for_page_settled(page, quiet_ms=50, timeout_ms=5000) is True
+        assert page.evaluate.await_count >= 3
+        page.remove_listener.assert_called()
+
+    def _start_request(self, page, resource_type):
+        """Fire one request as soon as the wait subscribes to request events."""
+        page.on = MagicMock(
+            side_effect=lambda event, handler: event == "request"
+            and handler(MagicMock(resource_type=resource_type))
+        )
+
+    @pytest.mark.asyncio
+    async def test_pending_request_holds_until_timeout(self):
+        """Test an in-flight request keeps the page unsettled."""
+        page = self._page(lambda _js: 1000)
+        self._start_request(page, "xhr")
+
+        assert await settle.wait_for_page_settled(page, quiet_ms=0, timeout_ms=120) is False
+
+    @pytest.mark.asyncio
+    async def test_websocket_does_not_block(self):
+        """Test long-lived connections are ignored."""
+        page = self._page(lambda _js: 1000)
+        self._start_request(page, "websocket")
+
+        assert await settle.wait_for_page_settled(page, quiet_ms=0, timeout_ms=120) is True
+
+    @pytest.mark.asyncio
+    async def test_unobservable_page_gives_up(self):
+        """Test a page that can't be evaluated doesn't hang the caller."""
+        page = self._page(lambda _js: None)
+
+        assert await settle.wait_for_page_settled(page, timeout_ms=5000) is False
+
+
+class TestRouter:
+    """Test recognition and execution of deterministic project flows."""
+
+    @pytest.mark.parametrize(
+        "task,name,prompt",
+        [
+            ('Create project "Todo" with prompt: Build a todo app', "Todo", "Build a todo app"),
+            ("update the project Shop using prompt 'Add dark mode'", "Shop", "Add dark mode"),
+            ("Create a new Lovable project CRM with prompt Track leads", "CRM", "Track leads"),
+        ],
+    )
+    def test_parse_task_text(self, task, name, prompt):
+        """Test create/update-project phrasings are recognized."""
+        request = router.parse_flow_request(task)
+        assert request is not None
+        assert (request.project_name, request.prompt) == (name, prompt)
+
+    def test_parse_structured_context(self):
+        """Test a structured context wins over free text."""
+        request = router.parse_flow_request(
+            "anything", {"project": "Todo", "prompt": "Build it", "action": "update"}
+        )
+        assert request == router.FlowRequest("update", "Todo", "Build it")
+
+    def test_unrecognized_task_needs_agent(self):
+        """Test open-ended tasks are left to the agent."""
+        assert router.parse_flow_request("Log in and rename my workspace") is None
+
+    @pytest.mark.asyncio
+    async def test_run_project_flow_success(self, monkeypatch):
+        """Test a flow that passes every stage returns the preview URL."""
+        for name in ("ensure_logged_in", "open_or_create_project", "paste_prompt",
+                     "trigger_build", "wait_for_build"):
+            monkeypatch.setattr(router, name, AsyncMock(return_value=True))
+        monkeypatch.setattr(
+            router, "extract_preview_url", AsyncMock(return_value="https://abc.lovable.dev")
+        )
+        page = AsyncMock()
+        page.url = "https://lovable.dev/projects/1"
+        stages = []
+
+        result = await router.run_project_flow(
+            page, router.FlowRequest("create", "Todo", "Build"), lambda s, u: stages.append(s)
+        )
+
+        assert result["preview_url"] == "https://abc.lovable.dev"
+        assert stages[-1] == "extract_preview_url"
+        page.goto.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_run_project_flow_reports_failed_stage(self, monkeypatch):
+        """Test the first failing stage is named in FlowFailed."""
+        monkeypatch.setattr(router, "ensure_logged_in", AsyncMock(return_value=True))
+        monkeypatch.setattr(router, "open_or_create_project", AsyncMock(return_value=True))
+        monkeypatch.setattr(router, "paste_prompt", AsyncMock(return_value=False))
+        page = AsyncMock()
+        page.url = "https://lovable.dev/"
+
+        with pytest.raises(router.FlowFailed) as exc:
+            await router.run_project_flow(page, router.FlowRequest("create", "Todo", "Build"))
+        assert exc.value.stage == "paste_prompt"
+
+
+class TestCustomActions:
+    """Test the Lovable custom agent actions and step reporting."""
+
+    @pytest.mark.asyncio
+    async def test_submit_prompt_reports_missing_build_button(self, monkeypatch):
+        """Test a failed stage surfaces as an action error for the agent."""
+        monkeypatch.setattr(actions, "paste_prompt", AsyncMock(return_value=True))
+        monkeypatch.setattr(actions, "trigger_build", AsyncMock(return_value=False))
+
+        content, error = await actions.submit_prompt(AsyncMock(), "Build a todo app")
+
+        assert content is None
+        assert "build button" in error
+
+    @pytest.mark.asyncio
+    async def test_read_preview_url(self, monkeypatch):
+        """Test the preview URL is returned as action content."""
+        monkeypatch.setattr(
+            actions, "extract_preview_url", AsyncMock(return_value="https://abc.lovable.dev")
+        )
+
+        content, error = await actions.read_preview_url(AsyncMock())
+
+        assert error is None
+        assert "https://abc.lovable.dev" in content
+
+    def test_step_report_counts_custom_actions(self):
+        """Test custom action usage and estimated savings are reported per run."""
+        steps = [
+            {"actions": [{"go_to_url": {"url": "https://lovable.dev"}}]},
+            {"actions": [{"lovable_submit_prompt": {"prompt": "x"}}]},
+            {"actions": [{"lovable_wait_for_build": {}}, {"lovable_get_preview_url": {}}]},
+        ]
+
+        report = actions.step_report(steps)
+
+        assert report["agent_steps"] == 3
+        assert report["lovable_actions"] == {
+            "lovable_submit_prompt": 1,
+            "lovable_wait_for_build": 1,
+            "lovable_get_preview_url": 1,
+        }
+        assert report["estimated_steps_saved"] == 10
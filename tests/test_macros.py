@@ -0,0 +1,327 @@
+"""
+Tests for compiled macros (history compilation, replay and routing).
+"""
+
+import json
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from src.agent_runner import run_browser_agent_async
+from src.macros import (
+    Macro,
+    MacroStep,
+    MacroStepFailed,
+    MacroStore,
+    compile_history,
+    replay_macro,
+    templatize,
+)
+
+TASK = 'Open project "Todo" and send prompt "Build a todo app"'
+
+
+def _history(final_text="Done: https://abc123.lovable.dev", success=True):
+    return {
+        "history": [
+            {
+                "model_output": {"action": [{"go_to_url": {"url": "https://lovable.dev/"}}]},
+                "result": [{"error": None}],
+                "state": {"interacted_element": [None]},
+            },
+            {
+                "model_output": {
+                    "action": [
+                        {"click_element": {"index": 4}},
+                        {"input_text": {"index": 7, "text": "Build a todo app"}},
+                    ]
+                },
+                "result": [{"error": None}, {"error": None}],
+                "state": {
+                    "interacted_element": [
+                        {
+                            "css_selector": "a.project-todo",
+                            "xpath": "/html/body/a[1]",
+                            "attributes": {"aria-label": "Open Todo"},
+                        },
+                        {
+                            "css_selector": "textarea#prompt",
+                            "xpath": "/html/body/textarea",
+                            "attributes": {"placeholder": "Ask Lovable..."},
+                        },
+                    ]
+                },
+            },
+            {
+                "model_output": {
+                    "action": [
+                        {"lovable_wait_for_build": {"timeout_sec": 120}},
+                        {"done": {"text": final_text}},
+                    ]
+                },
+                "result": [
+                    {"error": None},
+                    {"error": None, "is_done": True, "success": success},
+                ],
+                "state": {"interacted_element": [None, None]},
+            },
+        ]
+    }
+
+
+class TestCompile:
+    """Test turning agent histories into parameterized macros."""
+
+    def test_templatize_extracts_quoted_slots(self):
+        """Test quoted values become slots and the rest is normalized."""
+        template, values = templatize(TASK)
+        assert template == "open project {slot0} and send prompt {slot1}"
+        assert values == ["Todo", "Build a todo app"]
+
+    def test_compile_parameterizes_typed_values(self):
+        """Test typed text matching a slot is replaced by its placeholder."""
+        macro = compile_history(TASK, _history())
+
+        assert [s.action for s in macro.steps] == [
+            "go_to_url",
+            "click_element",
+            "input_text",
+            "lovable_wait_for_build",
+        ]
+        assert macro.steps[2].value == "{slot1}"
+        assert macro.steps[2].selector == "textarea#prompt"
+        assert macro.expects_preview_url is True
+
+    def test_element_identity_is_recorded_and_parameterized(self):
+        """Test element steps keep an identifying attribute, with slot values replaced."""
+        macro = compile_history(TASK, _history())
+
+        assert (macro.steps[1].identity_attr, macro.steps[1].identity) == (
+            "aria-label",
+            "Open {slot0}",
+        )
+        assert macro.steps[2].identity == "Ask Lovable..."
+
+    def test_element_without_identity_is_not_compiled(self):
+        """Test a click on an element known only by position never becomes a macro."""
+        history = _history()
+        history["history"][1]["state"]["interacted_element"][0]["attributes"] = {}
+        assert compile_history(TASK, history) is None
+
+    def test_navigation_to_a_fixed_project_is_not_compiled(self):
+        """Test a recorded project URL is only kept when its id is one of the task's slots."""
+        history = _history()
+        project_url = "https://lovable.dev/projects/8d3c0a52-1f6e-4d8a-9b7e-2c1f0e5d4a3b"
+        history["history"][0]["model_output"]["action"] = [{"go_to_url": {"url": project_url}}]
+        assert compile_history(TASK, history) is None
+
+        history["history"][0]["model_output"]["action"] = [
+            {"go_to_url": {"url": "https://lovable.dev/projects/Todo"}}
+        ]
+        assert compile_history(TASK, history).steps[0].value == (
+            "https://lovable.dev/projects/{slot0}"
+        )
+
+    def test_unsupported_action_is_not_compiled(self):
+        """Test histories with actions the replayer can't run are skipped."""
+        history = _history()
+        history["history"][0]["model_output"]["action"] = [{"open_tab": {"url": "x"}}]
+        assert compile_history(TASK, history) is None
+
+    def test_unsuccessful_run_is_not_compiled(self):
+        """Test a run the agent didn't finish successfully never becomes a macro."""
+        assert compile_history(TASK, _history(success=False)) is None
+        unfinished = _history()
+        unfinished["history"][-1]["result"][-1] = {"error": None}
+        assert compile_history(TASK, unfinished) is None
+
+    def test_slot_values_only_replace_whole_words(self):
+        """Test a slot value isn't substituted inside longer words."""
+        task = 'Open project "app" and send prompt "Build a todo app"'
+        history = _history()
+        history["history"][0]["model_output"]["action"] = [
+            {"go_to_url": {"url": "https://lovable.dev/apps/app"}}
+        ]
+
+        macro = compile_history(task, history)
+
+        assert macro.steps[0].value == "https://lovable.dev/apps/{slot0}"
+
+
+class TestReplay:
+    """Test deterministic replay and step validation."""
+
+    def _page(self):
+        page = MagicMock()
+        page.url = "https://lovable.dev/projects/1"
+        page.goto = AsyncMock()
+        locator = MagicMock()
+        locator.wait_for = AsyncMock()
+        locator.click = AsyncMock()
+        locator.fill = AsyncMock()
+        locator.get_attribute = AsyncMock(return_value="Ask Lovable...")
+        page.locator = MagicMock(return_value=MagicMock(first=locator))
+        return page, locator
+
+    @staticmethod
+    def _step(action, **fields):
+        return MacroStep(action, selector="textarea#prompt", identity_attr="placeholder", **fields)
+
+    @pytest.mark.asyncio
+    async def test_replay_fills_new_slot_values(self):
+        """Test a replay types this task's values, not the recorded ones."""
+        page, locator = self._page()
+        macro = Macro(
+            template="t",
+            slot_count=1,
+            steps=[self._step("input_text", identity="Ask Lovable...", value="{slot0}")],
+        )
+
+        with patch("src.macros.extract_preview_url", AsyncMock(return_value=None)):
+            result = await replay_macro(page, macro, ["Build a CRM"])
+
+        locator.fill.assert_awaited_once()
+        assert locator.fill.await_args.args[0] == "Build a CRM"
+        assert result["project_url"] == page.url
+
+    @pytest.mark.asyncio
+    async def test_missing_element_fails_validation(self):
+        """Test a step whose element never appears raises MacroStepFailed."""
+        page, locator = self._page()
+        locator.wait_for.side_effect = TimeoutError("not visible")
+        macro = Macro(template="t", slot_count=0, steps=[self._step("click_element", identity="x")])
+
+        with pytest.raises(MacroStepFailed) as exc:
+            await replay_macro(page, macro, [])
+        assert exc.value.index == 1
+        assert exc.value.started is False
+
+    @pytest.mark.asyncio
+    async def test_element_of_another_project_is_not_clicked(self):
+        """Test a replay for project "Shop" refuses the element recorded for "Todo"."""
+        page, locator = self._page()
+        locator.get_attribute.return_value = "Open Todo"
+        macro = Macro(
+            template="t",
+            slot_count=1,
+            steps=[
+                MacroStep(
+                    "click_element",
+                    selector="a",
+                    identity_attr="aria-label",
+                    identity="Open {slot0}",
+                )
+            ],
+        )
+
+        with pytest.raises(MacroStepFailed) as exc:
+            await replay_macro(page, macro, ["Shop"])
+
+        assert exc.value.steps_run == 0
+        assert locator.click.await_count == 0
+        assert page.locator.call_args_list[0].args[0] == '[aria-label="Open Shop"]'
+
+
+class TestMacroStore:
+    """Test persistence and retirement of macros."""
+
+    def test_find_and_drop_after_failures(self, tmp_path):
+        """Test a stored macro is found by template and dropped after repeated failures."""
+        store = MacroStore(str(tmp_path), max_failures=2)
+        history_path = tmp_path / "history.json"
+        history_path.write_text(json.dumps(_history()))
+        store.compile_from_file(TASK, str(history_path))
+
+        reloaded = MacroStore(str(tmp_path), max_failures=2)
+        macro, values = reloaded.find('Open project "Shop" and send prompt "Sell shoes"')
+        assert macro is not None
+        assert values == ["Shop", "Sell shoes"]
+
+        reloaded.record_failure(macro)
+        reloaded.record_failure(macro)
+        assert reloaded.find(TASK)[0] is None
+
+    def test_context_is_part_of_the_key(self, tmp_path):
+        """Test a macro compiled for one context doesn't replay for another."""
+        store = MacroStore(str(tmp_path))
+        store.save(compile_history(TASK, _history(), {"workspace": "a"}))
+
+        assert store.find(TASK, {"workspace": "a"})[0] is not None
+        assert store.find(TASK, {"workspace": "b"})[0] is None
+        assert store.find(TASK)[0] is None
+
+
+class TestMacroRouting:
+    """Test the runner prefers a compiled macro over the agent."""
+
+    @pytest.mark.asyncio
+    @patch("src.agent_runner._standalone_page")
+    @patch("src.agent_runner.replay_macro", new_callable=AsyncMock)
+    @patch("src.agent_runner._run_saik0s", new_callable=AsyncMock)
+    async def test_matching_task_replays_macro(self, mock_agent, mock_replay, _page, tmp_path):
+        """Test a task matching a stored template skips the LLM agent."""
+        store = MacroStore(str(tmp_path))
+        store.save(compile_history(TASK, _history()))
+        mock_replay.return_value = {
+            "result_text": "Replayed compiled macro. Preview URL: https://x.lovable.dev",
+            "preview_url": "https://x.lovable.dev",
+            "project_url": "https://lovable.dev/projects/2",
+        }
+
+        with patch("src.agent_runner.get_macro_store", return_value=store):
+            result = await run_browser_agent_async(
+                'Open project "Shop" and send prompt "Sell shoes"'
+            )
+
+        assert result["debug"]["path"] == "macro"
+        assert mock_agent.await_count == 0
+        assert mock_replay.await_args.args[2] == ["Shop", "Sell shoes"]
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize(
+        "failure, agent_runs",
+        [
+            (MacroStepFailed(2, "click_element", "no visible element", started=False), 1),
+            (MacroStepFailed(3, "input_text", "detached"), 0),
+        ],
+    )
+    @patch("src.agent_runner._standalone_page")
+    @patch("src.agent_runner.replay_macro", new_callable=AsyncMock)
+    @patch("src.agent_runner._run_saik0s", new_callable=AsyncMock)
+    async def test_agent_fallback_only_before_side_effects(
+        self, mock_agent, mock_replay, _page, failure, agent_runs, tmp_path
+    ):
+        """Test a replay that failed after its click is reported, not rerun by the agent."""
+        store = MacroStore(str(tmp_path))
+        store.save(compile_history(TASK, _history()))
+        mock_replay.side_effect = failure
+        mock_agent.return_value = "Done: https://abc123.lovable.dev"
+
+        with patch("src.agent_runner.get_macro_store", return_value=store):
+            result = await run_browser_agent_async(TASK)
+
+        assert mock_agent.await_count == agent_runs
+        assert result["ok"] is bool(agent_runs)
+        assert "macro_error" in result["debug"]
+
+    @pytest.mark.asyncio
+    @patch("src.agent_runner._run_saik0s", new_callable=AsyncMock)
+    async def test_successful_agent_run_is_compiled(self, mock_agent, tmp_path):
+        """Test the agent's saved history is compiled after a successful run."""
+        store = MacroStore(str(tmp_path))
+
+        async def _agent(task, cdp_url=None, steps=None, history_path=None, config=None):
+            with open(history_path, "w") as f:
+                json.dump(_history(), f)
+            return "Done: https://abc123.lovable.dev"
+
+        mock_agent.side_effect = _agent
+
+        with patch("src.agent_runner.get_macro_store", return_value=store), patch(
+            "src.agent_runner.tempfile.gettempdir", return_value=str(tmp_path)
+        ):
+            (tmp_path / "browser_agent_history").mkdir()
+            result = await run_browser_agent_async(TASK)
+
+        assert result["ok"] is True
+        assert store.find(TASK)[0] is not None
@@ -0,0 +1,98 @@
+"""
+Tests for the Prometheus metrics registry and /metrics endpoint.
+"""
+
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src.metrics import MetricsRegistry, _Metric, runs_total
+from src.server import app
+
+AUTH = {"Authorization": "Bearer test-token"}
+
+
+class TestRegistry:
+    """Test metric types and text rendering."""
+
+    def test_counter_renders_labels(self):
+        """Test labelled counters render one sample per label set."""
+        registry = MetricsRegistry()
+        counter = registry.counter("jobs_total", "Jobs.", ["outcome"])
+        counter.inc(outcome="ok")
+        counter.inc(2, outcome="ok")
+        counter.inc(outcome='bad"quote')
+
+        text = registry.render()
+        assert "# TYPE jobs_total counter" in text
+        assert 'jobs_total{outcome="ok"} 3' in text
+        assert 'jobs_total{outcome="bad\\"quote"} 1' in text
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Test histogram buckets, sum and count follow the exposition format."""
+        registry = MetricsRegistry()
+        histogram = registry.histogram("wait_seconds", "Wait.", buckets=(1, 10))
+        for value in (0.5, 5, 50):
+            histogram.observe(value)
+
+        text = registry.render()
+        assert 'wait_seconds_bucket{le="1"} 1' in text
+        assert 'wait_seconds_bucket{le="10"} 2' in text
+        assert 'wait_seconds_bucket{le="+Inf"} 3' in text
+        assert "wait_seconds_sum 55.5" in text
+        assert "wait_seconds_count 3" in text
+
+    def test_failing_callback_does_not_break_scrape(self):
+        """Test one broken callback metric is skipped rather than failing the scrape."""
+        registry = MetricsRegistry()
+        registry.callback("broken", "Broken.", lambda: 1 / 0)
+        registry.counter("fine_total", "Fine.").inc()
+
+        assert "fine_total 1" in registry.render()
+
+    def test_metric_base_is_abstract(self):
+        """Test a metric type without a sample renderer can't be instantiated."""
+        with pytest.raises(TypeError):
+            _Metric("bare", "Bare.")
+
+    def test_drain_and_merge_move_series_between_registries(self):
+        """Test a worker's drained series add to the gateway's and reset the worker's."""
+        worker, gateway = MetricsRegistry(), MetricsRegistry()
+        for registry in (worker, gateway):
+            registry.counter("jobs_total", "Jobs.", ["outcome"])
+            registry.histogram("wait_seconds", "Wait.", buckets=(1, 10))
+        gateway.get("jobs_total").inc(outcome="ok")
+        worker.get("jobs_total").inc(2, outcome="ok")
+        worker.get("wait_seconds").observe(5)
+
+        gateway.merge(worker.drain())
+
+        assert gateway.get("jobs_total").value(outcome="ok") == 3
+        assert gateway.get("wait_seconds").count() == 1
+        assert worker.drain() == {}
+
+
+class TestMetricsEndpoint:
+    """Test /metrics integration."""
+
+    @patch("src.server.run_browser_agent_async")
+    def test_run_outcomes_and_queue_wait_exposed(self, mock_agent):
+        """Test a failed run shows up as its mapped error code."""
+        mock_agent.return_value = {"ok": False, "error": "Request timed out"}
+        before = runs_total.value(mode="sync", outcome="TIMEOUT_BUILD")
+
+        with TestClient(app) as client:
+            client.post("/tools/run_browser_agent", json={"task": "build"}, headers=AUTH)
+            response = client.get("/metrics", headers=AUTH)
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert runs_total.value(mode="sync", outcome="TIMEOUT_BUILD") == before + 1
+        assert "lovable_gateway_queue_wait_seconds_bucket" in response.text
+        assert 'lovable_gateway_scheduler_slots{state="capacity"}' in response.text
+
+    def test_metrics_requires_auth(self):
+        """Test /metrics is behind the bearer token like the rest of the API."""
+        with TestClient(app) as client:
+            assert client.get("/metrics").status_code == 401
@@ -0,0 +1,104 @@
+"""
+Tests for the network request blocking profile.
+"""
+
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from src.agent_runner import run_browser_agent_async
+from src.request_blocking import (
+    NetworkSavings,
+    RequestBlocker,
+    load_blocking_profile,
+)
+from src.settings import reload_settings
+
+
+def _route(url, resource_type):
+    return SimpleNamespace(
+        request=SimpleNamespace(url=url, resource_type=resource_type),
+        continue_=AsyncMock(),
+        abort=AsyncMock(),
+        fulfill=AsyncMock(),
+    )
+
+
+class TestBlockingProfile:
+    """Test profile configuration and decisions."""
+
+    def test_lovable_default(self):
+        """Test trackers are stubbed, media/fonts aborted and the app left alone."""
+        profile = load_blocking_profile()
+
+        assert profile.decide("https://www.googletagmanager.com/gtm.js", "script") == "stub"
+        assert profile.decide("https://lovable.dev/fonts/inter.woff2", "font") == "abort"
+        assert profile.decide("https://lovable.dev/assets/app.js", "script") is None
+        assert profile.decide("https://lovable.dev/logo.png", "image") is None
+
+    def test_env_overrides(self, monkeypatch):
+        """Test resource types can be replaced and URL patterns added."""
+        monkeypatch.setenv("MCP_NETWORK_BLOCK_RESOURCE_TYPES", "image")
+        monkeypatch.setenv("MCP_NETWORK_BLOCK_URL_PATTERNS", r"example\.com/beacon")
+        reload_settings()
+        profile = load_blocking_profile()
+
+        assert profile.decide("https://lovable.dev/font.woff2", "font") is None
+        assert profile.decide("https://lovable.dev/logo.png", "image") == "abort"
+        assert profile.decide("https://example.com/beacon?x=1", "xhr") == "stub"
+
+    def test_profile_off(self, monkeypatch):
+        """Test blocking can be disabled."""
+        monkeypatch.setenv("MCP_NETWORK_BLOCK_PROFILE", "off")
+        reload_settings()
+        assert load_blocking_profile() is None
+
+
+class TestRequestBlocker:
+    """Test the route handler and per-run savings."""
+
+    @pytest.mark.asyncio
+    async def test_handle_counts_savings(self):
+        """Test blocked and stubbed requests are counted; others continue."""
+        blocker = RequestBlocker(load_blocking_profile())
+        blocker.savings = NetworkSavings()
+        routes = [
+            _route("https://lovable.dev/app.js", "script"),
+            _route("https://lovable.dev/intro.mp4", "media"),
+            _route("https://cdn.segment.com/analytics.js", "script"),
+        ]
+
+        for route in routes:
+            await blocker._handle(route)
+
+        routes[0].continue_.assert_awaited_once()
+        routes[1].abort.assert_awaited_once()
+        routes[2].fulfill.assert_awaited_once()
+        assert blocker.savings.requests_blocked == 1
+        assert blocker.savings.requests_stubbed == 1
+        assert blocker.savings.by_resource_type == {"media": 1, "script": 1}
+
+    @pytest.mark.asyncio
+    async def test_bytes_estimate_learns_from_responses(self):
+        """Test observed response sizes replace the built-in estimate."""
+        blocker = RequestBlocker(load_blocking_profile())
+        blocker.savings = NetworkSavings()
+        response = SimpleNamespace(
+            headers={"content-length": "1000"}, request=SimpleNamespace(resource_type="font")
+        )
+        blocker._on_response(response)
+
+        await blocker._handle(_route("https://lovable.dev/a.woff2", "font"))
+
+        assert blocker.savings.estimated_bytes_saved == 1000
+
+    @pytest.mark.asyncio
+    @patch("src.agent_runner._run_saik0s", new_callable=AsyncMock)
+    async def test_run_reports_network_savings(self, mock_agent):
+        """Test each run's debug carries its network savings."""
+        mock_agent.return_value = "done"
+
+        result = await run_browser_agent_async("rename my workspace")
+
+        assert result["debug"]["network"]["requests_blocked"] == 0
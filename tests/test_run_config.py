@@ -0,0 +1,124 @@
+"""
+Tests for the per-run execution config.
+"""
+
+import asyncio
+import os
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src import server
+from src.agent_runner import _run_saik0s
+from src.coalescer import RunCoalescer
+from src.run_config import RunConfig
+from src.settings import reload_settings
+
+AUTH = {"Authorization": "Bearer test-token"}
+
+
+class TestRunConfig:
+    """Test resolving and overriding run settings."""
+
+    def test_from_settings(self, monkeypatch):
+        """Test settings are read from the MCP_* environment."""
+        monkeypatch.setenv("MCP_LLM_MODEL_NAME", "anthropic/claude-haiku")
+        monkeypatch.setenv("MCP_AGENT_TIMEOUT_SEC", "120")
+        monkeypatch.setenv("MCP_BROWSER_HEADLESS", "false")
+
+        reload_settings()
+
+        config = RunConfig.from_settings()
+
+        assert config.llm_model_name == "anthropic/claude-haiku"
+        assert config.timeout_sec == 120
+        assert config.headless is False
+
+    def test_overrides_are_capped(self):
+        """Test requests can lower the timeout and retries but not raise them."""
+        base = RunConfig(timeout_sec=600, retry_max=2)
+
+        config = base.with_overrides({"timeout_sec": 9999, "retry_max": 1, "llm_temperature": 0})
+
+        assert config.timeout_sec == 600
+        assert config.retry_max == 1
+        assert config.llm_temperature == 0
+        assert base.retry_max == 2
+
+    def test_unknown_override_is_rejected(self):
+        """Test secrets and endpoints can't be overridden per request."""
+        with pytest.raises(ValueError, match="llm_base_url"):
+            RunConfig().with_overrides({"llm_base_url": "https://evil.example"})
+
+    def test_api_key_not_in_repr(self):
+        """Test the key never ends up in logs through the config's repr."""
+        assert "sk-or-secret" not in repr(RunConfig(llm_api_key="sk-or-secret"))
+
+
+class TestIsolatedRuns:
+    """Test runs take their settings from their own config only."""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_runs_with_different_configs(self):
+        """Test parallel runs each reach the agent with their own model and state."""
+        seen = {}
+
+        async def fake_agent(task, **kwargs):
+            await asyncio.sleep(0.01)
+            seen[task] = (kwargs["llm_model_name"], kwargs["storage_state"]["cookies"][0]["name"])
+            return "ok"
+
+        configs = {
+            name: RunConfig(
+                llm_api_key=f"sk-or-{name * 12}",
+                llm_model_name=f"m-{name}",
+                storage_state={"cookies": [{"name": name}], "origins": []},
+            )
+            for name in ("a", "b")
+        }
+        environ_before = dict(os.environ)
+        with patch("src.agent_runner._run_org_agent", side_effect=fake_agent):
+            await asyncio.gather(*(_run_saik0s(t, config=c) for t, c in configs.items()))
+
+        assert seen == {"a": ("m-a", "a"), "b": ("m-b", "b")}
+        assert dict(os.environ) == environ_before
+
+
+class TestRequestOverrides:
+    """Test per-request overrides through the API."""
+
+    @patch("src.server.run_browser_agent_async", new_callable=AsyncMock)
+    def test_overrides_reach_the_runner(self, mock_agent):
+        """Test the resolved config carries the request's overrides."""
+        mock_agent.return_value = {"ok": True, "result_text": "done"}
+        client = TestClient(server.app)
+
+        response = client.post(
+            "/tools/run_browser_agent",
+            json={"task": "a", "config": {"llm_model_name": "m-x", "timeout_sec": 30}},
+            headers=AUTH,
+        )
+
+        assert response.status_code == 200
+        config = mock_agent.await_args.args[2]
+        assert config.llm_model_name == "m-x"
+        assert config.timeout_sec == 30
+
+    def test_unknown_override_is_422(self):
+        """Test fields outside the allowed set are rejected by validation."""
+        client = TestClient(server.app)
+
+        response = client.post(
+            "/tools/run_browser_agent",
+            json={"task": "a", "config": {"llm_api_key": "sk"}},
+            headers=AUTH,
+        )
+
+        assert response.status_code == 422
+
+    def test_config_is_part_of_the_dedup_key(self):
+        """Test identical tasks with different settings aren't coalesced."""
+        plain = RunCoalescer.key_for("c", "task")
+        assert RunCoalescer.key_for("c", "task", config={}) == plain
+        assert RunCoalescer.key_for("c", "task", config={"llm_model_name": "m"}) != plain
@@ -0,0 +1,112 @@
+"""
+Tests for the asynchronous run store and job API.
+"""
+
+import time
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src.run_store import RunStore, RunStoreFull
+from src.server import RunOutput, app
+
+AUTH = {"Authorization": "Bearer test-token"}
+
+
+class TestRunStore:
+    """Test run record bookkeeping and eviction."""
+
+    def test_create_and_finish(self):
+        """Test a run moves from queued to its final status."""
+        store = RunStore(max_runs=10, ttl_sec=60)
+        record = store.create("r1", "build a todo app")
+        assert record.status == "queued"
+
+        store.mark_running("r1")
+        assert store.get("r1").status == "running"
+
+        store.finish("r1", RunOutput(ok=True, status="done", run_id="r1"))
+        record = store.get("r1")
+        assert record.done
+        assert record.status == "done"
+        assert record.output.run_id == "r1"
+
+    def test_expired_runs_are_evicted(self):
+        """Test finished runs disappear after the TTL."""
+        store = RunStore(max_runs=10, ttl_sec=60)
+        store.create("r1", "task")
+        store.finish("r1", RunOutput(ok=True, status="done"))
+
+        with patch("src.run_store.time.time", return_value=time.time() + 120):
+            assert store.get("r1") is None
+        assert store.stats()["evicted"] == 1
+
+    def test_capacity_evicts_oldest_finished(self):
+        """Test a full store makes room by dropping the oldest finished run."""
+        store = RunStore(max_runs=2, ttl_sec=60)
+        store.create("r1", "task")
+        store.create("r2", "task")
+        store.finish("r1", RunOutput(ok=True, status="done"))
+
+        store.create("r3", "task")
+        assert store.get("r1") is None
+        assert store.get("r2") is not None
+
+    def test_capacity_rejects_when_all_pending(self):
+        """Test submissions are rejected when only pending runs remain."""
+        store = RunStore(max_runs=1, ttl_sec=60)
+        store.create("r1", "task")
+
+        with pytest.raises(RunStoreFull):
+            store.create("r2", "task")
+
+    def test_pending_runs_never_expire(self):
+        """Test queued runs survive past the TTL."""
+        store = RunStore(max_runs=10, ttl_sec=1)
+        store.create("r1", "task")
+
+        with patch("src.run_store.time.time", return_value=time.time() + 120):
+            assert store.get("r1") is not None
+
+
+class TestRunsApi:
+    """Test the submit/poll endpoints."""
+
+    @patch("src.server.run_browser_agent_async")
+    def test_submit_then_poll(self, mock_agent):
+        """Test a submitted run can be fetched once done."""
+        mock_agent.return_value = {
+            "ok": True,
+            "result_text": "Preview: https://abc123.lovable.dev",
+        }
+
+        with TestClient(app) as client:
+            response = client.post("/runs", json={"task": "build"}, headers=AUTH)
+            assert response.status_code == 202
+            data = response.json()
+            assert data["status"] == "queued"
+            run_id = data["run_id"]
+
+            for _ in range(50):
+                data = client.get(f"/runs/{run_id}", headers=AUTH).json()
+                if data["status"] not in ("queued", "running"):
+                    break
+                time.sleep(0.02)
+
+        assert data["ok"] is True
+        assert data["status"] == "done"
+        assert data["run_id"] == run_id
+        assert data["preview_url"] == "https://abc123.lovable.dev"
+
+    def test_unknown_run(self):
+        """Test polling an unknown run_id returns 404."""
+        with TestClient(app) as client:
+            response = client.get("/runs/does-not-exist", headers=AUTH)
+        assert response.status_code == 404
+
+    def test_runs_require_auth(self):
+        """Test the job API is behind the bearer token."""
+        with TestClient(app) as client:
+            response = client.post("/runs", json={"task": "build"})
+        assert response.status_code == 401
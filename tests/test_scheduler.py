@@ -0,0 +1,134 @@
+"""
+Tests for the fair priority scheduler.
+"""
+
+import asyncio
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src import server
+from src.scheduler import FairScheduler, QueueFull
+
+AUTH = {"Authorization": "Bearer test-token"}
+
+
+async def _drain(scheduler, tickets, order):
+    """Run each ticket to completion, recording the order slots are granted."""
+
+    async def _one(name, ticket):
+        async with scheduler.run(ticket):
+            order.append(name)
+            await asyncio.sleep(0)
+
+    await asyncio.gather(*(_one(name, ticket) for name, ticket in tickets))
+
+
+class TestFairScheduler:
+    """Test queueing order, caps and cancellation."""
+
+    @pytest.mark.asyncio
+    async def test_round_robin_across_clients(self):
+        """Test a client with many queued runs can't starve another client."""
+        scheduler = FairScheduler(concurrency=1)
+        blocker = scheduler.submit("busy", "normal")
+        tickets = [(f"busy-{i}", scheduler.submit("busy")) for i in range(3)]
+        tickets.append(("quiet-0", scheduler.submit("quiet")))
+
+        order = []
+        async with scheduler.run(blocker):
+            pass
+        await _drain(scheduler, tickets, order)
+
+        assert order[:2] == ["busy-0", "quiet-0"]
+
+    @pytest.mark.asyncio
+    async def test_higher_priority_first(self):
+        """Test high-priority runs are granted before normal and low ones."""
+        scheduler = FairScheduler(concurrency=1)
+        blocker = scheduler.submit("a")
+        tickets = [
+            ("low", scheduler.submit("a", "low")),
+            ("normal", scheduler.submit("b", "normal")),
+            ("high", scheduler.submit("c", "high")),
+        ]
+
+        order = []
+        async with scheduler.run(blocker):
+            pass
+        await _drain(scheduler, tickets, order)
+
+        assert order == ["high", "normal", "low"]
+
+    @pytest.mark.asyncio
+    async def test_queue_depth_cap(self):
+        """Test submissions beyond the queue depth are rejected with Retry-After."""
+        scheduler = FairScheduler(concurrency=1, max_queue_depth=1)
+        scheduler.submit("a")
+        scheduler.submit("b")
+
+        with pytest.raises(QueueFull) as exc:
+            scheduler.submit("c")
+        assert exc.value.retry_after >= 1
+        assert scheduler.stats()["rejected"] == 1
+
+    @pytest.mark.asyncio
+    async def test_per_client_cap(self):
+        """Test one client can't fill the whole queue."""
+        scheduler = FairScheduler(concurrency=1, max_queued_per_client=1)
+        scheduler.submit("a")
+        scheduler.submit("a")
+
+        with pytest.raises(QueueFull):
+            scheduler.submit("a")
+        scheduler.submit("b")
+
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_leaves_queue(self):
+        """Test cancelling a queued run frees its place and keeps counts right."""
+        scheduler = FairScheduler(concurrency=1)
+        blocker = scheduler.submit("a")
+        waiter = asyncio.create_task(scheduler.slot("b").__aenter__())
+        await asyncio.sleep(0)
+        assert scheduler.stats()["queued"] == 1
+
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        async with scheduler.run(blocker):
+            pass
+
+        stats = scheduler.stats()
+        assert stats["queued"] == 0
+        assert stats["active"] == 0
+
+
+class TestSchedulerEndpoints:
+    """Test scheduler integration with the HTTP API."""
+
+    @patch("src.server.run_browser_agent_async")
+    def test_queue_wait_reported_in_debug(self, mock_agent):
+        """Test queue wait and execution time are reported separately."""
+        mock_agent.return_value = {"ok": True, "result_text": "done"}
+
+        with TestClient(server.app) as client:
+            response = client.post(
+                "/tools/run_browser_agent", json={"task": "build"}, headers=AUTH
+            )
+
+        debug = response.json()["debug"]
+        assert "queue_wait_sec" in debug
+        assert "execution_sec" in debug
+
+    def test_queue_full_returns_429(self, monkeypatch):
+        """Test a full queue answers 429 with Retry-After."""
+        busy = FairScheduler(concurrency=1, max_queue_depth=0)
+        busy._active = 1
+        monkeypatch.setattr(server, "scheduler", busy)
+
+        with TestClient(server.app) as client:
+            response = client.post("/runs", json={"task": "build"}, headers=AUTH)
+
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) >= 1
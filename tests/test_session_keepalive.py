@@ -0,0 +1,150 @@
+"""
+Tests for the background session keep-alive.
+"""
+
+import asyncio
+import json
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from src.accounts import Account, AccountPool
+from src.auth_state import AuthStateStore
+from src.browser_pool import BrowserPool, PooledBrowser
+from src.session_keepalive import SessionKeepAlive, create_session_keepalives, keepalive_stats
+from src.settings import reload_settings
+
+
+def _state(value, expires):
+    return {
+        "cookies": [
+            {
+                "name": "lovable-session-id.id",
+                "domain": ".lovable.dev",
+                "value": value,
+                "expires": expires,
+            }
+        ],
+        "origins": [],
+    }
+
+
+def _setup(tmp_path, captured, url="https://lovable.dev/dashboard", stored=None):
+    path = tmp_path / "auth.json"
+    path.write_text(json.dumps(stored or _state("old", time.time() + 600)))
+    store = AuthStateStore(str(path))
+    store.reload()
+
+    pool = BrowserPool(size=1, health_interval_sec=3600)
+    pool._close = AsyncMock()
+    pool.is_healthy = AsyncMock(return_value=True)
+    store.subscribe(pool.set_storage_state)
+    page = MagicMock()
+    page.goto = AsyncMock()
+    page.url = url
+    context = MagicMock()
+    context.pages = [page]
+    context.clear_cookies = AsyncMock()
+    context.add_cookies = AsyncMock()
+    context.storage_state = AsyncMock(return_value=captured)
+    pool._idle.put_nowait(
+        PooledBrowser(browser_id=1, port=9001, user_data_dir="/tmp/x", context=context)
+    )
+    return path, store, pool
+
+
+@pytest.fixture(autouse=True)
+def _no_settle():
+    with patch("src.session_keepalive.wait_for_page_settled", new_callable=AsyncMock):
+        yield
+
+
+class TestSessionKeepAlive:
+    """Test refreshed sessions are persisted and everything else is left alone."""
+
+    @pytest.mark.asyncio
+    async def test_refreshed_session_is_persisted(self, tmp_path):
+        """Test a longer-lived session is written to disk, swapped in and kept on the browser."""
+        refreshed = _state("new", time.time() + 86400)
+        path, store, pool = _setup(tmp_path, refreshed)
+        keepalive = SessionKeepAlive(store, pool)
+
+        assert await keepalive.refresh() == "refreshed"
+        await asyncio.gather(*pool._background)
+
+        assert json.loads(path.read_text()) == refreshed
+        assert store.get() == refreshed
+        assert store.snapshot.version == 2
+        assert pool.storage_state == refreshed
+        assert pool.stats()["recycles"] == 0
+        assert pool.stats()["idle"] == 1
+
+    @pytest.mark.asyncio
+    async def test_unchanged_session_is_not_written(self, tmp_path):
+        """Test nothing is saved when the session cookies didn't change."""
+        stored = _state("same", time.time() + 600)
+        _, store, pool = _setup(tmp_path, stored, stored=stored)
+        keepalive = SessionKeepAlive(store, pool)
+
+        with patch.object(store, "save") as mock_save:
+            assert await keepalive.refresh() == "unchanged"
+        mock_save.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_logged_out_context_is_not_saved(self, tmp_path):
+        """Test a redirect to login never overwrites the stored session."""
+        path, store, pool = _setup(
+            tmp_path, {"cookies": [], "origins": []}, url="https://lovable.dev/login"
+        )
+        before = path.read_text()
+        keepalive = SessionKeepAlive(store, pool)
+
+        assert await keepalive.refresh() == "logged_out"
+        assert path.read_text() == before
+
+    @pytest.mark.asyncio
+    async def test_busy_pool_is_skipped(self, tmp_path):
+        """Test the keep-alive doesn't wait for a browser that runs need."""
+        _, store, pool = _setup(tmp_path, None)
+        pool._idle.get_nowait()
+        keepalive = SessionKeepAlive(store, pool)
+
+        assert await asyncio.wait_for(keepalive.refresh(), timeout=1) == "busy"
+
+    @pytest.mark.asyncio
+    async def test_account_session_is_refreshed_on_its_own_browser(self, tmp_path):
+        """Test an account's keep-alive checks out a browser bound to that account's store."""
+        refreshed = _state("new", time.time() + 86400)
+        path, store, pool = _setup(tmp_path, refreshed)
+        browser = pool._idle.get_nowait()
+        browser.auth_key = store.path
+        browser.state_generation = store.snapshot.version
+        pool._idle.put_nowait(browser)
+        keepalive = SessionKeepAlive(store, pool, account="alpha")
+
+        assert await keepalive.refresh() == "refreshed"
+        await asyncio.gather(*pool._background)
+
+        assert json.loads(path.read_text()) == refreshed
+        assert browser.state_generation == store.snapshot.version
+        assert pool.stats()["recycles"] == 0
+
+    def test_one_keepalive_per_account(self, tmp_path, monkeypatch):
+        """Test multi-account mode refreshes every account, spread over the interval."""
+        monkeypatch.setenv("MCP_AUTH_KEEPALIVE_SEC", "600")
+        reload_settings()
+        _, store, pool = _setup(tmp_path, None)
+        accounts = AccountPool(
+            [
+                Account(name=name, store=AuthStateStore(str(tmp_path / f"{name}.json")))
+                for name in ("alpha", "beta")
+            ]
+        )
+
+        keepalives = create_session_keepalives(store, pool, accounts)
+
+        assert [(k.account, k.offset_sec) for k in keepalives] == [("alpha", 0), ("beta", 300)]
+        assert keepalives[1].store is accounts.accounts[1].store
+        assert set(keepalive_stats(keepalives)["accounts"]) == {"alpha", "beta"}
+        assert create_session_keepalives(store, None, accounts) == []
@@ -0,0 +1,138 @@
+"""
+Tests for the settings snapshot and its hot reload.
+"""
+
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+from pydantic import ValidationError
+
+from src import server
+from src.lovable_adapter.settle import settle_max_ms
+from src.scheduler import FairScheduler
+from src.settings import get_settings, reload_settings
+
+AUTH = {"Authorization": "Bearer test-token"}
+
+
+class TestSettingsReload:
+    """Test snapshots are validated before they replace the current one."""
+
+    def test_reload_swaps_snapshot(self, monkeypatch):
+        """Test a reload picks up new environment values."""
+        before = get_settings()
+        monkeypatch.setenv("MCP_AGENT_TIMEOUT_SEC", "42")
+
+        after = reload_settings()
+
+        assert after is get_settings()
+        assert after is not before
+        assert after.agent_timeout_sec == 42
+
+    def test_invalid_value_keeps_current_snapshot(self, monkeypatch):
+        """Test a bad value raises and never replaces the working settings."""
+        before = get_settings()
+        monkeypatch.setenv("MCP_AGENT_CONCURRENCY", "0")
+
+        with pytest.raises(ValidationError):
+            reload_settings()
+
+        assert get_settings() is before
+
+    def test_runtime_settings_follow_reload(self, monkeypatch):
+        """Test per-step reads and the gateway's caches and retry budget pick up a reload."""
+        monkeypatch.setenv("MCP_PAGE_SETTLE_MAX_MS", "1234")
+        monkeypatch.setenv("MCP_RETRY_BUDGET_RATIO", "0.5")
+        monkeypatch.setenv("MCP_COALESCE_TTL_SEC", "7")
+        monkeypatch.setenv("MCP_RUN_TTL_SEC", "9")
+
+        reload_settings()
+
+        assert settle_max_ms() == 1234
+        assert server.retry_budget.ratio == 0.5
+        assert server.coalescer.ttl_sec == 7
+        assert server.run_store.ttl_sec == 9
+
+    @pytest.mark.parametrize(
+        "name,value",
+        [
+            ("MCP_PAGE_SETTLE_MAX_MS", "-1"),
+            ("MCP_NETWORK_BLOCK_PROFILE", "everything"),
+            ("MCP_ACCOUNT_MAX_CONCURRENCY", "0"),
+            ("MCP_MACROS_ENABLED", "sometimes"),
+        ],
+    )
+    def test_runtime_settings_are_validated(self, monkeypatch, name, value):
+        """Test values that used to be converted ad hoc are rejected up front."""
+        monkeypatch.setenv(name, value)
+
+        with pytest.raises(ValidationError):
+            reload_settings()
+
+
+class TestSchedulerResize:
+    """Test the scheduler follows concurrency changes in place."""
+
+    @pytest.mark.asyncio
+    async def test_growing_admits_waiting_runs(self):
+        """Test a waiting run starts as soon as the limit is raised."""
+        scheduler = FairScheduler(concurrency=1)
+        scheduler.submit("a")
+        waiting = scheduler.submit("b")
+        assert not waiting.future.done()
+
+        scheduler.resize(2)
+
+        assert waiting.future.done()
+        assert scheduler.stats()["active"] == 2
+
+    @pytest.mark.asyncio
+    async def test_shrinking_lets_active_runs_finish(self):
+        """Test active runs keep their slots and new ones wait for the lower limit."""
+        scheduler = FairScheduler(concurrency=2)
+        first, second = scheduler.submit("a"), scheduler.submit("b")
+        scheduler.resize(1)
+        third = scheduler.submit("c")
+
+        async with scheduler.run(first):
+            pass
+        assert not third.future.done()
+        async with scheduler.run(second):
+            pass
+        await asyncio.wait_for(third.future, timeout=1)
+
+
+class TestReloadEndpoint:
+    """Test POST /admin/reload-settings."""
+
+    def test_reload_resizes_scheduler(self, monkeypatch):
+        """Test a valid reload is applied to the live scheduler and reported."""
+        monkeypatch.setattr(server, "scheduler", FairScheduler(concurrency=3))
+        monkeypatch.setenv("MCP_AGENT_CONCURRENCY", "5")
+
+        with TestClient(server.app) as client:
+            response = client.post("/admin/reload-settings", headers=AUTH)
+            health = client.get("/health").json()
+
+        assert response.status_code == 200
+        assert "agent_concurrency" in response.json()["changed"]
+        assert server.scheduler.concurrency == 5
+        assert health["concurrency"] == 5
+
+    def test_invalid_reload_is_rejected(self, monkeypatch):
+        """Test a bad value returns 422 and leaves the running settings alone."""
+        before = get_settings()
+        monkeypatch.setenv("MCP_RATE_LIMIT_PER_MIN", "not-a-number")
+
+        with TestClient(server.app) as client:
+            response = client.post("/admin/reload-settings", headers=AUTH)
+
+        assert response.status_code == 422
+        assert response.json()["fields"] == ["rate_limit_per_min"]
+        assert get_settings() is before
+
+    def test_requires_bearer_token(self):
+        """Test the reload endpoint is behind the gateway's bearer auth."""
+        with TestClient(server.app) as client:
+            assert client.post("/admin/reload-settings").status_code == 401
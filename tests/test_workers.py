@@ -0,0 +1,220 @@
+"""
+Tests for out-of-process browser workers.
+
+The workers are real spawned processes running a stand-in for the agent runner.
+"""
+
+import asyncio
+import os
+import time
+
+import pytest
+
+from src.accounts import Account, AccountPool, set_account_pool
+from src.auth_state import AuthStateStore
+from src.errors import retry_budget
+from src.events import emit_run_event, run_event_sink
+from src.metrics import agent_retries_total
+from src.run_config import RunConfig
+from src.settings import Settings
+from src.workers import WorkerPool
+
+
+async def _fake_runner(task, context, config):
+    """Runs in the worker process."""
+    if task == "crash":
+        os._exit(1)
+    if task == "hang":
+        await asyncio.sleep(60)
+    if task == "slow":
+        started = time.time()
+        await asyncio.sleep(0.5)
+        return {"ok": True, "account": config.account, "span": (started, time.time())}
+    if task == "fail":
+        return {"ok": False, "error": "rate limited", "error_code": "NETWORK_ERROR"}
+    if task == "retry":
+        retry_budget.record_attempt()
+        agent_retries_total.inc()
+        return {"ok": True, "allowed": [await retry_budget.spend() for _ in range(2)]}
+    emit_run_event("step", {"task": task})
+    return {"ok": True, "result_text": f"{task} by {config.llm_model_name}", "pid": os.getpid()}
+
+
+@pytest.fixture
+async def make_pool():
+    pools = []
+
+    async def make(**kwargs):
+        pool = WorkerPool(runner=_fake_runner, restart_delay_sec=0, **kwargs)
+        await pool.start()
+        pools.append(pool)
+        return pool
+
+    yield make
+    for pool in pools:
+        await pool.stop(timeout_sec=5)
+
+
+class TestWorkerDispatch:
+    """Test runs execute in worker processes and report back."""
+
+    @pytest.mark.asyncio
+    async def test_run_executes_out_of_process(self, make_pool):
+        """Test the result comes from another process and events reach the run's sink."""
+        pool = await make_pool(size=1)
+        events = []
+        run_event_sink.set(lambda event, data: events.append((event, data)))
+
+        result = await asyncio.wait_for(
+            pool.run("rename", config=RunConfig(llm_model_name="m")), timeout=30
+        )
+
+        assert result["result_text"] == "rename by m"
+        assert result["pid"] != os.getpid()
+        assert events == [("step", {"task": "rename"})]
+
+    @pytest.mark.asyncio
+    async def test_runs_spread_over_workers(self, make_pool):
+        """Test concurrent runs go to the least-loaded worker."""
+        pool = await make_pool(size=2)
+        config = RunConfig()
+
+        results = await asyncio.wait_for(
+            asyncio.gather(pool.run("a", config=config), pool.run("b", config=config)), timeout=30
+        )
+
+        assert len({r["pid"] for r in results}) == 2
+
+    @pytest.mark.asyncio
+    async def test_cancel_reaches_worker(self, make_pool):
+        """Test cancelling the caller cancels the run in the worker and frees it."""
+        pool = await make_pool(size=1)
+        hang = asyncio.ensure_future(pool.run("hang", config=RunConfig()))
+        await asyncio.sleep(0.2)
+        hang.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await hang
+
+        assert pool.stats()["in_flight"] == 0
+        result = await asyncio.wait_for(pool.run("after", config=RunConfig()), timeout=30)
+        assert result["ok"]
+
+
+class TestWorkerAccounts:
+    """Test account caps and quarantine are enforced by the gateway across workers."""
+
+    @pytest.fixture
+    def account(self, tmp_path):
+        path = tmp_path / "solo.json"
+        path.write_text('{"cookies": [], "origins": []}')
+        account = Account(name="solo", store=AuthStateStore(str(path)), max_concurrency=1)
+        set_account_pool(AccountPool([account], quarantine_after=1, quarantine_sec=60))
+        yield account
+        set_account_pool(None)
+
+    @pytest.mark.asyncio
+    async def test_account_cap_holds_across_workers(self, make_pool, account):
+        """Test two workers never run the same capped account at once."""
+        pool = await make_pool(size=2)
+
+        results = await asyncio.wait_for(
+            asyncio.gather(*(pool.run("slow", config=RunConfig()) for _ in range(2))), timeout=30
+        )
+
+        assert [r["account"] for r in results] == ["solo", "solo"]
+        first, second = sorted(r["span"] for r in results)
+        assert second[0] >= first[1]
+        assert account.runs == 2
+        assert account.in_flight == 0
+
+    @pytest.mark.asyncio
+    async def test_worker_failures_quarantine_in_gateway(self, make_pool, account):
+        """Test an account-level failure in a worker quarantines the gateway's account."""
+        pool = await make_pool(size=2)
+
+        result = await asyncio.wait_for(pool.run("fail", config=RunConfig()), timeout=30)
+
+        assert result["debug"]["account"] == "solo"
+        assert account.quarantined(time.time())
+
+
+class TestWorkerReports:
+    """Test worker metrics, memory and retry budget reach the gateway."""
+
+    @pytest.mark.asyncio
+    async def test_metrics_and_retry_budget_go_through_gateway(self, make_pool, monkeypatch):
+        """Test worker counters land in the gateway registry and its budget decides retries."""
+        monkeypatch.setattr(retry_budget, "min_retries", 1)
+        monkeypatch.setattr(retry_budget, "ratio", 0)
+        before = retry_budget.stats()["attempts_in_window"]
+        retries = agent_retries_total.value()
+        pool = await make_pool(size=1)
+
+        result = await asyncio.wait_for(pool.run("retry", config=RunConfig()), timeout=30)
+
+        assert result["allowed"][1] is False
+        assert retry_budget.stats()["attempts_in_window"] == before + 1
+        assert agent_retries_total.value() == retries + 1
+
+    @pytest.mark.asyncio
+    async def test_memory_reported_during_a_run(self, make_pool):
+        """Test RSS is reported periodically, not only when a run finishes."""
+        pool = await make_pool(size=1, stats_interval_sec=0.1)
+        hang = asyncio.ensure_future(pool.run("hang", config=RunConfig()))
+        try:
+            for _ in range(300):
+                if pool.stats()["workers"][0]["rss_mb"] > 0:
+                    break
+                await asyncio.sleep(0.1)
+            assert pool.stats()["workers"][0]["rss_mb"] > 0
+            assert pool.stats()["in_flight"] == 1
+        finally:
+            hang.cancel()
+            await asyncio.gather(hang, return_exceptions=True)
+
+
+class TestWorkerRestarts:
+    """Test crashed and oversized workers are replaced."""
+
+    @pytest.mark.asyncio
+    async def test_crash_fails_run_and_restarts(self, make_pool):
+        """Test a dead worker fails its run and a new one takes the next."""
+        pool = await make_pool(size=1)
+
+        crashed = await asyncio.wait_for(pool.run("crash", config=RunConfig()), timeout=30)
+        result = await asyncio.wait_for(pool.run("next", config=RunConfig()), timeout=30)
+
+        assert crashed["ok"] is False
+        assert crashed["error_code"] == "UNKNOWN_ERROR"
+        assert result["ok"]
+        assert pool.stats()["crashes"] == 1
+
+    @pytest.mark.asyncio
+    async def test_worker_replaced_after_max_jobs(self, make_pool):
+        """Test a worker at its run quota is replaced without failing runs."""
+        pool = await make_pool(size=1, max_jobs=1)
+
+        first = await asyncio.wait_for(pool.run("one", config=RunConfig()), timeout=30)
+        second = await asyncio.wait_for(pool.run("two", config=RunConfig()), timeout=30)
+
+        assert first["pid"] != second["pid"]
+        stats = pool.stats()
+        assert stats["retirements"] == 2
+        assert stats["crashes"] == 0
+
+    @pytest.mark.asyncio
+    async def test_settings_reload_replaces_workers(self, make_pool):
+        """Test a reload adopts the new limits and sends later runs to fresh workers."""
+        pool = await make_pool(size=1)
+        before = await asyncio.wait_for(pool.run("one", config=RunConfig()), timeout=30)
+
+        pool.reload(Settings(worker_processes=2, worker_max_jobs=10))
+        results = await asyncio.wait_for(
+            asyncio.gather(pool.run("a", config=RunConfig()), pool.run("b", config=RunConfig())),
+            timeout=30,
+        )
+
+        assert before["pid"] not in {r["pid"] for r in results}
+        assert len({r["pid"] for r in results}) == 2
+        assert pool.size == 2
+        assert pool.max_jobs == 10